@@ -1,5 +1,6 @@
 from typing import Dict, List
 import anthropic
+import httpx
 import logging
 from extractors.base_extractor import BaseExtractor
 from extractors.invoice_extractor import InvoiceExtractor  
@@ -7,14 +8,41 @@ from extractors.concert_extractor import ConcertExtractor
 
 logger = logging.getLogger(__name__)
 
+# Connections kept open for concurrent Claude requests shared by all extractors
+DEFAULT_CLAUDE_MAX_CONNECTIONS = 20
+
+# Claude request timeout, with a shorter limit for establishing the connection
+CLAUDE_TIMEOUT = httpx.Timeout(120.0, connect=5.0)
+
 class EmailProcessor:
     """Processes emails through multiple specialized extractors"""
     
     def __init__(self, config: Dict, claude_api_key: str):
         self.config = config
-        self.claude = anthropic.Anthropic(api_key=claude_api_key)
+        # One client per mode for the whole process: every extractor reuses their connection pools
+        self.claude = anthropic.Anthropic(
+            api_key=claude_api_key,
+            http_client=self._create_http_client()
+        )
+        self.async_claude = anthropic.AsyncAnthropic(
+            api_key=claude_api_key,
+            http_client=self._create_async_http_client()
+        )
         self.extractors = self._initialize_extractors()
         
+    def _get_connection_limits(self) -> httpx.Limits:
+        """Connection pool limits from config 'claude.max_connections'"""
+        max_connections = self.config.get('claude', {}).get('max_connections', DEFAULT_CLAUDE_MAX_CONNECTIONS)
+        return httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections)
+    
+    def _create_http_client(self) -> httpx.Client:
+        """Create the keep-alive connection pool for synchronous Claude requests"""
+        return httpx.Client(limits=self._get_connection_limits(), timeout=CLAUDE_TIMEOUT)
+        
+    def _create_async_http_client(self) -> httpx.AsyncClient:
+        """Create one HTTP/2 connection pool so concurrent requests share TLS sessions"""
+        return httpx.AsyncClient(http2=True, limits=self._get_connection_limits(), timeout=CLAUDE_TIMEOUT)
+        
     def _initialize_extractors(self) -> List[BaseExtractor]:
         """Initialize all enabled extractors from config"""
         extractors = []
@@ -26,7 +54,11 @@ class EmailProcessor:
             invoice_config = extractors_config['invoices']
             # Add model config to extractor config
             invoice_config['claude_model'] = self.config.get('claude', {}).get('model', 'claude-3-5-sonnet-20241022')
-            extractors.append(InvoiceExtractor(invoice_config, self.claude))
+            invoice_config['rate_limits'] = self.config.get('claude', {}).get('rate_limits')
+            invoice_config['response_cache'] = self.config.get('claude', {}).get('response_cache')
+            invoice_config['prompt_caching'] = self.config.get('claude', {}).get('prompt_caching', False)
+            invoice_config['prompt_cache_ttl'] = self.config.get('claude', {}).get('prompt_cache_ttl')
+            extractors.append(InvoiceExtractor(invoice_config, self.claude, self.async_claude))
             logger.info("✓ Invoice extractor initialized")
             
         # Initialize concert extractor if enabled  
@@ -34,7 +66,11 @@ class EmailProcessor:
             concert_config = extractors_config['concerts']
             # Add model config to extractor config
             concert_config['claude_model'] = self.config.get('claude', {}).get('model', 'claude-3-5-sonnet-20241022')
-            extractors.append(ConcertExtractor(concert_config, self.claude))
+            concert_config['rate_limits'] = self.config.get('claude', {}).get('rate_limits')
+            concert_config['response_cache'] = self.config.get('claude', {}).get('response_cache')
+            concert_config['prompt_caching'] = self.config.get('claude', {}).get('prompt_caching', False)
+            concert_config['prompt_cache_ttl'] = self.config.get('claude', {}).get('prompt_cache_ttl')
+            extractors.append(ConcertExtractor(concert_config, self.claude, self.async_claude))
             logger.info("✓ Concert extractor initialized")
             
         logger.info(f"Initialized {len(extractors)} extractors")
@@ -53,12 +89,14 @@ class EmailProcessor:
         
         sender = email_metadata.get('sender', '')
         subject = email_metadata.get('subject', '')
+        # Lowercase the body once for every extractor's keyword checks
+        content_lower = email_content.lower()
         
         logger.debug(f"Processing email: {subject[:50]}...")
         
         for extractor in self.extractors:
             try:
-                if extractor.should_process(email_content, sender, subject):
+                if extractor.should_process_cached(email_content, sender, subject, content_lower=content_lower):
                     logger.debug(f"Running {extractor.name} extractor on email")
                     extracted_items = extractor.extract(email_content, email_metadata)
                     if extracted_items:
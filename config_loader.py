@@ -0,0 +1,17 @@
+"""YAML config loading shared by the command-line entry points"""
+
+import yaml
+
+# libyaml's C loader and dumper when PyYAML was built with them
+try:
+    YAML_LOADER = yaml.CSafeLoader
+    YAML_DUMPER = yaml.CSafeDumper
+except AttributeError:
+    YAML_LOADER = yaml.SafeLoader
+    YAML_DUMPER = yaml.SafeDumper
+
+
+def load_yaml_config(config_path: str) -> dict:
+    """Load a YAML config file"""
+    with open(config_path, "r") as f:
+        return yaml.load(f, Loader=YAML_LOADER)
@@ -171,9 +171,7 @@ class CSVExporter:
         self.ensure_output_directory(output_file)
         
         # Get all unique keys across all items for CSV headers
-        all_keys = set()
-        for item in data_items:
-            all_keys.update(item.keys())
+        all_keys = set().union(*data_items)
         
         # Define column order for better readability
         if extractor_name == 'invoices':
@@ -204,16 +202,15 @@ class CSVExporter:
             mode = 'a' if file_exists else 'w'
             
             with open(output_file, mode, newline='', encoding='utf-8-sig') as csvfile:
-                writer = csv.DictWriter(csvfile, fieldnames=headers)
+                # Missing fields are written as empty strings
+                writer = csv.DictWriter(csvfile, fieldnames=headers, restval='')
                 
                 # Only write header if file is new
                 if not file_exists:
                     writer.writeheader()
                 
-                for item in data_items:
-                    # Ensure all fields are present, fill with empty string if missing
-                    row = {key: item.get(key, '') for key in headers}
-                    writer.writerow(row)
+                # Records go straight to the writer in one call; no per-row copies
+                writer.writerows(data_items)
             
             action = "Appended" if file_exists else "Exported"
             logger.info(f"✓ {action} {len(data_items)} {extractor_name} items to {output_file}")
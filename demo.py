@@ -1,5 +1,5 @@
 import argparse
-import yaml
+import asyncio
 import os
 import logging
 from typing import Optional
@@ -7,6 +7,7 @@ from dotenv import load_dotenv
 from agents.email_processor import EmailProcessor
 from gmail_server import GmailServer
 from csv_exporter import CSVExporter
+from config_loader import load_yaml_config
 
 logger = logging.getLogger(__name__)
 
@@ -47,8 +48,7 @@ def main():
     
     # Load configuration
     try:
-        with open(args.config, 'r') as f:
-            config = yaml.safe_load(f)
+        config = load_yaml_config(args.config)
     except FileNotFoundError:
         logger.error(f"Config file not found: {args.config}")
         return 1
@@ -183,6 +183,26 @@ def main():
         traceback.print_exc()
         return 1
 
+async def extract_email_batches(email_processor, email_batches):
+    """Run each extractor over its (email_content, email_metadata) batch concurrently"""
+    async def run_extractor(extractor_name, email_batch):
+        # Process with specific extractor only, overlapping the Claude calls
+        extractor = email_processor.get_extractor_by_name(extractor_name)
+        if not extractor or not email_batch:
+            return []
+        try:
+            return await extractor.extract_batch(email_batch)
+        except Exception as e:
+            logger.error(f"Error processing {extractor_name} emails: {e}")
+            return []
+    
+    extractor_names = list(email_batches)
+    results = await asyncio.gather(*[
+        run_extractor(extractor_name, email_batches[extractor_name])
+        for extractor_name in extractor_names
+    ])
+    return dict(zip(extractor_names, results))
+
 def run_gmail_extraction(email_processor, gmail_server, csv_exporter, config):
     """Run extraction from Gmail - each extractor runs its own search"""
     days_back = config['processing']['default_days_back']
@@ -205,23 +225,28 @@ def run_gmail_extraction(email_processor, gmail_server, csv_exporter, config):
         logger.debug(f"{extractor_name} keywords: {search_keywords[:5]}...")  # Show first 5
         
         # Fetch emails for this specific extractor
-        emails = gmail_server.fetch_emails_for_extractors(search_keywords, search_filters, days_back)
+        # With metadata_prefilter enabled, emails ruled out by sender/subject are never downloaded in full
+        emails = gmail_server.fetch_emails_for_extractors(
+            search_keywords, search_filters, days_back, metadata_filter=extractor.get_metadata_filter(),
+            exclusions=extractor.get_search_exclusions()
+        )
         all_emails[extractor_name] = emails
         logger.info(f"📧 Found {len(emails)} {extractor_name} emails")
     
-    # Process emails for each extractor separately  
+    # Fetch email contents for each extractor separately
+    email_batches = {}
     for extractor_name, emails in all_emails.items():
         if not emails:
             logger.info(f"No {extractor_name} emails to process")
             continue
             
         logger.info(f"🔄 Processing {len(emails)} {extractor_name} emails...")
-        extractor_results = []
-        processed_count = 0
+        email_batch = []
         
         for email in emails:
             try:
-                email_content = gmail_server.get_email_content(email['id'])
+                # The search already fetched each full message; build the content from it instead of fetching again
+                email_content = gmail_server.format_email_content(email)
                 email_metadata = {
                     'date': email.get('date', ''),
                     'sender': email.get('sender', ''),
@@ -234,22 +259,22 @@ def run_gmail_extraction(email_processor, gmail_server, csv_exporter, config):
                     'pdf_text_length': email.get('pdf_text_length', 0),
                     'pdf_processing_error': email.get('pdf_processing_error', '')
                 }
+                email_batch.append((email_content, email_metadata))
                 
-                # Process with specific extractor only
-                extractor = email_processor.get_extractor_by_name(extractor_name)
-                if extractor:
-                    results = extractor.extract(email_content, email_metadata)
-                    extractor_results.extend(results)
-                
-                processed_count += 1
-                if processed_count % 10 == 0:
-                    logger.info(f"Processed {processed_count}/{len(emails)} {extractor_name} emails...")
+                if len(email_batch) % 10 == 0:
+                    logger.info(f"Fetched {len(email_batch)}/{len(emails)} {extractor_name} emails...")
                     
             except Exception as e:
                 logger.error(f"Error processing {extractor_name} email {email['id']}: {e}")
                 continue
         
-        # Store results for this extractor
+        email_batches[extractor_name] = email_batch
+    
+    # Run every extractor's batch on one event loop so they share the async Claude connection pool
+    batch_results = asyncio.run(extract_email_batches(email_processor, email_batches))
+    
+    # Store results for each extractor
+    for extractor_name, extractor_results in batch_results.items():
         if extractor_results:
             all_results[extractor_name] = extractor_results
             logger.info(f"✅ {extractor_name}: {len(extractor_results)} items extracted")
@@ -11,7 +11,7 @@ from atomic_agents.agents.atomic_agent import AtomicAgent, AgentConfig
 from atomic_agents.base.base_io_schema import BaseIOSchema
 from atomic_agents.context.system_prompt_generator import SystemPromptGenerator, BaseDynamicContextProvider
 
-from models.zero_inbox_models import DatabaseManager, Email, AgentAction
+from models.zero_inbox_models import DatabaseManager, Email
 from llm_client_factory import LLMClientFactory
 
 logger = logging.getLogger(__name__)
@@ -601,31 +601,26 @@ class EmailActionOrchestrator:
             logger.error(f"Failed to execute action for {category}/{subcategory}: {e}")
             return None
     
-    def store_action_result(self, action_result: Dict[str, Any]) -> bool:
-        """Store action result in database"""
+    def store_action_results(self, action_results: List[Dict[str, Any]]) -> int:
+        """Store a batch of action results in one multi-row insert; returns how many were stored"""
         try:
-            session = self.db_manager.get_session()
-            
-            action_record = AgentAction(
-                email_id=action_result["email_id"],
-                category=action_result["action_type"].split("/")[0],
-                subcategory=action_result["action_type"].split("/")[1],
-                action_performed=f"Action executed for {action_result['action_type']}",
-                action_result=str(action_result["action_result"]),
-                agent_name="EmailActionOrchestrator",
-                success=True
-            )
-            
-            session.add(action_record)
-            session.commit()
-            session.close()
-            
-            logger.debug(f"✅ Stored action result for email {action_result['email_id']}")
-            return True
+            action_rows = [
+                {
+                    "email_id": action_result["email_id"],
+                    "category": action_result["action_type"].split("/")[0],
+                    "subcategory": action_result["action_type"].split("/")[1],
+                    "action_performed": f"Action executed for {action_result['action_type']}",
+                    "action_result": str(action_result["action_result"]),
+                    "agent_name": "EmailActionOrchestrator",
+                    "success": True,
+                }
+                for action_result in action_results
+            ]
+            stored_count = self.db_manager.bulk_insert_actions(action_rows)
+            
+            logger.debug(f"✅ Stored {stored_count} action results")
+            return stored_count
             
         except Exception as e:
-            logger.error(f"Failed to store action result: {e}")
-            if 'session' in locals():
-                session.rollback()
-                session.close()
-            return False
\ No newline at end of file
+            logger.error(f"Failed to store action results: {e}")
+            return 0
\ No newline at end of file
@@ -7,6 +7,7 @@ import logging
 from typing import Dict, List, Optional, Any
 from datetime import datetime
 from pydantic import Field
+from sqlalchemy.orm import undefer_group
 
 from atomic_agents.agents.atomic_agent import AtomicAgent, AgentConfig
 from atomic_agents.base.base_io_schema import BaseIOSchema
@@ -313,43 +314,44 @@ class EmailCategorizationAgent:
         Returns:
             Number of results successfully stored
         """
-        stored_count = 0
-        
         try:
             session = self.db_manager.get_session()
             
+            # Emails that already have a categorization, found with one query for the whole batch
+            email_ids = {result.get('email_id') for result in results}
+            categorized_ids = {
+                email_id for (email_id,) in session.query(EmailCategory.email_id).filter(
+                    EmailCategory.email_id.in_(email_ids)
+                )
+            }
+            session.close()
+            
+            category_rows = []
             for result in results:
                 try:
                     # Check if categorization already exists
-                    existing = session.query(EmailCategory).filter(
-                        EmailCategory.email_id == result['email_id']
-                    ).first()
-                    
-                    if existing:
+                    if result['email_id'] in categorized_ids:
                         logger.debug(f"Email {result['email_id']} already categorized, skipping")
                         continue
                     
                     # Create new categorization record
-                    category_record = EmailCategory(
-                        email_id=result['email_id'],
-                        category=result['category'],
-                        subcategory=result['subcategory'],
-                        category_description=f"Categorized as {result['category']}/{result['subcategory']}",
-                        agent_action=f"Email categorization with confidence {result['confidence']:.2f}",
-                        supporting_information=result['reasoning'],
-                        classification_confidence=result['confidence'],
-                        classified_by='EmailCategorizationAgent'
-                    )
-                    
-                    session.add(category_record)
-                    stored_count += 1
+                    category_rows.append({
+                        'email_id': result['email_id'],
+                        'category': result['category'],
+                        'subcategory': result['subcategory'],
+                        'category_description': f"Categorized as {result['category']}/{result['subcategory']}",
+                        'agent_action': f"Email categorization with confidence {result['confidence']:.2f}",
+                        'supporting_information': result['reasoning'],
+                        'classification_confidence': result['confidence'],
+                        'classified_by': 'EmailCategorizationAgent',
+                    })
+                    categorized_ids.add(result['email_id'])
                     
                 except Exception as e:
                     logger.error(f"Failed to store categorization for email {result.get('email_id')}: {e}")
                     continue
             
-            session.commit()
-            session.close()
+            stored_count = self.db_manager.bulk_insert_categories(category_rows)
             
             logger.info(f"✅ Stored {stored_count}/{len(results)} categorization results")
             return stored_count
@@ -357,7 +359,6 @@ class EmailCategorizationAgent:
         except Exception as e:
             logger.error(f"Failed to store categorization results: {e}")
             if 'session' in locals():
-                session.rollback()
                 session.close()
             return 0
     
@@ -377,7 +378,7 @@ class EmailCategorizationAgent:
             # Find emails without categories (excluding template records)
             uncategorized = session.query(Email).outerjoin(EmailCategory).filter(
                 EmailCategory.email_id == None
-            ).order_by(Email.date_received.desc()).limit(limit).all()
+            ).options(undefer_group('content')).order_by(Email.date_received.desc()).limit(limit).all()
             
             # Detach from session
             result = []
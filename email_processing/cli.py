@@ -6,9 +6,9 @@ sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 import argparse
 import time
-import yaml
 from datetime import datetime
 from dotenv import load_dotenv
+from config_loader import load_yaml_config
 from gmail_server import GmailServer
 from email_processing.database.db_manager import EmailDatabaseManager
 from email_processing.agents.categorization_agent import EmailCategorizationAgent
@@ -21,8 +21,7 @@ def load_config():
     """Load configuration from existing config file."""
     config_path = "config/config.yaml"
     if os.path.exists(config_path):
-        with open(config_path, 'r') as f:
-            return yaml.safe_load(f)
+        return load_yaml_config(config_path)
     return {}
 
 
@@ -0,0 +1,89 @@
+import atexit
+import logging
+import queue
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# Most queued entries combined into a single write
+MAX_WRITE_BATCH = 256
+
+# Longest time written entries wait in the file buffer before being flushed; a full buffer
+# is written out by the file itself, and close() flushes the rest
+FLUSH_INTERVAL_SECONDS = 5.0
+
+# Queue marker telling the writer thread to finish
+_STOP = object()
+
+
+class BackupWriter:
+    """Appends email backup entries to a file from a background thread so extraction never waits on disk I/O"""
+
+    def __init__(self, path: str, buffer_size: int):
+        self.path = path
+        self._file = open(path, 'ab', buffering=buffer_size)
+        self._queue: queue.SimpleQueue = queue.SimpleQueue()
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name='email-backup-writer', daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def write(self, payload: bytes):
+        """Queue bytes to append to the backup file"""
+        if self._closed:
+            raise ValueError(f"Backup writer for {self.path} is closed")
+        self._queue.put(payload)
+
+    def close(self):
+        """Write everything still queued, then close the file"""
+        if self._closed:
+            return
+        self._closed = True
+        self._queue.put(_STOP)
+        self._thread.join()
+        self._file.close()
+
+    def _run(self):
+        """Drain the queue, writing whatever has accumulated as one batch"""
+        # When the oldest entry not yet flushed was written, or None when the file is current
+        unflushed_since = None
+        while True:
+            timeout = None
+            if unflushed_since is not None:
+                timeout = max(0.0, unflushed_since + FLUSH_INTERVAL_SECONDS - time.monotonic())
+            try:
+                batch = [self._queue.get(timeout=timeout)]
+            except queue.Empty:
+                self._flush()
+                unflushed_since = None
+                continue
+            while len(batch) < MAX_WRITE_BATCH:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            stop = any(payload is _STOP for payload in batch)
+            payloads = [payload for payload in batch if payload is not _STOP]
+            if payloads:
+                try:
+                    self._file.write(b''.join(payloads))
+                except Exception as e:
+                    logger.error(f"Error writing email backup to {self.path}: {e}")
+                if unflushed_since is None:
+                    unflushed_since = time.monotonic()
+
+            if stop:
+                self._flush()
+                return
+            if unflushed_since is not None and time.monotonic() - unflushed_since >= FLUSH_INTERVAL_SECONDS:
+                self._flush()
+                unflushed_since = None
+
+    def _flush(self):
+        """Push buffered entries to disk"""
+        try:
+            self._file.flush()
+        except Exception as e:
+            logger.error(f"Error writing email backup to {self.path}: {e}")
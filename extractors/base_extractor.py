@@ -1,30 +1,298 @@
 from abc import ABC, abstractmethod
-from typing import Dict, List, Optional
+from typing import Callable, Dict, List, Optional, Tuple
 import anthropic
+import asyncio
+import hashlib
 import json
 import logging
 import os
+import re
+import string
+import time
 from datetime import datetime
+from collections import OrderedDict
+from functools import lru_cache
+
+try:
+    import ahocorasick
+except ImportError:
+    # Optional: keyword matching falls back to a compiled regex alternation
+    ahocorasick = None
+
+try:
+    import orjson
+except ImportError:
+    # Optional: Claude responses are parsed with the stdlib json module instead
+    orjson = None
+
+from .rate_limiter import get_rate_limiter, estimate_prompt_tokens, get_retry_after_seconds
+from .response_cache import DEFAULT_REJECTED_TTL_DAYS, ResponseCache, get_response_cache
+from .backup_writer import BackupWriter
 
 logger = logging.getLogger(__name__)
 
+# Anthropic recommends few concurrent connections per key; more causes APIConnectionError
+DEFAULT_MAX_CONCURRENCY = 5
+
+# Times a request is re-sent after a 429 before giving up
+MAX_RATE_LIMIT_RETRIES = 3
+
+# How long a response is reused for near-duplicate emails unless configured per extractor
+DEFAULT_NEAR_DUPLICATE_TTL_MINUTES = 24 * 60
+
+# Stands in for the email in the system prompt when prompt caching sends the email as the user message
+EMAIL_IN_USER_MESSAGE = "(the email is provided in the user message, inside <email> tags)"
+
+# Requests allowing this many output tokens are streamed so long responses arrive incrementally
+STREAMING_MIN_MAX_TOKENS = 4096
+
+# Seconds between Message Batches status checks in extract_offline
+BATCH_POLL_INTERVAL_SECONDS = 30
+
+# Prompt cache lifetime for Message Batches requests unless config 'prompt_cache_ttl' says otherwise
+BATCH_PROMPT_CACHE_TTL = "1h"
+
+_JSON_DECODER = json.JSONDecoder()
+
+# Characters of email body (including PDF text) sent to Claude: the start, where invoice details
+# usually are, and the end, where appended PDF text and totals land. Configurable per extractor.
+PROMPT_BODY_HEAD_LENGTH = 3000
+PROMPT_BODY_TAIL_LENGTH = 1000
+
+# Marks the characters left out between the start and the end of a long body
+PROMPT_BODY_GAP = "\n…\n"
+
+# Runs of spaces/tabs and of blank lines, collapsed in the prompt body
+_INLINE_WHITESPACE_PATTERN = re.compile(r'[^\S\n]+')
+_BLANK_LINES_PATTERN = re.compile(r'\s*\n\s*\n\s*')
+
+# Backup file buffer size
+BACKUP_BUFFER_SIZE = 1 << 20
+
+# should_process decisions remembered per extractor for repeated emails
+SHOULD_PROCESS_CACHE_SIZE = 4096
+
+# Texts longer than this are cleaned without memoization
+MAX_CACHED_TEXT_LENGTH = 16384
+
+
+class _CleanTextTable(dict):
+    """str.translate table that fills in the printable/whitespace decision per codepoint on first use"""
+    
+    def __missing__(self, codepoint: int) -> Optional[str]:
+        char = chr(codepoint)
+        # None deletes the character from the translated text
+        translated = char if char.isprintable() or char.isspace() else None
+        self[codepoint] = translated
+        return translated
+
+
+# Replace common problematic characters; everything else non-printable is removed
+_CLEAN_TEXT_TABLE = _CleanTextTable(str.maketrans({
+    '\xb4': "'",  # Acute accent
+    '\u2019': "'",  # Right single quotation mark
+    '\u2018': "'",  # Left single quotation mark
+    '\u201c': '"',  # Left double quotation mark
+    '\u201d': '"',  # Right double quotation mark
+    '\u2013': '-',  # En dash
+    '\u2014': '-',  # Em dash
+    '\u00a0': ' ',  # Non-breaking space
+}))
+
+
+@lru_cache(maxsize=4096)
+def _clean_text_cached(text: str) -> str:
+    """Replace problematic characters and drop non-printable ones (memoized on text)"""
+    # Lone surrogates are non-printable, so the result always encodes to UTF-8
+    return text.translate(_CLEAN_TEXT_TABLE)
+
+
+@lru_cache(maxsize=1)
+def _format_timestamp(epoch_second: int) -> str:
+    """Format a whole-second epoch time; cached so calls within the same second skip strftime"""
+    return datetime.fromtimestamp(epoch_second).strftime('%Y-%m-%d %H:%M:%S')
+
+
+def _current_timestamp() -> str:
+    """Current local time as 'YYYY-MM-DD HH:MM:SS'"""
+    return _format_timestamp(int(time.time()))
+
+
+def _build_keyword_matcher(keywords: List[str]) -> Callable[[str], bool]:
+    """Build a single-pass matcher telling whether any keyword occurs in lowercased content"""
+    lowered_keywords = [keyword.lower() for keyword in keywords]
+    
+    # An empty keyword matches any content, as with the substring check
+    if '' in lowered_keywords:
+        return lambda content: True
+    
+    if ahocorasick is not None:
+        automaton = ahocorasick.Automaton()
+        for keyword in lowered_keywords:
+            automaton.add_word(keyword, keyword)
+        automaton.make_automaton()
+        return lambda content: next(automaton.iter(content), None) is not None
+    
+    # Longest first so the alternation prefers full keywords
+    pattern = re.compile('|'.join(map(re.escape, sorted(lowered_keywords, key=len, reverse=True))))
+    return lambda content: pattern.search(content) is not None
+
+
+def _parse_prompt_template(template: str) -> Optional[List[Tuple]]:
+    """Split a str.format template into chunks, or None if it needs str.format's full feature set"""
+    try:
+        template_parts = list(string.Formatter().parse(template))
+    except ValueError:
+        # Malformed templates are reported by str.format when the prompt is built
+        return None
+    for _, field_name, format_spec, conversion in template_parts:
+        # Positional, attribute/index fields, format specs and conversions are left to str.format
+        if field_name is not None and (not field_name.isidentifier() or format_spec or conversion):
+            return None
+    return template_parts
+
+
+# Fallback async clients for extractors built without one, shared per API key
+_shared_async_clients: Dict[str, anthropic.AsyncAnthropic] = {}
+
+
+def _get_shared_async_client(api_key: str) -> anthropic.AsyncAnthropic:
+    """Get the process-wide async client for an API key so extractors share one connection pool"""
+    if api_key not in _shared_async_clients:
+        _shared_async_clients[api_key] = anthropic.AsyncAnthropic(api_key=api_key)
+    return _shared_async_clients[api_key]
+
+
+def _loads_json(text: str):
+    """Parse a complete JSON document, with orjson when it is installed"""
+    if orjson is not None:
+        try:
+            return orjson.loads(text)
+        except orjson.JSONDecodeError:
+            # orjson rejects some text the stdlib accepts (NaN, lone surrogates); give json the final say
+            pass
+    return json.loads(text)
+
+
+def _decode_json_value(text: str, start: int, closing: str):
+    """Decode the JSON value starting at `start`, returning it with the index just past its end"""
+    if orjson is not None:
+        # Common case: the value runs to the last closing bracket, so orjson parses the slice in one pass
+        end = text.rfind(closing) + 1
+        if end > start:
+            try:
+                return orjson.loads(text[start:end]), end
+            except orjson.JSONDecodeError:
+                # Text after the JSON contains brackets too, or orjson rejected the value;
+                # let the stdlib decoder find the real end
+                pass
+    return _JSON_DECODER.raw_decode(text, start)
+
+
+def _collapse_whitespace(text: str) -> str:
+    """Collapse runs of spaces/tabs to one space and runs of blank lines to one blank line"""
+    return _BLANK_LINES_PATTERN.sub('\n\n', _INLINE_WHITESPACE_PATTERN.sub(' ', text))
+
+
+def _get_request_prompt_text(request: Dict) -> str:
+    """All prompt text of a messages request: the system blocks followed by the user message"""
+    system_text = ''.join(block['text'] for block in request.get('system', ()))
+    return system_text + request['messages'][0]['content']
+
+
 class BaseExtractor(ABC):
     """Base class for all email content extractors"""
     
-    def __init__(self, config_section: Dict, claude_client: anthropic.Anthropic):
+    # Max tokens requested from Claude per email, overridden by subclasses
+    claude_max_tokens = 1500
+    
+    # Gmail categories left out of searches unless config 'exclude_categories' says otherwise
+    default_excluded_categories: Tuple[str, ...] = ()
+    
+    def __init__(self, config_section: Dict, claude_client: anthropic.Anthropic,
+                 async_claude_client: Optional[anthropic.AsyncAnthropic] = None):
         self.config = config_section
         self.claude = claude_client
+        self.async_claude = async_claude_client
+        self.rate_limiter = get_rate_limiter(self.config.get('rate_limits'))
+        self.response_cache = get_response_cache(self.config.get('response_cache'))
+        self._keyword_matchers: Dict[Tuple[str, ...], Callable[[str], bool]] = {}
+        self._should_process_decisions: OrderedDict = OrderedDict()
+        
+        # Config never changes after init, so read it once; tuples are safe to share across threads
+        keywords_config = self.config.get('keywords', {})
+        self._swedish_keywords = tuple(keywords_config.get('swedish', ()))
+        self._english_keywords = tuple(keywords_config.get('english', ()))
+        self._search_keywords = self._swedish_keywords + self._english_keywords
+        self._swedish_kw_str = ', '.join(self._swedish_keywords)
+        self._english_kw_str = ', '.join(self._english_keywords)
+        self._search_keyword_matcher = self._compile_keyword_matcher(self._search_keywords)
+        self._model = self.config.get('claude_model', 'claude-3-5-sonnet-20241022')
+        self._prompt_template = self.config.get('prompt_template', '')
+        self._prompt_template_parts = _parse_prompt_template(self._prompt_template) if self._prompt_template else None
+        # Bump template_version in config when the prompt changes to invalidate cached responses
+        self._template_version = str(self.config.get('template_version', '1'))
+        self._prompt_body_head_length = self.config.get('prompt_body_head_length', PROMPT_BODY_HEAD_LENGTH)
+        self._prompt_body_tail_length = self.config.get('prompt_body_tail_length', PROMPT_BODY_TAIL_LENGTH)
+        
+        # With prompt caching the instructions go in a cached system prompt and only the email varies
+        self._static_instructions: Optional[str] = None
+        if self.config.get('prompt_caching', False) and self._prompt_template:
+            self._static_instructions = self._build_static_instructions()
+        # Batches can take longer than the default 5 minute cache lifetime, so they keep the prefix for an hour
+        prompt_cache_ttl = self.config.get('prompt_cache_ttl') or (
+            BATCH_PROMPT_CACHE_TTL if self.config.get('use_batch_api', False) else None)
+        self._cache_control = {"type": "ephemeral"}
+        if prompt_cache_ttl:
+            self._cache_control["ttl"] = prompt_cache_ttl
+        
+        near_duplicate_config = self.config.get('near_duplicate_cache') or {}
+        self._near_duplicate_ttl: Optional[float] = None
+        if near_duplicate_config.get('enabled', False):
+            self._near_duplicate_ttl = near_duplicate_config.get('ttl_minutes', DEFAULT_NEAR_DUPLICATE_TTL_MINUTES) * 60
+        
+        # Responses rejecting an email are reused without a Claude call for config 'response_cache.rejected_ttl_days'
+        self._rejected_ttl: Optional[float] = None
+        if self.response_cache is not None:
+            response_cache_config = self.config.get('response_cache') or {}
+            self._rejected_ttl = response_cache_config.get('rejected_ttl_days', DEFAULT_REJECTED_TTL_DAYS) * 86400
         
     @abstractmethod
-    def should_process(self, email_content: str, sender: str, subject: str) -> bool:
-        """Determine if this extractor should process the given email"""
+    def should_process(self, email_content: str, sender: str, subject: str,
+                       content_lower: Optional[str] = None) -> bool:
+        """Determine if this extractor should process the given email.
+        
+        content_lower is email_content.lower(), computed once by the caller and shared across extractors.
+        """
         pass
         
+    def should_process_metadata(self, sender: str, subject: str) -> bool:
+        """False when sender and subject alone rule the email out, so its body need not be fetched"""
+        return True
+        
     @abstractmethod
     def extract(self, email_content: str, email_metadata: Dict) -> List[Dict]:
         """Extract relevant data from email content. Returns list of extracted items."""
         pass
         
+    @abstractmethod
+    def _build_records(self, response_text: str, email_content: str, email_metadata: Dict, backup_path: str) -> List[Dict]:
+        """Turn Claude's response text into CSV records for this extractor"""
+        pass
+        
+    def _clean_records(self, records: List[Dict]) -> List[Dict]:
+        """Normalize extracted values across all records of a call; runs once per batch"""
+        return records
+        
+    def _local_rejection(self, email_content: str, email_metadata: Dict, backup_path: str) -> Optional[List[Dict]]:
+        """Records for an email ruled out locally without asking Claude, or None to ask Claude"""
+        return None
+        
+    @abstractmethod
+    def _create_failed_processing_record(self, email_content: str, email_metadata: Dict, backup_path: str, error_message: str) -> Dict:
+        """Create record for emails that failed to process"""
+        pass
+        
     @property
     @abstractmethod
     def name(self) -> str:
@@ -37,24 +305,67 @@ class BaseExtractor(ABC):
         """CSV filename for this extractor's output"""
         pass
         
+    def should_process_cached(self, email_content: str, sender: str, subject: str,
+                              content_lower: Optional[str] = None) -> bool:
+        """should_process, remembering decisions for emails with the same sender, subject and body"""
+        content_digest = hashlib.blake2b(email_content.encode('utf-8', 'surrogatepass'), digest_size=8).digest()
+        key = (sender.lower(), subject.lower(), content_digest)
+        
+        decision = self._should_process_decisions.get(key)
+        if decision is not None:
+            self._should_process_decisions.move_to_end(key)
+            return decision
+        
+        decision = self.should_process(email_content, sender, subject, content_lower=content_lower)
+        self._should_process_decisions[key] = decision
+        if len(self._should_process_decisions) > SHOULD_PROCESS_CACHE_SIZE:
+            self._should_process_decisions.popitem(last=False)
+        return decision
+    
     def get_search_keywords(self) -> List[str]:
         """Get keywords for Gmail search query building"""
-        keywords = []
-        if 'keywords' in self.config:
-            if 'swedish' in self.config['keywords']:
-                keywords.extend(self.config['keywords']['swedish'])
-            if 'english' in self.config['keywords']:
-                keywords.extend(self.config['keywords']['english'])
-        return keywords
+        return list(self._search_keywords)
     
     def get_additional_search_filters(self) -> List[str]:
         """Get additional search filters specific to this extractor (e.g., attachment filters)"""
         return []
+    
+    def get_search_exclusions(self) -> List[str]:
+        """Gmail search terms every result must satisfy, from config 'exclude_categories' (e.g. promotions)"""
+        return [f"-category:{category}" for category in self.config.get('exclude_categories', self.default_excluded_categories)]
+    
+    def get_metadata_filter(self) -> Optional[Callable[[str, str], bool]]:
+        """Sender/subject prefilter for the Gmail search, or None to fetch every hit in full.
+        
+        Opt-in with config 'metadata_prefilter': the search also matches keywords in the body and
+        PDF, and emails the prefilter drops are never downloaded nor exported as rejected.
+        """
+        if self.config.get('metadata_prefilter', False):
+            return self.should_process_metadata
+        return None
         
-    def _check_keywords_in_content(self, content: str, keywords: List[str]) -> bool:
-        """Helper method to check if any keywords appear in content"""
-        content_lower = content.lower()
-        return any(keyword.lower() in content_lower for keyword in keywords)
+    def _compile_keyword_matcher(self, keywords: Tuple[str, ...]) -> Callable[[str], bool]:
+        """Build a matcher over lowercased content for a fixed keyword list, typically once in __init__"""
+        if not keywords:
+            return lambda content_lower: False
+        return _build_keyword_matcher(list(keywords))
+    
+    def _check_keywords_in_content(self, content: str, keywords: List[str],
+                                   content_lower: Optional[str] = None) -> bool:
+        """Helper method to check if any keywords appear in content (pass content_lower to skip lowercasing)"""
+        if not keywords:
+            return False
+        
+        # Matchers are compiled once per keyword list and reused for every email
+        keywords_key = tuple(keywords)
+        matcher = self._keyword_matchers.get(keywords_key)
+        if matcher is None:
+            matcher = _build_keyword_matcher(keywords)
+            self._keyword_matchers[keywords_key] = matcher
+        
+        if content_lower is None:
+            content_lower = content.lower()
+        return matcher(content_lower)
     
     def _clean_text(self, text: str) -> str:
         """Clean text to handle encoding issues and special characters"""
@@ -64,72 +375,371 @@ class BaseExtractor(ABC):
         # Convert to string if not already
         text = str(text)
         
-        # Replace common problematic characters
-        replacements = {
-            '\xb4': "'",  # Acute accent
-            '\u2019': "'",  # Right single quotation mark
-            '\u2018': "'",  # Left single quotation mark
-            '\u201c': '"',  # Left double quotation mark
-            '\u201d': '"',  # Right double quotation mark
-            '\u2013': '-',  # En dash
-            '\u2014': '-',  # Em dash
-            '\u00a0': ' ',  # Non-breaking space
-        }
+        # Large bodies rarely repeat, so keep them out of the cache
+        if len(text) > MAX_CACHED_TEXT_LENGTH:
+            return _clean_text_cached.__wrapped__(text)
+        return _clean_text_cached(text)
+    
+    def _call_claude(self, prompt: str, max_tokens: int = 1500, near_duplicate_key: Optional[str] = None) -> str:
+        """Make a call to Claude API with proper error handling"""
+        try:
+            request = self._build_claude_request(prompt, max_tokens)
+        except Exception as e:
+            logger.error(f"Error calling Claude for {self.name}: {e}")
+            return ""
+        return self._send_claude_request(request, near_duplicate_key)
+    
+    def _send_claude_request(self, request: Dict, near_duplicate_key: Optional[str] = None) -> str:
+        """Send a prepared request (or answer it from the response cache) and return the response text"""
+        try:
+            cache_key, cached_text = self._lookup_cached_response(request, near_duplicate_key)
+            if cached_text is not None:
+                return cached_text
+            
+            response = self._create_message(request)
+            response_text = self._get_response_text(response)
+            self._store_cached_response(cache_key, response_text, near_duplicate_key)
+            return response_text
+            
+        except Exception as e:
+            logger.error(f"Error calling Claude for {self.name}: {e}")
+            return ""
+    
+    async def _call_claude_async(self, prompt: str, max_tokens: int = 1500,
+                                 near_duplicate_key: Optional[str] = None) -> str:
+        """Make a non-blocking call to Claude API with proper error handling"""
+        try:
+            request = self._build_claude_request(prompt, max_tokens)
+        except Exception as e:
+            logger.error(f"Error calling Claude for {self.name}: {e}")
+            return ""
+        return await self._send_claude_request_async(request, near_duplicate_key)
+    
+    async def _send_claude_request_async(self, request: Dict, near_duplicate_key: Optional[str] = None) -> str:
+        """Async counterpart of _send_claude_request"""
+        try:
+            if self.async_claude is None:
+                self.async_claude = _get_shared_async_client(self.claude.api_key)
+            
+            cache_key, cached_text = self._lookup_cached_response(request, near_duplicate_key)
+            if cached_text is not None:
+                return cached_text
+            
+            response = await self._create_message_async(request)
+            response_text = self._get_response_text(response)
+            self._store_cached_response(cache_key, response_text, near_duplicate_key)
+            return response_text
+            
+        except Exception as e:
+            logger.error(f"Error calling Claude for {self.name}: {e}")
+            return ""
+    
+    def _lookup_cached_response(self, request: Dict,
+                                near_duplicate_key: Optional[str] = None) -> Tuple[Optional[str], Optional[str]]:
+        """Return the cache key and any cached response text for a Claude request"""
+        if self.response_cache is None:
+            return None, None
+        
+        cache_key = ResponseCache.make_key(request['model'], request['max_tokens'], self._template_version,
+                                           _get_request_prompt_text(request))
+        cached_text = self.response_cache.get(cache_key)
+        if cached_text is not None:
+            logger.debug(f"Using cached Claude response for {self.name}")
+        elif near_duplicate_key is not None:
+            cached_text = self.response_cache.get(near_duplicate_key)
+            if cached_text is not None:
+                logger.debug(f"Using cached Claude response of a near-duplicate email for {self.name}")
+        return cache_key, cached_text
+    
+    def _store_cached_response(self, cache_key: Optional[str], response_text: str,
+                               near_duplicate_key: Optional[str] = None):
+        """Cache a successful Claude response text"""
+        if cache_key is not None and response_text:
+            self.response_cache.set(cache_key, response_text)
+            if near_duplicate_key is not None:
+                self.response_cache.set(near_duplicate_key, response_text, ttl_seconds=self._near_duplicate_ttl)
+    
+    def _lookup_cached_rejection(self, email_content: str,
+                                 email_metadata: Dict) -> Tuple[Optional[str], Optional[str]]:
+        """Return the rejection key and the response text of an earlier rejection of the same email"""
+        if self.response_cache is None or not self._rejected_ttl:
+            return None, None
+        
+        rejection_key = ResponseCache.make_rejection_key(
+            self.name, self._model, self.claude_max_tokens, self._template_version,
+            email_metadata.get('subject', ''), email_content
+        )
+        cached_text = self.response_cache.get(rejection_key)
+        if cached_text is not None:
+            logger.debug(f"Skipping Claude for an email {self.name} rejected before")
+        return rejection_key, cached_text
+    
+    def _store_rejection(self, rejection_key: Optional[str], response_text: str, records: List[Dict]):
+        """Remember a response whose only record is a rejection so the email is not sent to Claude again"""
+        if rejection_key is None or not response_text:
+            return
+        if len(records) == 1 and not records[0].get('extracted', False):
+            self.response_cache.set(rejection_key, response_text, ttl_seconds=self._rejected_ttl)
+    
+    def _get_near_duplicate_key(self, email_content: str, email_metadata: Dict) -> Optional[str]:
+        """Key matching near-duplicate emails, or None when the near-duplicate cache is disabled"""
+        if self.response_cache is None or self._near_duplicate_ttl is None:
+            return None
+        return ResponseCache.make_near_duplicate_key(
+            self.name, self._model, self.claude_max_tokens, self._template_version,
+            email_metadata.get('sender', ''), email_metadata.get('subject', ''), email_content
+        )
+    
+    def _create_message(self, request: Dict):
+        """Send a request, pacing it through the rate limiter and honouring retry-after on 429"""
+        prompt_tokens = estimate_prompt_tokens(_get_request_prompt_text(request))
+        
+        for attempt in range(MAX_RATE_LIMIT_RETRIES + 1):
+            if self.rate_limiter:
+                self.rate_limiter.acquire(prompt_tokens)
+            try:
+                if request['max_tokens'] >= STREAMING_MIN_MAX_TOKENS:
+                    with self.claude.messages.stream(**request) as stream:
+                        return stream.get_final_message()
+                return self.claude.messages.create(**request)
+            except anthropic.RateLimitError as e:
+                if attempt == MAX_RATE_LIMIT_RETRIES:
+                    raise
+                retry_after = get_retry_after_seconds(e)
+                logger.warning(f"Claude rate limit hit for {self.name}, retrying in {retry_after:.1f}s")
+                time.sleep(retry_after)
+    
+    async def _create_message_async(self, request: Dict):
+        """Async counterpart of _create_message"""
+        prompt_tokens = estimate_prompt_tokens(_get_request_prompt_text(request))
         
-        for old_char, new_char in replacements.items():
-            text = text.replace(old_char, new_char)
+        for attempt in range(MAX_RATE_LIMIT_RETRIES + 1):
+            if self.rate_limiter:
+                await self.rate_limiter.acquire_async(prompt_tokens)
+            try:
+                if request['max_tokens'] >= STREAMING_MIN_MAX_TOKENS:
+                    async with self.async_claude.messages.stream(**request) as stream:
+                        return await stream.get_final_message()
+                return await self.async_claude.messages.create(**request)
+            except anthropic.RateLimitError as e:
+                if attempt == MAX_RATE_LIMIT_RETRIES:
+                    raise
+                retry_after = get_retry_after_seconds(e)
+                logger.warning(f"Claude rate limit hit for {self.name}, retrying in {retry_after:.1f}s")
+                await asyncio.sleep(retry_after)
+    
+    def _build_claude_request(self, prompt: str, max_tokens: int) -> Dict:
+        """Build keyword arguments for messages.create"""
+        # Clean the entire prompt to avoid encoding issues
+        cleaned_prompt = self._clean_text(prompt)
+        
+        logger.debug(f"Sending {self.name} prompt to Claude (first 200 chars): {cleaned_prompt[:200]!r}")
+
+        logger.debug(f"Making HTTP request to Claude API - Model: {self._model}, Max tokens: {max_tokens}")
+        
+        return {
+            'model': self._model,
+            'max_tokens': max_tokens,
+            'messages': [{"role": "user", "content": cleaned_prompt}],
+        }
+    
+    def _build_extraction_request(self, email_content: str, email_metadata: Dict) -> Dict:
+        """Build the Claude request for one email, splitting out a cacheable system prompt when enabled"""
+        if self._static_instructions is None:
+            prompt = self._format_prompt_template(email_content, email_metadata)
+            return self._build_claude_request(prompt, self.claude_max_tokens)
         
-        # Remove any remaining non-printable characters
-        text = ''.join(char for char in text if char.isprintable() or char.isspace())
+        # Only the email varies, so the instructions form a byte-identical prefix Claude can cache
+        return {
+            'model': self._model,
+            'max_tokens': self.claude_max_tokens,
+            'system': [{
+                "type": "text",
+                "text": self._static_instructions,
+                "cache_control": self._cache_control,
+            }],
+            'messages': [{"role": "user", "content": self._format_user_email_message(email_content, email_metadata)}],
+        }
+    
+    def _format_user_email_message(self, email_content: str, email_metadata: Dict) -> str:
+        """Wrap the email block in <email> tags as the only per-email part of a prompt-cached request"""
+        email_block = self._clean_text(self._format_email_block(email_content, email_metadata))
+        return f"<email>{email_block}</email>"
+    
+    def _get_response_text(self, response) -> str:
+        """Extract text from Claude's response - handle different response types"""
+        logger.debug(f"Claude API response received - Usage: {getattr(response, 'usage', 'N/A')}")
         
-        # Ensure we can encode to UTF-8
         try:
-            text.encode('utf-8')
-            return text
-        except UnicodeEncodeError:
-            # If still problematic, replace non-ASCII with safe alternatives
-            return text.encode('ascii', errors='replace').decode('ascii')
-        except Exception:
-            # Last resort: return empty string
-            return ""
+            content_block = response.content[0]
+            if hasattr(content_block, 'text'):
+                return content_block.text.strip()
+            # Handle other content types by converting to string
+            return str(content_block).strip()
+        except (AttributeError, IndexError):
+            return str(response.content).strip()
     
-    def _call_claude(self, prompt: str, max_tokens: int = 1500) -> str:
-        """Make a call to Claude API with proper error handling"""
+    def extract(self, email_content: str, email_metadata: Dict) -> List[Dict]:
+        """Extract data using Claude AI with configurable prompt template and reasoning capture"""
         try:
-            # Clean the entire prompt to avoid encoding issues
-            cleaned_prompt = self._clean_text(prompt)
+            # Save email backup for reference
+            backup_path = self._save_email_backup(email_content, email_metadata)
             
-            logger.debug(f"Sending {self.name} prompt to Claude (first 200 chars): {cleaned_prompt[:200]!r}")
-
-            # Get model from config, fallback to current working model
-            model = self.config.get('claude_model', 'claude-3-5-sonnet-20241022')
+            local_records = self._local_rejection(email_content, email_metadata, backup_path)
+            if local_records is not None:
+                return self._clean_records(local_records)
             
-            logger.debug(f"Making HTTP request to Claude API - Model: {model}, Max tokens: {max_tokens}")
+            rejection_key, response_text = self._lookup_cached_rejection(email_content, email_metadata)
+            if response_text is None:
+                request = self._build_extraction_request(email_content, email_metadata)
+                near_duplicate_key = self._get_near_duplicate_key(email_content, email_metadata)
+                response_text = self._send_claude_request(request, near_duplicate_key)
+            records = self._build_records(response_text, email_content, email_metadata, backup_path)
+            self._store_rejection(rejection_key, response_text, records)
+            return self._clean_records(records)
             
-            response = self.claude.messages.create(
-                model=model,
-                max_tokens=max_tokens,
-                messages=[{"role": "user", "content": cleaned_prompt}]
-            )
+        except Exception as e:
+            logger.error(f"Error extracting {self.name} data: {e}")
+            return [self._create_failed_processing_record(email_content, email_metadata, "", f"Processing error: {str(e)}")]
+    
+    async def _extract_one(self, email_content: str, email_metadata: Dict) -> List[Dict]:
+        """Async counterpart of extract used by extract_batch; values are cleaned once for the whole batch"""
+        try:
+            backup_path = self._save_email_backup(email_content, email_metadata)
             
-            logger.debug(f"Claude API response received - Usage: {getattr(response, 'usage', 'N/A')}")
+            local_records = self._local_rejection(email_content, email_metadata, backup_path)
+            if local_records is not None:
+                return local_records
             
-            # Extract text from Claude's response - handle different response types
-            try:
-                content_block = response.content[0]
-                if hasattr(content_block, 'text'):
-                    response_text = content_block.text.strip()
-                else:
-                    # Handle other content types by converting to string
-                    response_text = str(content_block).strip()
-            except (AttributeError, IndexError):
-                response_text = str(response.content).strip()
+            rejection_key, response_text = self._lookup_cached_rejection(email_content, email_metadata)
+            if response_text is None:
+                request = self._build_extraction_request(email_content, email_metadata)
+                near_duplicate_key = self._get_near_duplicate_key(email_content, email_metadata)
+                response_text = await self._send_claude_request_async(request, near_duplicate_key)
+            records = self._build_records(response_text, email_content, email_metadata, backup_path)
+            self._store_rejection(rejection_key, response_text, records)
+            return records
             
-            return response_text
+        except Exception as e:
+            logger.error(f"Error extracting {self.name} data: {e}")
+            return [self._create_failed_processing_record(email_content, email_metadata, "", f"Processing error: {str(e)}")]
+    
+    async def extract_batch(self, emails: List[Tuple[str, Dict]]) -> List[Dict]:
+        """Extract data from many (email_content, email_metadata) pairs with overlapping Claude calls.
+        
+        Concurrency is capped by config 'max_concurrency' (default 5). Results keep input order.
+        With config 'use_batch_api' the emails go out as one Message Batches submission instead.
+        """
+        if self.config.get('use_batch_api', False):
+            # Polling blocks, so wait for the batch in a thread and let other extractors keep running
+            return await asyncio.to_thread(self.extract_offline, emails)
+        
+        semaphore = asyncio.Semaphore(self.config.get('max_concurrency', DEFAULT_MAX_CONCURRENCY))
+        
+        async def extract_with_limit(email_content: str, email_metadata: Dict) -> List[Dict]:
+            async with semaphore:
+                return await self._extract_one(email_content, email_metadata)
+        
+        results = await asyncio.gather(*[
+            extract_with_limit(email_content, email_metadata)
+            for email_content, email_metadata in emails
+        ], return_exceptions=True)
+        
+        records = []
+        for (email_content, email_metadata), result in zip(emails, results):
+            if isinstance(result, BaseException):
+                # One failing email must not discard the rest of the batch
+                logger.error(f"Error extracting {self.name} data: {result}")
+                result = [self._create_failed_processing_record(email_content, email_metadata, "", f"Processing error: {str(result)}")]
+            records.extend(result)
+        return self._clean_records(records)
+    
+    def extract_offline(self, emails: List[Tuple[str, Dict]]) -> List[Dict]:
+        """Extract data from many emails through the Message Batches API (half price, higher latency).
+        
+        Enabled by config 'use_batch_api'; otherwise each email goes through extract(). Results keep input order.
+        """
+        if not self.config.get('use_batch_api', False):
+            return [record for email_content, email_metadata in emails
+                    for record in self.extract(email_content, email_metadata)]
+        
+        prepared = []
+        batch_requests = {}
+        for index, (email_content, email_metadata) in enumerate(emails):
+            entry = {'email_content': email_content, 'email_metadata': email_metadata, 'backup_path': ""}
+            prepared.append(entry)
+            try:
+                entry['backup_path'] = self._save_email_backup(email_content, email_metadata)
+                entry['local_records'] = self._local_rejection(email_content, email_metadata, entry['backup_path'])
+                if entry['local_records'] is not None:
+                    continue
+                
+                # Same cache order as extract(): remembered rejection, then exact and near-duplicate responses
+                entry['rejection_key'], entry['response_text'] = self._lookup_cached_rejection(email_content, email_metadata)
+                if entry['response_text'] is not None:
+                    continue
+                request = self._build_extraction_request(email_content, email_metadata)
+                entry['near_duplicate_key'] = self._get_near_duplicate_key(email_content, email_metadata)
+                entry['cache_key'], entry['response_text'] = self._lookup_cached_response(
+                    request, entry['near_duplicate_key'])
+            except Exception as e:
+                logger.error(f"Error preparing {self.name} batch request: {e}")
+                entry['error'] = f"Processing error: {str(e)}"
+                continue
             
+            if entry['response_text'] is None:
+                entry['custom_id'] = f"email-{index}"
+                batch_requests[entry['custom_id']] = request
+        
+        try:
+            batch_texts = self._run_message_batch(batch_requests) if batch_requests else {}
         except Exception as e:
-            logger.error(f"Error calling Claude for {self.name}: {e}")
-            return ""
+            logger.error(f"Error running {self.name} message batch: {e}")
+            batch_texts = {}
+        
+        results = []
+        for entry in prepared:
+            email_content, email_metadata, backup_path = entry['email_content'], entry['email_metadata'], entry['backup_path']
+            if entry.get('local_records') is not None:
+                results.extend(entry['local_records'])
+                continue
+            if entry.get('error'):
+                results.append(self._create_failed_processing_record(email_content, email_metadata, backup_path, entry['error']))
+                continue
+            
+            response_text = entry['response_text']
+            if response_text is None:
+                response_text = batch_texts.get(entry['custom_id'], "")
+                self._store_cached_response(entry['cache_key'], response_text, entry['near_duplicate_key'])
+            try:
+                records = self._build_records(response_text, email_content, email_metadata, backup_path)
+                self._store_rejection(entry['rejection_key'], response_text, records)
+                results.extend(records)
+            except Exception as e:
+                logger.error(f"Error extracting {self.name} data: {e}")
+                results.append(self._create_failed_processing_record(email_content, email_metadata, backup_path, f"Processing error: {str(e)}"))
+        return self._clean_records(results)
+    
+    def _run_message_batch(self, batch_requests: Dict[str, Dict]) -> Dict[str, str]:
+        """Submit requests as one message batch, wait for it to end and map custom_id to response text"""
+        batch = self.claude.messages.batches.create(requests=[
+            {"custom_id": custom_id, "params": request}
+            for custom_id, request in batch_requests.items()
+        ])
+        logger.info(f"Submitted {self.name} message batch {batch.id} with {len(batch_requests)} requests")
+        
+        poll_interval = self.config.get('batch_poll_interval', BATCH_POLL_INTERVAL_SECONDS)
+        while batch.processing_status != "ended":
+            time.sleep(poll_interval)
+            batch = self.claude.messages.batches.retrieve(batch.id)
+        
+        response_texts = {}
+        for entry in self.claude.messages.batches.results(batch.id):
+            if entry.result.type == "succeeded":
+                response_texts[entry.custom_id] = self._get_response_text(entry.result.message)
+            else:
+                logger.error(f"Batch request {entry.custom_id} for {self.name} ended with {entry.result.type}")
+        return response_texts
     
     def _parse_json_response(self, response_text: str, is_array: bool = False) -> tuple[Dict | List[Dict], Dict[str, str]]:
         """Parse Claude's JSON response with robust error handling and extract reasoning"""
@@ -137,41 +747,21 @@ class BaseExtractor(ABC):
         
         try:
             # Clean up response (remove any markdown formatting)
-            json_text = response_text
-            if "```json" in json_text:
-                json_text = json_text.split("```json")[1].split("```")[0]
-            elif "```" in json_text:
-                json_text = json_text.split("```")[1].split("```")[0]
+            json_text = self._strip_markdown_fences(response_text)
             
             # Extract JSON part from response
             if is_array:
-                # Looking for array format - find properly balanced brackets
+                # Looking for array format - the decoder finds the matching closing bracket
                 json_start = json_text.find('[')
                 if json_start >= 0:
-                    bracket_count = 0
-                    json_end = json_start
-                    for i, char in enumerate(json_text[json_start:], json_start):
-                        if char == '[':
-                            bracket_count += 1
-                        elif char == ']':
-                            bracket_count -= 1
-                            if bracket_count == 0:
-                                json_end = i + 1
-                                break
-                    
-                    if json_end > json_start:
-                        extracted_json = json_text[json_start:json_end]
-                        
-                        # Extract reasoning and log
+                    try:
+                        parsed_data, json_end = _decode_json_value(json_text, json_start, ']')
                         reasoning_data = self._extract_reasoning(response_text, json_start, json_end)
-                        
-                        try:
-                            parsed_data = json.loads(extracted_json)
-                            logger.debug(f"Claude {self.name} JSON output: {extracted_json}")
-                            return parsed_data, reasoning_data
-                        except json.JSONDecodeError as e:
-                            logger.debug(f"Failed to parse array JSON, trying fallback: {e}")
-                            # Continue to fallback
+                        logger.debug(f"Claude {self.name} JSON output: {json_text[json_start:json_end]}")
+                        return parsed_data, reasoning_data
+                    except json.JSONDecodeError as e:
+                        logger.debug(f"Failed to parse array JSON, trying fallback: {e}")
+                        # Continue to fallback
                     
                 # Fallback: try single object wrapped in array
                 json_start = json_text.find('{')
@@ -179,39 +769,23 @@ class BaseExtractor(ABC):
                 if json_start >= 0 and json_end > json_start:
                     extracted_json = json_text[json_start:json_end]
                     reasoning_data = self._extract_reasoning(response_text, json_start, json_end)
-                    single_item = json.loads(extracted_json)
+                    single_item = _loads_json(extracted_json)
                     result = [single_item] if single_item else []
                     logger.debug(f"Claude {self.name} JSON output: {extracted_json}")
                     return result, reasoning_data
             else:
-                # Looking for object format
+                # Looking for object format - the decoder finds the matching closing brace
                 json_start = json_text.find("{")
                 if json_start >= 0:
-                    # Find the closing brace by counting braces
-                    brace_count = 0
-                    json_end = json_start
-                    for i, char in enumerate(json_text[json_start:], json_start):
-                        if char == "{":
-                            brace_count += 1
-                        elif char == "}":
-                            brace_count -= 1
-                            if brace_count == 0:
-                                json_end = i + 1
-                                break
-                    
-                    if json_end > json_start:
-                        extracted_json = json_text[json_start:json_end]
-                        
-                        # Extract reasoning and log
+                    try:
+                        parsed_data, json_end = _decode_json_value(json_text, json_start, '}')
                         reasoning_data = self._extract_reasoning(response_text, json_start, json_end)
-                        
-                        try:
-                            parsed_data = json.loads(extracted_json)
-                            logger.debug(f"Claude {self.name} JSON output: {extracted_json}")
-                            return parsed_data, reasoning_data
-                        except json.JSONDecodeError as e:
-                            logger.debug(f"Failed to parse object JSON: {e}")
-                            # Fall through to error handling
+                        logger.debug(f"Claude {self.name} JSON output: {json_text[json_start:json_end]}")
+                        return parsed_data, reasoning_data
+                    except json.JSONDecodeError as e:
+                        logger.debug(f"Failed to parse object JSON: {e}")
+                        # Keep the reasoning that preceded the broken JSON
+                        reasoning_data = self._extract_reasoning(response_text, json_start, len(response_text))
                 
         except json.JSONDecodeError as e:
             logger.error(f"Failed to parse Claude response as JSON for {self.name}: {e}")
@@ -221,6 +795,15 @@ class BaseExtractor(ABC):
             
         return ([] if is_array else {}), reasoning_data
     
+    def _strip_markdown_fences(self, response_text: str) -> str:
+        """Return the content of the first ```json (or plain ```) fence, or the text unchanged"""
+        for fence in ("```json", "```"):
+            _, found_fence, after_fence = response_text.partition(fence)
+            if found_fence:
+                # An unclosed fence runs to the end of the response
+                return after_fence.partition("```")[0]
+        return response_text
+    
     def _extract_reasoning(self, full_response: str, json_start: int, json_end: int) -> Dict[str, str]:
         """Extract Claude's reasoning text that appears before/after JSON"""
         reasoning_data = {"before": "", "after": ""}
@@ -244,23 +827,9 @@ class BaseExtractor(ABC):
     def _save_email_backup(self, email_content: str, email_metadata: Dict) -> str:
         """Save email content to consolidated processing file"""
         try:
-            # Create directory structure: emails/
-            backup_dir = 'emails'
-            os.makedirs(backup_dir, exist_ok=True)
-            
-            # Create consolidated filename with timestamp 
-            timestamp = datetime.now().strftime('%Y-%m-%d_%H-%M-%S')
-            backup_filename = f"processing_{timestamp}.txt"
-            backup_path = os.path.join(backup_dir, backup_filename)
-            
             # Get or create the global file for this processing session
             if not hasattr(self.__class__, '_current_backup_file') or not self.__class__._current_backup_file:
-                self.__class__._current_backup_file = backup_path
-                # Write header for new session
-                with open(backup_path, 'w', encoding='utf-8') as f:
-                    f.write(f"=== EMAIL PROCESSING SESSION ===\n")
-                    f.write(f"Started: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n")
-                    f.write(f"{'='*50}\n\n")
+                self._open_backup_file()
             
             # Prepare email content (without PDF info)
             email_id = email_metadata.get('id', 'unknown')
@@ -273,7 +842,7 @@ class BaseExtractor(ABC):
 Subject: {subject}
 From: {sender}
 Date: {date}
-Processed: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}
+Processed: {_current_timestamp()}
 Extractor: {self.name}
 Attachments: {len(attachments)} files
 
@@ -284,9 +853,8 @@ EMAIL BODY:
 
 """
             
-            # Append to consolidated file
-            with open(self.__class__._current_backup_file, 'a', encoding='utf-8') as f:
-                f.write(email_entry)
+            # Hand pre-encoded bytes to the session's background writer
+            self.__class__._backup_writer.write(email_entry.encode('utf-8'))
             
             logger.debug(f"Email appended to backup: {self.__class__._current_backup_file}")
             return self.__class__._current_backup_file
@@ -295,9 +863,49 @@ EMAIL BODY:
             logger.error(f"Error saving email backup: {e}")
             return ""
     
+    def _open_backup_file(self):
+        """Start a backup session: one background writer appends every email in the session"""
+        # Create directory structure: emails/
+        backup_dir = 'emails'
+        os.makedirs(backup_dir, exist_ok=True)
+        
+        # Create consolidated filename with timestamp 
+        timestamp = datetime.now().strftime('%Y-%m-%d_%H-%M-%S')
+        backup_filename = f"processing_{timestamp}.txt"
+        backup_path = os.path.join(backup_dir, backup_filename)
+        
+        previous_writer = getattr(self.__class__, '_backup_writer', None)
+        if previous_writer:
+            previous_writer.close()
+        
+        backup_writer = BackupWriter(backup_path, BACKUP_BUFFER_SIZE)
+        self.__class__._current_backup_file = backup_path
+        self.__class__._backup_writer = backup_writer
+        
+        # Write header for new session
+        header = f"=== EMAIL PROCESSING SESSION ===\nStarted: {_current_timestamp()}\n{'='*50}\n\n"
+        backup_writer.write(header.encode('utf-8'))
+    
+    def _create_record(self, record_template: Dict, email_metadata: Dict, backup_path: str,
+                       reasoning_before: str = '', reasoning_after: str = '', **fields) -> Dict:
+        """Build a CSV record from the extractor's record template, keeping its column order"""
+        record = record_template.copy()
+        record.update(
+            email_id=email_metadata.get('id', ''),
+            email_subject=email_metadata.get('subject', ''),
+            email_sender=email_metadata.get('sender', ''),
+            email_date=email_metadata.get('date', ''),
+            email_backup_path=backup_path,
+            claude_reasoning_before=reasoning_before,
+            claude_reasoning_after=reasoning_after,
+            processing_timestamp=_current_timestamp(),
+        )
+        record.update(fields)
+        return record
+    
     def _add_email_metadata(self, extracted_items: List[Dict], email_metadata: Dict) -> List[Dict]:
         """Add common email metadata to extracted items"""
-        processed_date = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        processed_date = _current_timestamp()
         
         for item in extracted_items:
             item.update({
@@ -312,41 +920,83 @@ EMAIL BODY:
     
     def _format_prompt_template(self, email_content: str, email_metadata: Dict, **kwargs) -> str:
         """Format the prompt template with dynamic content"""
-        template = self.config.get('prompt_template', '')
-        if not template:
+        if not self._prompt_template:
             raise ValueError(f"No prompt_template found in config for {self.name} extractor")
         
+        return self._render_prompt_template(self._format_email_block(email_content, email_metadata), **kwargs)
+    
+    def _build_static_instructions(self) -> Optional[str]:
+        """Render the template without the email for use as a cached system prompt, or None if it cannot be"""
+        try:
+            return self._clean_text(self._render_prompt_template(EMAIL_IN_USER_MESSAGE))
+        except Exception as e:
+            logger.warning(f"Prompt caching disabled for {self.name}: {e}")
+            return None
+    
+    def _format_email_block(self, email_content: str, email_metadata: Dict) -> str:
+        """Format the email metadata and body as inserted into the prompt"""
         # Prepare email content with metadata (include PDF content for analysis)
         subject = self._clean_text(email_metadata.get('subject', ''))
         sender = self._clean_text(email_metadata.get('sender', ''))
         
-        # Include full email content (with PDF content for analysis)
-        body = self._clean_text(email_content)[:4000]  # Increased limit to accommodate PDF content
+        # Include email content with PDF content for analysis
+        body = self._compact_prompt_body(email_content)
+        
+        # Attachments repeat when a file is attached to several parts
+        attachment_names = list(dict.fromkeys(
+            self._clean_text(att.get('filename', '')) for att in email_metadata.get('attachments', [])
+        ))
         
-        email_content_formatted = f"""
+        return f"""
 Subject: {subject}
 From: {sender}
 Date: {email_metadata.get('date', '')}
 Body: {body}
 
-Attachments: {[self._clean_text(att.get('filename', '')) for att in email_metadata.get('attachments', [])]}
+Attachments: {attachment_names}
 """
+    
+    def _compact_prompt_body(self, email_content: str) -> str:
+        """Cleaned body with whitespace collapsed, cut to its start and end when longer than the prompt allows"""
+        head_length = self._prompt_body_head_length
+        tail_length = self._prompt_body_tail_length
         
+        # Cleaning and collapsing only shrink text, so twice the kept length is enough raw input;
+        # long bodies are not scanned far past the parts sent to Claude
+        if len(email_content) <= 2 * (head_length + tail_length):
+            body = _collapse_whitespace(self._clean_text(email_content))
+            if len(body) <= head_length + tail_length:
+                return body
+            head, tail = body[:head_length], body[len(body) - tail_length:]
+        else:
+            head = _collapse_whitespace(self._clean_text(email_content[:2 * head_length]))[:head_length]
+            tail_text = _collapse_whitespace(self._clean_text(email_content[len(email_content) - 2 * tail_length:]))
+            tail = tail_text[len(tail_text) - tail_length:]
+        return head + PROMPT_BODY_GAP + tail
+    
+    def _render_prompt_template(self, email_content_formatted: str, **kwargs) -> str:
+        """Fill the prompt template with the email block and keyword lists"""
         # Default template variables
         template_vars = {
             'email_content': email_content_formatted,
-            'swedish_keywords': ', '.join(self.config.get('keywords', {}).get('swedish', [])),
-            'english_keywords': ', '.join(self.config.get('keywords', {}).get('english', [])),
+            'swedish_keywords': self._swedish_kw_str,
+            'english_keywords': self._english_kw_str,
         }
         
         # Add any additional variables passed as kwargs
         template_vars.update(kwargs)
         
         try:
-            return template.format(**template_vars)
+            template_parts = self._prompt_template_parts
+            if template_parts is None:
+                return self._prompt_template.format(**template_vars)
+            return ''.join([
+                literal_text if field_name is None else literal_text + str(template_vars[field_name])
+                for literal_text, field_name, _, _ in template_parts
+            ])
         except KeyError as e:
             logger.error(f"Missing template variable {e} in {self.name} prompt template")
             raise ValueError(f"Template variable {e} not provided for {self.name} extractor")
         except Exception as e:
             logger.error(f"Error formatting prompt template for {self.name}: {e}")
-            raise
\ No newline at end of file
+            raise
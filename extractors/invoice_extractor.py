@@ -1,14 +1,122 @@
 from .base_extractor import BaseExtractor
-from typing import Dict, List
+from typing import Dict, List, Optional
+import anthropic
+import pandas as pd
 import re
-from datetime import datetime
 import logging
+import pickle
 
 logger = logging.getLogger(__name__)
 
+# Whitespace characters matched by \s in a str regex
+_WHITESPACE_CHARS = (
+    '\t\n\x0b\x0c\r\x1c\x1d\x1e\x1f \x85\xa0\u1680\u2000\u2001\u2002\u2003\u2004\u2005'
+    '\u2006\u2007\u2008\u2009\u200a\u2028\u2029\u202f\u205f\u3000'
+)
+
+# Currency symbols, separators and whitespace deleted from amounts (the characters of [kr$€£,:SEK\s])
+_AMOUNT_DELETE_TABLE = str.maketrans('', '', 'kr$€£,:SEK' + _WHITESPACE_CHARS)
+
+_ISO_DATE_PATTERN = re.compile(r'\d{4}-\d{2}-\d{2}')
+
+
+def _format_amount(amount_str) -> Optional[str]:
+    """Amount normalized to a float string, or None when it does not parse; shared by the row and batch cleaners"""
+    # Remove common currency symbols and separators
+    cleaned = str(amount_str).translate(_AMOUNT_DELETE_TABLE)
+    
+    # Handle decimal separators (both . and ,)
+    if '.' in cleaned and ',' in cleaned:
+        # If both, assume . is thousands separator and , is decimal
+        cleaned = cleaned.replace('.', '').replace(',', '.')
+    elif ',' in cleaned and len(cleaned.split(',')[-1]) == 2:
+        # If comma with 2 digits after, it's decimal separator
+        cleaned = cleaned.replace(',', '.')
+    
+    # Keep only digits and one decimal point
+    try:
+        return str(float(cleaned))
+    except ValueError:
+        return None
+
+# Emails the local classifier scores below this are rejected without asking Claude
+DEFAULT_LOCAL_CLASSIFIER_THRESHOLD = 0.2
+
+# Below this many extracted invoices, values are cleaned row by row (pandas overhead dominates)
+MIN_VECTORIZED_CLEAN_RECORDS = 32
+
+# Date formats accepted by _clean_date as one alternation; the format is read from the
+# last group of the match. The compact form must be the whole string so longer digit runs stay unparsed.
+_DATE_PATTERN = re.compile(
+    r'(?P<iso_y>\d{4})-(?P<iso_m>\d{1,2})-(?P<iso_d>\d{1,2})'       # YYYY-M-D
+    r'|(?P<us_m>\d{1,2})/(?P<us_d>\d{1,2})/(?P<us_y>\d{4})'         # M/D/YYYY
+    r'|(?P<eu_d>\d{1,2})\.(?P<eu_m>\d{1,2})\.(?P<eu_y>\d{4})'       # D.M.YYYY
+    r'|\A(?P<c_y>\d{4})(?P<c_m>\d{2})(?P<c_d>\d{2})\Z'              # YYYYMMDD
+)
+
+# (year, month, day) group names keyed by the last group of each _DATE_PATTERN branch
+_DATE_FORMAT_GROUPS = {
+    'iso_d': ('iso_y', 'iso_m', 'iso_d'),
+    'us_y': ('us_y', 'us_m', 'us_d'),
+    'eu_y': ('eu_y', 'eu_m', 'eu_d'),
+    'c_d': ('c_y', 'c_m', 'c_d'),
+}
+
+# Column order and empty values of an invoice CSV record; formatters fill in what they know
+INVOICE_RECORD_TEMPLATE = {
+    # Basic email metadata
+    'email_id': '',
+    'email_subject': '',
+    'email_sender': '',
+    'email_date': '',
+    'email_backup_path': '',
+    
+    # Extraction results (empty unless an invoice was extracted)
+    'extracted': False,
+    'vendor': '',
+    'invoice_number': '',
+    'amount': '',
+    'currency': '',
+    'due_date': '',
+    'invoice_date': '',
+    'ocr': '',
+    'description': '',
+    'confidence': 0.0,
+    
+    # Reasoning from Claude
+    'claude_reasoning_before': '',
+    'claude_reasoning_after': '',
+    
+    # Human evaluation (empty initially)
+    'human_evaluation': '',
+    'human_feedback': '',
+    
+    # Processing metadata
+    'processing_timestamp': '',
+}
+
 class InvoiceExtractor(BaseExtractor):
     """Extracts invoice data from emails"""
     
+    claude_max_tokens = 1000
+    
+    # Invoices rarely land in the promotions or social tabs, which hold most keyword false positives
+    default_excluded_categories = ("promotions", "social")
+    
+    def __init__(self, config_section: Dict, claude_client: anthropic.Anthropic,
+                 async_claude_client: Optional[anthropic.AsyncAnthropic] = None):
+        super().__init__(config_section, claude_client, async_claude_client)
+        
+        # Amount keywords from all languages, matched in one pass over the body
+        amount_patterns = self.config.get('amount_patterns', {})
+        self._amount_keywords = tuple(keyword for lang_patterns in amount_patterns.values() for keyword in lang_patterns)
+        self._amount_matcher = self._compile_keyword_matcher(self._amount_keywords)
+        self._business_domain_matcher = self._compile_keyword_matcher(tuple(self.config.get('business_domains', [])))
+        
+        # Optional pickled text classifier (e.g. a scikit-learn pipeline) screening emails before Claude
+        self._local_classifier = self._load_local_classifier(self.config.get('local_classifier_path'))
+        self._local_classifier_threshold = self.config.get('local_classifier_threshold', DEFAULT_LOCAL_CLASSIFIER_THRESHOLD)
+    
     @property
     def name(self) -> str:
         return "invoices"
@@ -17,196 +125,188 @@ class InvoiceExtractor(BaseExtractor):
     def output_filename(self) -> str:
         return self.config.get('output_file', 'output/invoices.csv')
     
-    def should_process(self, email_content: str, sender: str, subject: str) -> bool:
+    def should_process(self, email_content: str, sender: str, subject: str,
+                       content_lower: Optional[str] = None) -> bool:
         """Check if email contains invoice-related content"""
         # Use existing invoice detection logic from email_classifier.py
-        text_to_check = f"{subject} {sender}".lower()
-        
-        # Check for invoice indicators in subject and sender
-        invoice_keywords = self.get_search_keywords()
-        has_invoice_keywords = self._check_keywords_in_content(text_to_check, invoice_keywords)
+        if not self.should_process_metadata(sender, subject):
+            return False
         
         # Check for known business domains
-        business_domains = self.config.get('business_domains', [])
-        is_business_email = any(domain in sender.lower() for domain in business_domains)
+        if self._business_domain_matcher(sender.lower()):
+            return True
         
         # Check for amount patterns in email content
-        amount_patterns = self.config.get('amount_patterns', {})
-        all_amount_keywords = []
-        for lang_patterns in amount_patterns.values():
-            all_amount_keywords.extend(lang_patterns)
-        has_amount_pattern = self._check_keywords_in_content(email_content, all_amount_keywords)
+        if content_lower is None:
+            content_lower = email_content.lower()
+        return self._amount_matcher(content_lower)
+    
+    def should_process_metadata(self, sender: str, subject: str) -> bool:
+        """Check for invoice indicators in subject and sender"""
+        return self._search_keyword_matcher(f"{subject.lower()} {sender.lower()}")
+    
+    def _load_local_classifier(self, classifier_path: Optional[str]):
+        """Load the pickled classifier from config 'local_classifier_path', or None when unset or unreadable"""
+        if not classifier_path:
+            return None
+        try:
+            with open(classifier_path, 'rb') as classifier_file:
+                classifier = pickle.load(classifier_file)
+            logger.info(f"Local invoice classifier loaded from {classifier_path}")
+            return classifier
+        except Exception as e:
+            logger.error(f"Could not load local invoice classifier from {classifier_path}: {e}")
+            return None
+    
+    def _local_is_invoice(self, text: str) -> Optional[float]:
+        """Invoice probability from the local classifier, or None when there is none or it fails"""
+        if self._local_classifier is None:
+            return None
+        try:
+            return float(self._local_classifier.predict_proba([text])[0][1])
+        except Exception as e:
+            logger.error(f"Local invoice classifier failed: {e}")
+            return None
+    
+    def _local_rejection(self, email_content: str, email_metadata: Dict, backup_path: str) -> Optional[List[Dict]]:
+        """Reject emails the local classifier is confident are not invoices; the rest go to Claude"""
+        score = self._local_is_invoice(f"{email_metadata.get('subject', '')}\n{email_content}")
+        if score is None or score >= self._local_classifier_threshold:
+            return None
         
-        return has_invoice_keywords and (is_business_email or has_amount_pattern)
+        logger.debug(f"Local classifier rejected ({score:.2f}): {email_metadata.get('subject', '')[:50]}...")
+        reason = f"Local classifier invoice score {score:.2f} is below {self._local_classifier_threshold}"
+        return [self._format_rejected_invoice_data({}, email_metadata, {'before': reason}, backup_path, email_content)]
     
     def get_additional_search_filters(self) -> List[str]:
         """Get additional search filters for invoices (PDF attachments are common)"""
         return ["has:attachment filename:pdf"]
     
-    def extract(self, email_content: str, email_metadata: Dict) -> List[Dict]:
-        """Extract invoice data using Claude AI with configurable prompt template and reasoning capture"""
-        try:
-            # Save email backup for reference
-            backup_path = self._save_email_backup(email_content, email_metadata)
-            
-            # Use the base class template formatting method
-            prompt = self._format_prompt_template(email_content, email_metadata)
-            
-            # Use base class method for Claude API call
-            response_text = self._call_claude(prompt, max_tokens=1000)
-            if not response_text:
-                # Create record for failed Claude call
-                return [self._create_failed_processing_record(email_content, email_metadata, backup_path, "No response from Claude")]
-            
-            # Parse Claude response and extract reasoning
-            extracted_data, reasoning_data = self._parse_json_response(response_text, is_array=False)
-            
-            # Ensure extracted_data is a dict (type safety)
-            if not isinstance(extracted_data, dict):
-                extracted_data = {}
-            
-            # Create comprehensive record for ALL emails (accepted and rejected)
-            if extracted_data and extracted_data.get('is_invoice'):
-                # Format accepted invoice data
-                formatted_data = self._format_accepted_invoice_data(extracted_data, email_metadata, reasoning_data, backup_path, email_content)
-                logger.info(f"✓ Extracted invoice from {extracted_data.get('vendor', 'Unknown')}")
-                return [formatted_data]
-            else:
-                # Format rejected email data
-                formatted_data = self._format_rejected_invoice_data(extracted_data, email_metadata, reasoning_data, backup_path, email_content)
-                logger.debug(f"Claude determined this is not an invoice: {email_metadata.get('subject', '')}")
-                return [formatted_data]
-                
-        except Exception as e:
-            logger.error(f"Error extracting invoice data: {e}")
-            return [self._create_failed_processing_record(email_content, email_metadata, "", f"Processing error: {str(e)}")]
-    
+    def _build_records(self, response_text: str, email_content: str, email_metadata: Dict, backup_path: str) -> List[Dict]:
+        """Create one record per email (accepted, rejected or failed) from Claude's response"""
+        if not response_text:
+            # Create record for failed Claude call
+            return [self._create_failed_processing_record(email_content, email_metadata, backup_path, "No response from Claude")]
+        
+        # Parse Claude response and extract reasoning
+        extracted_data, reasoning_data = self._parse_json_response(response_text, is_array=False)
+        
+        # Ensure extracted_data is a dict (type safety)
+        if not isinstance(extracted_data, dict):
+            extracted_data = {}
+        
+        # Create comprehensive record for ALL emails (accepted and rejected)
+        if extracted_data and extracted_data.get('is_invoice'):
+            # Format accepted invoice data
+            formatted_data = self._format_accepted_invoice_data(extracted_data, email_metadata, reasoning_data, backup_path, email_content)
+            logger.info(f"✓ Extracted invoice from {extracted_data.get('vendor', 'Unknown')}")
+            return [formatted_data]
+        
+        # Format rejected email data
+        formatted_data = self._format_rejected_invoice_data(extracted_data, email_metadata, reasoning_data, backup_path, email_content)
+        logger.debug(f"Claude determined this is not an invoice: {email_metadata.get('subject', '')}")
+        return [formatted_data]
     
     def _format_accepted_invoice_data(self, claude_data: Dict, email_metadata: Dict, reasoning_data: Dict, backup_path: str, email_content: str) -> Dict:
         """Format accepted invoice data for CSV export with reasoning and evaluation columns"""
-        return {
-            # Basic email metadata
-            'email_id': email_metadata.get('id', ''),
-            'email_subject': email_metadata.get('subject', ''),
-            'email_sender': email_metadata.get('sender', ''),
-            'email_date': email_metadata.get('date', ''),
-            'email_backup_path': backup_path,
-            
-            # Extraction results
-            'extracted': True,
-            'vendor': (claude_data.get('vendor') or '').strip(),
-            'invoice_number': (claude_data.get('invoice_number') or '').strip(),
-            'amount': self._clean_amount(claude_data.get('amount', '')),
-            'currency': (claude_data.get('currency') or 'SEK').upper(),
-            'due_date': self._clean_date(claude_data.get('due_date', '')),
-            'invoice_date': self._clean_date(claude_data.get('invoice_date', '')),
-            'ocr': (claude_data.get('ocr') or '').strip(),
-            'description': (claude_data.get('description') or '').strip(),
-            'confidence': claude_data.get('confidence', 0.0),
-            
-            # Reasoning from Claude
-            'claude_reasoning_before': reasoning_data.get('before', ''),
-            'claude_reasoning_after': reasoning_data.get('after', ''),
-            
-            # Human evaluation (empty initially)
-            'human_evaluation': '',
-            'human_feedback': '',
-            
-            # Processing metadata
-            'processing_timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-        }
+        return self._create_record(
+            INVOICE_RECORD_TEMPLATE, email_metadata, backup_path,
+            reasoning_data.get('before', ''), reasoning_data.get('after', ''),
+            extracted=True,
+            vendor=(claude_data.get('vendor') or '').strip(),
+            invoice_number=(claude_data.get('invoice_number') or '').strip(),
+            # Amount and dates are normalized by _clean_records
+            amount=claude_data.get('amount', ''),
+            currency=(claude_data.get('currency') or 'SEK').upper(),
+            due_date=claude_data.get('due_date', ''),
+            invoice_date=claude_data.get('invoice_date', ''),
+            ocr=(claude_data.get('ocr') or '').strip(),
+            description=(claude_data.get('description') or '').strip(),
+            confidence=claude_data.get('confidence', 0.0),
+        )
     
     def _format_rejected_invoice_data(self, claude_data: Dict, email_metadata: Dict, reasoning_data: Dict, backup_path: str, email_content: str) -> Dict:
         """Format rejected email data for CSV export with reasoning"""
-        return {
-            # Basic email metadata
-            'email_id': email_metadata.get('id', ''),
-            'email_subject': email_metadata.get('subject', ''),
-            'email_sender': email_metadata.get('sender', ''),
-            'email_date': email_metadata.get('date', ''),
-            'email_backup_path': backup_path,
-            
-            # Extraction results (empty for rejected)
-            'extracted': False,
-            'vendor': '',
-            'invoice_number': '',
-            'amount': '',
-            'currency': '',
-            'due_date': '',
-            'invoice_date': '',
-            'ocr': '',
-            'description': '',
-            'confidence': claude_data.get('confidence', 0.0) if claude_data else 0.0,
-            
-            # Reasoning from Claude
-            'claude_reasoning_before': reasoning_data.get('before', ''),
-            'claude_reasoning_after': reasoning_data.get('after', ''),
-            
-            # Human evaluation (empty initially)
-            'human_evaluation': '',
-            'human_feedback': '',
-            
-            # Processing metadata
-            'processing_timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-        }
+        return self._create_record(
+            INVOICE_RECORD_TEMPLATE, email_metadata, backup_path,
+            reasoning_data.get('before', ''), reasoning_data.get('after', ''),
+            confidence=claude_data.get('confidence', 0.0) if claude_data else 0.0,
+        )
     
     def _create_failed_processing_record(self, email_content: str, email_metadata: Dict, backup_path: str, error_message: str) -> Dict:
         """Create record for emails that failed to process"""
-        return {
-            # Basic email metadata
-            'email_id': email_metadata.get('id', ''),
-            'email_subject': email_metadata.get('subject', ''),
-            'email_sender': email_metadata.get('sender', ''),
-            'email_date': email_metadata.get('date', ''),
-            'email_backup_path': backup_path,
-            
-            # Extraction results (empty for failed)
-            'extracted': False,
-            'vendor': '',
-            'invoice_number': '',
-            'amount': '',
-            'currency': '',
-            'due_date': '',
-            'invoice_date': '',
-            'ocr': '',
-            'description': '',
-            'confidence': 0.0,
-            
-            # Reasoning from Claude (error message)
-            'claude_reasoning_before': f"Processing failed: {error_message}",
-            'claude_reasoning_after': '',
-            
-            # Human evaluation (empty initially)
-            'human_evaluation': '',
-            'human_feedback': '',
-            
-            # Processing metadata
-            'processing_timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-        }
+        return self._create_record(
+            INVOICE_RECORD_TEMPLATE, email_metadata, backup_path, f"Processing failed: {error_message}",
+        )
+    
+    def _clean_records(self, records: List[Dict]) -> List[Dict]:
+        """Normalize amounts and dates of extracted invoices"""
+        return self.clean_batch(records)
+    
+    def clean_batch(self, records: List[Dict]) -> List[Dict]:
+        """Normalize amounts and dates of extracted invoice records in place, vectorized for large batches"""
+        extracted = [record for record in records if record.get('extracted')]
+        if len(extracted) < MIN_VECTORIZED_CLEAN_RECORDS:
+            for record in extracted:
+                record['amount'] = self._clean_amount(record.get('amount', ''))
+                record['due_date'] = self._clean_date(record.get('due_date', ''))
+                record['invoice_date'] = self._clean_date(record.get('invoice_date', ''))
+            return records
+        
+        amounts = self._clean_amount_series(pd.Series([record.get('amount', '') for record in extracted], dtype=object))
+        due_dates = self._clean_date_series(pd.Series([record.get('due_date', '') for record in extracted], dtype=object))
+        invoice_dates = self._clean_date_series(pd.Series([record.get('invoice_date', '') for record in extracted], dtype=object))
+        for record, amount, due_date, invoice_date in zip(extracted, amounts, due_dates, invoice_dates):
+            record['amount'] = amount
+            record['due_date'] = due_date
+            record['invoice_date'] = invoice_date
+        return records
+    
+    def _clean_amount_series(self, amounts: pd.Series) -> pd.Series:
+        """_clean_amount over a whole column: the same parser, unparsed amounts are kept"""
+        present = amounts.map(bool)
+        formatted = amounts[present].map(_format_amount)
+        parsed = formatted.notna()
+        for amount_str in amounts[present][~parsed]:
+            logger.warning(f"Could not parse amount: {amount_str}")
+        
+        cleaned = amounts.where(present, '')
+        cleaned[formatted[parsed].index] = formatted[parsed]
+        return cleaned
+    
+    def _clean_date_series(self, dates: pd.Series) -> pd.Series:
+        """Vectorized _clean_date: unparsed dates are kept"""
+        present = dates.fillna('').astype(bool)
+        text = dates.where(present, '').astype(str)
+        cleaned = dates.where(present, '')
+        resolved = ~present | text.str.match(_ISO_DATE_PATTERN)
+        groups = text[~resolved].str.extract(_DATE_PATTERN)
+        
+        for year_group, month_group, day_group in _DATE_FORMAT_GROUPS.values():
+            matched = groups[year_group].notna()
+            if not matched.any():
+                continue
+            parts = groups.loc[matched, [year_group, month_group, day_group]].astype(int)
+            cleaned[parts.index] = (
+                parts[year_group].map('{:04d}'.format) + '-' + parts[month_group].map('{:02d}'.format)
+                + '-' + parts[day_group].map('{:02d}'.format)
+            )
+            resolved[parts.index] = True
+        
+        for date_str in dates[~resolved]:
+            logger.warning(f"Could not parse date: {date_str}")
+        return cleaned
     
     def _clean_amount(self, amount_str: str) -> str:
         """Clean and normalize amount string"""
         if not amount_str:
             return ''
         
-        # Remove common currency symbols and separators
-        cleaned = re.sub(r'[kr$€£,:SEK\s]', '', str(amount_str))
-        
-        # Handle decimal separators (both . and ,)
-        if '.' in cleaned and ',' in cleaned:
-            # If both, assume . is thousands separator and , is decimal
-            cleaned = cleaned.replace('.', '').replace(',', '.')
-        elif ',' in cleaned and len(cleaned.split(',')[-1]) == 2:
-            # If comma with 2 digits after, it's decimal separator
-            cleaned = cleaned.replace(',', '.')
-        
-        # Keep only digits and one decimal point
-        try:
-            float_val = float(cleaned)
-            return str(float_val)
-        except ValueError:
+        formatted = _format_amount(amount_str)
+        if formatted is None:
             logger.warning(f"Could not parse amount: {amount_str}")
             return amount_str
+        return formatted
     
     def _clean_date(self, date_str: str) -> str:
         """Clean and normalize date string to YYYY-MM-DD"""
@@ -214,35 +314,14 @@ class InvoiceExtractor(BaseExtractor):
             return ''
         
         # If already in YYYY-MM-DD format, return as-is
-        if re.match(r'\d{4}-\d{2}-\d{2}', date_str):
+        if _ISO_DATE_PATTERN.match(date_str):
             return date_str
         
-        # Try to parse various date formats
-        date_patterns = [
-            r'(\d{4})-(\d{1,2})-(\d{1,2})',  # YYYY-M-D
-            r'(\d{1,2})/(\d{1,2})/(\d{4})',  # M/D/YYYY
-            r'(\d{1,2})\.(\d{1,2})\.(\d{4})', # D.M.YYYY
-            r'(\d{4})(\d{2})(\d{2})',        # YYYYMMDD
-        ]
-        
-        for pattern in date_patterns:
-            match = re.search(pattern, date_str)
-            if match:
-                groups = match.groups()
-                if len(groups) == 3:
-                    try:
-                        if len(groups[0]) == 4:  # First group is year
-                            year, month, day = groups
-                        else:  # Last group is year
-                            if '/' in date_str:
-                                month, day, year = groups  # US format
-                            else:
-                                day, month, year = groups  # European format
-                        
-                        # Ensure proper formatting
-                        return f"{int(year):04d}-{int(month):02d}-{int(day):02d}"
-                    except ValueError:
-                        continue
+        # One search covers every accepted format; the branch that matched picks the field order
+        match = _DATE_PATTERN.search(date_str)
+        if match:
+            year_group, month_group, day_group = _DATE_FORMAT_GROUPS[match.lastgroup]
+            return f"{int(match[year_group]):04d}-{int(match[month_group]):02d}-{int(match[day_group]):02d}"
         
         logger.warning(f"Could not parse date: {date_str}")
         return date_str
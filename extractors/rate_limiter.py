@@ -0,0 +1,96 @@
+import asyncio
+import logging
+import threading
+import time
+from typing import Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+# Fallback wait when a 429 response carries no retry-after header
+DEFAULT_RETRY_AFTER_SECONDS = 1.0
+
+# Shared limiters keyed by (requests_per_minute, input_tokens_per_minute)
+_rate_limiters: Dict[tuple, "TokenBucketRateLimiter"] = {}
+
+
+class TokenBucketRateLimiter:
+    """Paces Claude requests against requests-per-minute and input-tokens-per-minute budgets"""
+
+    def __init__(self, requests_per_minute: int, input_tokens_per_minute: int):
+        self.requests_per_minute = requests_per_minute
+        self.input_tokens_per_minute = input_tokens_per_minute
+        self._available_requests = float(requests_per_minute)
+        self._available_tokens = float(input_tokens_per_minute)
+        self._last_refill = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        """Add capacity earned since the last refill, capped at one minute's budget"""
+        now = time.monotonic()
+        elapsed_minutes = (now - self._last_refill) / 60
+        self._last_refill = now
+        self._available_requests = min(
+            self.requests_per_minute,
+            self._available_requests + elapsed_minutes * self.requests_per_minute,
+        )
+        self._available_tokens = min(
+            self.input_tokens_per_minute,
+            self._available_tokens + elapsed_minutes * self.input_tokens_per_minute,
+        )
+
+    def _reserve(self, tokens: int) -> float:
+        """Reserve capacity for one request and return seconds to wait before sending it"""
+        with self._lock:
+            self._refill()
+            # Capacity may go negative; the deficit is paid back by waiting
+            self._available_requests -= 1
+            self._available_tokens -= min(tokens, self.input_tokens_per_minute)
+
+            request_wait = -self._available_requests * 60 / self.requests_per_minute
+            token_wait = -self._available_tokens * 60 / self.input_tokens_per_minute
+            return max(0.0, request_wait, token_wait)
+
+    def acquire(self, tokens: int):
+        """Block until a request with the given input token estimate may be sent"""
+        wait_seconds = self._reserve(tokens)
+        if wait_seconds > 0:
+            logger.debug(f"Rate limiter waiting {wait_seconds:.2f}s before Claude request")
+            time.sleep(wait_seconds)
+
+    async def acquire_async(self, tokens: int):
+        """Wait without blocking the event loop until a request may be sent"""
+        wait_seconds = self._reserve(tokens)
+        if wait_seconds > 0:
+            logger.debug(f"Rate limiter waiting {wait_seconds:.2f}s before Claude request")
+            await asyncio.sleep(wait_seconds)
+
+
+def get_rate_limiter(rate_limits: Optional[Dict]) -> Optional[TokenBucketRateLimiter]:
+    """Get the shared limiter for the configured limits, or None when no limits are configured"""
+    if not rate_limits:
+        return None
+
+    requests_per_minute = rate_limits.get('requests_per_minute')
+    input_tokens_per_minute = rate_limits.get('input_tokens_per_minute')
+    if not requests_per_minute or not input_tokens_per_minute:
+        raise ValueError("rate_limits requires both requests_per_minute and input_tokens_per_minute")
+
+    key = (requests_per_minute, input_tokens_per_minute)
+    if key not in _rate_limiters:
+        _rate_limiters[key] = TokenBucketRateLimiter(requests_per_minute, input_tokens_per_minute)
+    return _rate_limiters[key]
+
+
+def estimate_prompt_tokens(prompt: str) -> int:
+    """Rough input token estimate (about four characters per token)"""
+    return len(prompt) // 4
+
+
+def get_retry_after_seconds(error: Exception) -> float:
+    """Read the retry-after header from a rate limit error, falling back to a default wait"""
+    response = getattr(error, 'response', None)
+    headers = getattr(response, 'headers', None) or {}
+    try:
+        return float(headers.get('retry-after', DEFAULT_RETRY_AFTER_SECONDS))
+    except (TypeError, ValueError):
+        return DEFAULT_RETRY_AFTER_SECONDS
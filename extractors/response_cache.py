@@ -0,0 +1,101 @@
+import hashlib
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+from typing import Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CACHE_PATH = 'data/claude_response_cache.db'
+DEFAULT_TTL_DAYS = 7
+
+# Emails Claude rejected rarely change their verdict, so their responses are kept longer
+DEFAULT_REJECTED_TTL_DAYS = 30
+
+_URL_PATTERN = re.compile(r'https?://\S+')
+
+# Shared caches keyed by database path
+_response_caches: Dict[str, "ResponseCache"] = {}
+
+
+class ResponseCache:
+    """SQLite-backed cache of Claude response texts keyed by request settings and prompt hash"""
+
+    def __init__(self, db_path: str, ttl_seconds: float):
+        self.db_path = db_path
+        self.ttl_seconds = ttl_seconds
+
+        db_dir = os.path.dirname(db_path)
+        if db_dir:
+            os.makedirs(db_dir, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(db_path, check_same_thread=False)
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "cache_key TEXT PRIMARY KEY, response_text TEXT NOT NULL, expires_at REAL NOT NULL)"
+        )
+        self._connection.commit()
+
+    @staticmethod
+    def make_key(model: str, max_tokens: int, template_version: str, prompt: str) -> str:
+        """Build the cache key from the request settings and a digest of the cleaned prompt"""
+        key_source = f"{model}\0{max_tokens}\0{template_version}\0{prompt}"
+        return hashlib.blake2b(key_source.encode('utf-8'), digest_size=16).hexdigest()
+
+    @staticmethod
+    def make_near_duplicate_key(extractor_name: str, model: str, max_tokens: int, template_version: str,
+                                sender: str, subject: str, email_content: str) -> str:
+        """Build a key shared by emails that differ only in URLs (tracking links), case or whitespace.
+        
+        The whole email, PDF text included, is fingerprinted: invoices from one template often differ
+        only in the amounts and dates of the attached PDF.
+        """
+        text = f"{subject}\n{email_content}".lower()
+        text = ' '.join(_URL_PATTERN.sub('', text).split())
+        key_source = (f"near-duplicate\0{extractor_name}\0{model}\0{max_tokens}\0{template_version}\0"
+                      f"{sender.lower()}\0{text}")
+        return hashlib.blake2b(key_source.encode('utf-8'), digest_size=16).hexdigest()
+
+    @staticmethod
+    def make_rejection_key(extractor_name: str, model: str, max_tokens: int, template_version: str,
+                           subject: str, email_content: str) -> str:
+        """Build the key of a remembered rejection from the raw email, checked before any prompt is built"""
+        key_source = f"rejected\0{extractor_name}\0{model}\0{max_tokens}\0{template_version}\0{subject}\0{email_content}"
+        return hashlib.blake2b(key_source.encode('utf-8', 'surrogatepass'), digest_size=16).hexdigest()
+    
+    def get(self, cache_key: str) -> Optional[str]:
+        """Return the cached response text, or None when missing or expired"""
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT response_text FROM responses WHERE cache_key = ? AND expires_at > ?",
+                (cache_key, time.time()),
+            ).fetchone()
+        return row[0] if row else None
+
+    def set(self, cache_key: str, response_text: str, ttl_seconds: Optional[float] = None):
+        """Store a response text until the TTL (default: the cache TTL) expires"""
+        if ttl_seconds is None:
+            ttl_seconds = self.ttl_seconds
+        with self._lock:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO responses (cache_key, response_text, expires_at) VALUES (?, ?, ?)",
+                (cache_key, response_text, time.time() + ttl_seconds),
+            )
+            self._connection.commit()
+
+
+def get_response_cache(cache_config: Optional[Dict]) -> Optional[ResponseCache]:
+    """Get the shared response cache for the config, or None when caching is disabled"""
+    if not cache_config or not cache_config.get('enabled', False):
+        return None
+
+    db_path = cache_config.get('path', DEFAULT_CACHE_PATH)
+    if db_path not in _response_caches:
+        ttl_seconds = cache_config.get('ttl_days', DEFAULT_TTL_DAYS) * 86400
+        _response_caches[db_path] = ResponseCache(db_path, ttl_seconds)
+        logger.info(f"Claude response cache enabled: {db_path}")
+    return _response_caches[db_path]
@@ -3,19 +3,257 @@ import base64
 import email
 import logging
 import io
+import random
 import signal
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from itertools import repeat
 from datetime import datetime, timedelta
-from typing import List, Dict, Optional
+from functools import cached_property, lru_cache
+from typing import Callable, List, Dict, Optional, Tuple, Union
 from google.auth.transport.requests import Request
 from google.oauth2.credentials import Credentials
 from google_auth_oauthlib.flow import InstalledAppFlow
 from googleapiclient.discovery import build
 from googleapiclient.errors import HttpError
-import time
+from googleapiclient.model import JsonModel
 import pypdf
 
+# PDFium extracts text far faster than pure-Python pypdf; pypdf remains the fallback
+try:
+    import pypdfium2 as pdfium
+except ImportError:
+    pdfium = None
+
+# orjson decodes the (often large) Gmail API responses several times faster than json
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
 logger = logging.getLogger(__name__)
 
+# Headers requested when only metadata is fetched to pre-filter messages
+METADATA_HEADERS = ["Subject", "From", "Date"]
+
+# messages.get requests sent per batch HTTP request; Gmail allows 100 but rate limits batches above 50
+GMAIL_BATCH_SIZE = 50
+
+# attachments.get requests per batch; kept small because every response carries a whole PDF
+ATTACHMENT_BATCH_SIZE = 10
+
+# Fetched emails each GmailServer keeps for get_email_content, least recently used dropped first
+EMAIL_CACHE_SIZE = 1024
+
+# Retries (with exponential backoff) of a single Gmail request on rate limits and server errors
+GMAIL_NUM_RETRIES = 3
+
+# Statuses of throttled or transiently failed requests inside a batch, retried after a backoff
+GMAIL_RETRYABLE_STATUSES = (403, 429, 500, 503)
+GMAIL_MAX_BACKOFF_SECONDS = 64
+
+# Authenticated services shared by GmailServer instances, keyed by credentials/token files,
+# scopes and the token file's modification time so a rewritten token is picked up
+_services: Dict[Tuple, Tuple[Credentials, object]] = {}
+
+# PDFs with at least this many pages have their pages extracted in parallel processes;
+# shorter ones are read in-process where pickling the PDF would cost more than it saves
+PARALLEL_PDF_MIN_PAGES = 3
+
+# Worker processes shared by all PDF extractions, started on first use
+_pdf_pool: Optional[ProcessPoolExecutor] = None
+
+
+def _get_pdf_pool(max_workers: Optional[int] = None) -> ProcessPoolExecutor:
+    """Get the shared process pool for PDF text extraction (max_workers: its size when started, default CPU count)"""
+    global _pdf_pool
+    if _pdf_pool is None:
+        _pdf_pool = ProcessPoolExecutor(max_workers=max_workers or os.cpu_count())
+    return _pdf_pool
+
+
+def _discard_pdf_pool():
+    """Kill the shared pool's workers (broken, or still parsing past a timeout) so the next extraction starts a fresh one"""
+    global _pdf_pool
+    pool, _pdf_pool = _pdf_pool, None
+    if pool is None:
+        return
+    # ProcessPoolExecutor cannot stop a running task; its workers are only reachable through
+    # CPython's private _processes dict (pid -> Process, None once the pool has shut down)
+    if not hasattr(pool, "_processes"):
+        logger.warning("Cannot terminate PDF worker processes on this Python; a hung parse runs until it ends")
+    else:
+        for process in list((pool._processes or {}).values()):
+            process.terminate()
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+@lru_cache(maxsize=32)
+def _keyword_group(field: str, keywords: Tuple[str, ...]) -> str:
+    """One search term matching any keyword in the field or the message, e.g. (subject:(a OR b) OR (a OR b))"""
+    # Multi-word keywords are quoted so Gmail matches them as phrases
+    joined = " OR ".join(f'"{keyword}"' if " " in keyword else keyword for keyword in keywords)
+    return f"({field}:({joined}) OR ({joined}))"
+
+
+def _has_text(page_text: str) -> bool:
+    """Whether extracted page text is more than whitespace, checked without copying it"""
+    return bool(page_text) and not page_text.isspace()
+
+
+def _extract_pdf_page_text(pdf_path: str, page_index: int) -> str:
+    """Extract one page's text from a PDF file; module-level so pool worker processes can run it"""
+    try:
+        if pdfium is not None:
+            pdf = pdfium.PdfDocument(pdf_path)
+            try:
+                page = pdf[page_index]
+                text_page = page.get_textpage()
+                page_text = text_page.get_text_range().replace("\r\n", "\n")
+                text_page.close()
+                page.close()
+                return page_text
+            finally:
+                pdf.close()
+
+        pdf_reader = pypdf.PdfReader(pdf_path)
+        if pdf_reader.is_encrypted:
+            pdf_reader.decrypt("")
+        return pdf_reader.pages[page_index].extract_text()
+    except Exception as e:
+        logger.warning(f"Error extracting text from page {page_index + 1}: {e}")
+        return ""
+
+
+def _read_pdf_pages_pdfium(
+    pdf_bytes: bytes, filename: str, skip_protected: bool,
+    read_in_parallel: Optional[Callable[[int], List[str]]] = None,
+) -> Optional[List[str]]:
+    """Page texts read with PDFium, or None when the PDF is password protected.
+
+    read_in_parallel(page_count) reads PDFs of PARALLEL_PDF_MIN_PAGES pages or more instead.
+    """
+    try:
+        # Without a password PDFium opens only PDFs whose user password is empty
+        pdf = pdfium.PdfDocument(pdf_bytes)
+    except pdfium.PdfiumError as e:
+        logger.warning(f"Could not open PDF {filename}: {e}")
+        return None
+
+    try:
+        # The security handler revision is -1 for unencrypted documents
+        if skip_protected and pdfium.raw.FPDF_GetSecurityHandlerRevision(pdf.raw) != -1:
+            logger.warning(f"PDF {filename} is password protected, skipping")
+            return None
+
+        page_count = len(pdf)
+        if read_in_parallel is not None and page_count >= PARALLEL_PDF_MIN_PAGES:
+            return read_in_parallel(page_count)
+
+        text_content = []
+        for page_num in range(page_count):
+            try:
+                page = pdf[page_num]
+                text_page = page.get_textpage()
+                page_text = text_page.get_text_range().replace("\r\n", "\n")
+                text_page.close()
+                page.close()
+                if _has_text(page_text):
+                    text_content.append(page_text)
+            except Exception as e:
+                logger.warning(
+                    f"Error extracting text from page {page_num + 1} of {filename}: {e}"
+                )
+                continue
+        return text_content
+    finally:
+        pdf.close()
+
+
+def _read_pdf_pages_pypdf(
+    pdf_bytes: bytes, filename: str, skip_protected: bool,
+    read_in_parallel: Optional[Callable[[int], List[str]]] = None,
+) -> Optional[List[str]]:
+    """Page texts read with pypdf, or None when the PDF is password protected.
+
+    read_in_parallel(page_count) reads PDFs of PARALLEL_PDF_MIN_PAGES pages or more instead.
+    """
+    pdf_reader = pypdf.PdfReader(io.BytesIO(pdf_bytes))
+
+    # Check if password protected
+    if pdf_reader.is_encrypted:
+        if skip_protected:
+            logger.warning(f"PDF {filename} is password protected, skipping")
+            return None
+        # Try empty password
+        if not pdf_reader.decrypt(""):
+            logger.warning(f"Could not decrypt PDF {filename}")
+            return None
+
+    page_count = len(pdf_reader.pages)
+    if read_in_parallel is not None and page_count >= PARALLEL_PDF_MIN_PAGES:
+        return read_in_parallel(page_count)
+
+    text_content = []
+    for page_num, page in enumerate(pdf_reader.pages):
+        try:
+            page_text = page.extract_text()
+            if _has_text(page_text):
+                text_content.append(page_text)
+        except Exception as e:
+            logger.warning(
+                f"Error extracting text from page {page_num + 1} of {filename}: {e}"
+            )
+            continue
+    return text_content
+
+
+def _read_pdf_pages(
+    pdf_bytes: bytes, filename: str, skip_protected: bool,
+    read_in_parallel: Optional[Callable[[int], List[str]]] = None,
+) -> Optional[List[str]]:
+    """Non-blank page texts read with PDFium when installed, otherwise pypdf"""
+    if pdfium is not None:
+        return _read_pdf_pages_pdfium(pdf_bytes, filename, skip_protected, read_in_parallel)
+    return _read_pdf_pages_pypdf(pdf_bytes, filename, skip_protected, read_in_parallel)
+
+
+def _read_pdf_pages_or_count(pdf_bytes: bytes, filename: str, skip_protected: bool) -> Union[None, List[str], int]:
+    """Page texts as _read_pdf_pages, or just the page count of PDFs long enough to read in parallel.
+
+    Module-level so a pool worker process can run it; the caller then spreads the pages over the pool.
+    """
+    return _read_pdf_pages(pdf_bytes, filename, skip_protected, lambda page_count: page_count)
+
+
+def _extract_pdf_document_text(pdf_bytes: bytes, filename: str, skip_protected: bool) -> str:
+    """Extract a whole PDF's text, empty when it has none; module-level so pool worker processes can run it"""
+    try:
+        text_content = _read_pdf_pages(pdf_bytes, filename, skip_protected)
+        return "\n".join(text_content) if text_content else ""
+    except Exception as e:
+        logger.error(f"Error extracting text from PDF {filename}: {e}")
+        return ""
+
+
+class GmailJsonModel(JsonModel):
+    """Gmail API response model decoding JSON bodies with orjson when it is installed"""
+
+    def deserialize(self, content):
+        if orjson is None:
+            return super().deserialize(content)
+        try:
+            body = orjson.loads(content)
+        except orjson.JSONDecodeError:
+            return super().deserialize(content)
+        if self._data_wrapper and isinstance(body, dict) and "data" in body:
+            body = body["data"]
+        return body
+
 
 class GmailServer:
     def __init__(
@@ -30,10 +268,19 @@ class GmailServer:
         self.scopes = scopes
         self.config = config or {}
         self.service = None
+        # Recently fetched email data by message id, oldest first, so asking again needs no Gmail requests
+        self._email_cache: "OrderedDict[str, Dict]" = OrderedDict()
         self._authenticate()
 
     def _authenticate(self):
-        """Authenticate with Gmail API"""
+        """Authenticate with Gmail API, reusing the service of an earlier instance while its token is valid"""
+        cache_key = self._get_service_cache_key()
+        cached = _services.get(cache_key) if cache_key else None
+        if cached and cached[0].valid:
+            self.service = cached[1]
+            logger.debug("Reusing authenticated Gmail service")
+            return
+
         creds = None
 
         # Load existing token
@@ -66,13 +313,32 @@ class GmailServer:
             with open(self.token_file, "w") as token:
                 token.write(creds.to_json())
 
-        self.service = build("gmail", "v1", credentials=creds)
+        # The discovery document ships with the client library, so building needs no network request
+        self.service = build(
+            "gmail", "v1", credentials=creds, static_discovery=True, model=GmailJsonModel()
+        )
         logger.info("Gmail authentication successful")
 
+        cache_key = self._get_service_cache_key()
+        if cache_key:
+            _services[cache_key] = (creds, self.service)
+
+    def _get_service_cache_key(self) -> Optional[Tuple]:
+        """Key of this instance's shared service, or None when there is no token file yet"""
+        try:
+            token_mtime = os.path.getmtime(self.token_file)
+        except OSError:
+            return None
+        return (self.credentials_file, self.token_file, tuple(self.scopes), token_mtime)
+
     def _build_search_query(
-        self, start_date: datetime, keywords: List[str] = None, additional_filters: List[str] = None, end_date: datetime = None
+        self, start_date: datetime, keywords: List[str] = None, additional_filters: List[str] = None, end_date: datetime = None,
+        exclusions: List[str] = None,
     ) -> str:
-        """Build Gmail search query from provided keywords and filters"""
+        """Build Gmail search query from provided keywords and filters.
+
+        exclusions are terms every result must satisfy (e.g. -category:social), applied by Gmail's index.
+        """
         if end_date:
             date_filter = f'after:{start_date.strftime("%Y/%m/%d")} before:{end_date.strftime("%Y/%m/%d")}'
         else:
@@ -83,12 +349,9 @@ class GmailServer:
 
         if keywords:
             # Use provided keywords (from extractors)
-            for keyword in keywords:
-                keyword_terms.append(f"(subject:{keyword} OR {keyword})")
+            keyword_terms.append(_keyword_group("subject", tuple(keywords)))
         else:
             # Fallback to legacy config for backward compatibility
-            keyword_filters = []
-
             # Add invoice indicator keywords (Swedish and English)
             if self.config.get("invoice_keywords", {}).get("invoice_indicators"):
                 swedish_indicators = self.config["invoice_keywords"][
@@ -98,20 +361,18 @@ class GmailServer:
                     "invoice_indicators"
                 ].get("english", [])
 
-                for keyword in swedish_indicators + english_indicators:
-                    # Search both subject and body for each keyword
-                    keyword_filters.append(f"(subject:{keyword} OR {keyword})")
+                # Search both subject and body for each keyword
+                if swedish_indicators or english_indicators:
+                    keyword_terms.append(_keyword_group("subject", tuple(swedish_indicators + english_indicators)))
 
             # Add common vendor keywords
             if self.config.get("common_vendors"):
                 swedish_vendors = self.config["common_vendors"].get("swedish", [])
                 english_vendors = self.config["common_vendors"].get("english", [])
 
-                for vendor in swedish_vendors + english_vendors:
-                    # Search for vendor in sender field and body content
-                    keyword_filters.append(f"(from:{vendor} OR {vendor})")
-
-            keyword_terms = keyword_filters
+                # Search for vendor in sender field and body content
+                if swedish_vendors or english_vendors:
+                    keyword_terms.append(_keyword_group("from", tuple(swedish_vendors + english_vendors)))
 
         # Combine with date filter
         query_parts = [date_filter]
@@ -131,6 +392,9 @@ class GmailServer:
             # Fallback to basic query if no keywords
             query_parts.append("(invoice OR faktura OR räkning OR bill)")
 
+        if exclusions:
+            query_parts.extend(exclusions)
+
         return " ".join(query_parts)
 
     def fetch_emails(self, days_back: int = 30, max_emails: int = 100) -> List[Dict]:
@@ -165,29 +429,13 @@ class GmailServer:
                 self.service.users()
                 .messages()
                 .list(userId="me", q=query, maxResults=max_emails)
-                .execute()
+                .execute(num_retries=GMAIL_NUM_RETRIES)
             )
 
             messages = results.get("messages", [])
             logger.info(f"Found {len(messages)} potential invoice emails")
 
-            emails = []
-            for i, message in enumerate(messages):
-                try:
-                    email_data = self._get_email_details(message["id"])
-                    if email_data:
-                        emails.append(email_data)
-                        logger.info(
-                            f"Processed email {i+1}/{len(messages)}: {email_data['subject'][:50]}..."
-                        )
-
-                    # Rate limiting - be nice to Gmail API
-                    if i > 0 and i % 10 == 0:
-                        time.sleep(1)
-
-                except Exception as e:
-                    logger.error(f"Error processing message {message['id']}: {e}")
-                    continue
+            emails = self._get_email_details_many(messages)
 
             logger.info(f"Successfully processed {len(emails)} emails")
             return emails
@@ -200,21 +448,183 @@ class GmailServer:
             return []
 
     def _get_email_details(self, message_id: str) -> Optional[Dict]:
-        """Get detailed information for a specific email"""
+        """Get detailed information for a specific email, from the cache when recently fetched"""
+        email_data = self._email_cache.get(message_id)
+        if email_data is not None:
+            self._email_cache.move_to_end(message_id)
+            return email_data
+
         try:
-            message = (
-                self.service.users()
-                .messages()
-                .get(userId="me", id=message_id, format="full")
-                .execute()
+            message = self._fetch_message(message_id)
+        except Exception as e:
+            logger.error(f"Error getting email details for {message_id}: {e}")
+            return None
+        email_data = self._build_email_data(message_id, message)
+        if email_data:
+            self._remember_email(email_data)
+        return email_data
+
+    def _remember_email(self, email_data: Dict):
+        """Cache fetched email data, dropping the least recently used beyond EMAIL_CACHE_SIZE"""
+        self._email_cache[email_data["id"]] = email_data
+        self._email_cache.move_to_end(email_data["id"])
+        if len(self._email_cache) > EMAIL_CACHE_SIZE:
+            self._email_cache.popitem(last=False)
+
+    def _get_email_details_many(self, messages: List[Dict]) -> List[Dict]:
+        """Get details for listed messages, fetching them in batches and keeping list order"""
+        fetched = self._fetch_messages([message["id"] for message in messages])
+        pdf_bytes_by_message = self._fetch_pdf_attachments(fetched)
+        # With several PDFs, parse them side by side instead of one per email
+        pdf_texts = {}
+        if len(pdf_bytes_by_message) > 1:
+            pdf_texts = self._extract_pdf_texts(fetched, pdf_bytes_by_message)
+
+        emails = []
+        for i, message in enumerate(messages):
+            if message["id"] not in fetched:
+                continue
+            email_data = self._build_email_data(
+                message["id"],
+                fetched[message["id"]],
+                pdf_bytes_by_message.get(message["id"]),
+                pdf_texts.get(message["id"]),
             )
+            if email_data:
+                emails.append(email_data)
+                self._remember_email(email_data)
+                logger.debug(
+                    f"Processed email {i+1}/{len(messages)}: {email_data['subject'][:50]}..."
+                )
+        return emails
 
+    def _filter_by_metadata(
+        self, messages: List[Dict], metadata_filter: Callable[[str, str], bool]
+    ) -> List[Dict]:
+        """Keep listed messages whose sender and subject pass metadata_filter, fetching headers only"""
+        fetched = self._fetch_messages([message["id"] for message in messages], message_format="metadata")
+
+        survivors = []
+        for message in messages:
+            if message["id"] not in fetched:
+                continue
+            header_values = self._header_map(fetched[message["id"]].get("payload", {}).get("headers", []))
+            sender = header_values.get("from") or "Unknown Sender"
+            subject = header_values.get("subject") or "No Subject"
+            if metadata_filter(sender, subject):
+                survivors.append(message)
+        return survivors
+
+    def _fetch_messages(self, message_ids: List[str], message_format: str = "full") -> Dict[str, Dict]:
+        """Fetch messages by id in batch HTTP requests; failed fetches are logged and left out"""
+        batch_size = self.config.get("processing", {}).get("gmail_batch_size", GMAIL_BATCH_SIZE)
+        # A batch rejects repeated request ids
+        requests = {
+            message_id: self._message_request(message_id, message_format)
+            for message_id in dict.fromkeys(message_ids)
+        }
+        return self._execute_batched(requests, batch_size, "message")
+
+    def _execute_batched(self, requests: Dict[str, object], batch_size: int, kind: str) -> Dict[str, Dict]:
+        """Run requests keyed by request id in batch HTTP requests; failures are logged and left out.
+
+        Requests Gmail throttled or failed transiently are retried in a new batch after an exponential backoff.
+        """
+        responses = {}
+        retry_ids = []
+
+        def on_response(request_id, response, exception):
+            if exception is None:
+                responses[request_id] = response
+            elif self._is_retryable_error(exception) and attempt < GMAIL_NUM_RETRIES:
+                retry_ids.append(request_id)
+            else:
+                logger.error(f"Error processing {kind} {request_id}: {exception}")
+
+        request_ids = list(requests)
+        for attempt in range(GMAIL_NUM_RETRIES + 1):
+            if attempt:
+                delay = min(2 ** attempt + random.random(), GMAIL_MAX_BACKOFF_SECONDS)
+                logger.warning(f"Gmail throttled {len(retry_ids)} {kind} requests, retrying in {delay:.1f}s")
+                time.sleep(delay)
+                request_ids, retry_ids = retry_ids, []
+
+            for start in range(0, len(request_ids), batch_size):
+                chunk = request_ids[start:start + batch_size]
+                batch = self.service.new_batch_http_request(callback=on_response)
+                for request_id in chunk:
+                    batch.add(requests[request_id], request_id=request_id)
+                try:
+                    batch.execute()
+                except Exception as e:
+                    logger.error(f"Error fetching batch of {len(chunk)} {kind}s: {e}")
+
+            if not retry_ids:
+                break
+
+        return responses
+
+    @staticmethod
+    def _is_retryable_error(exception: Exception) -> bool:
+        """Whether a batched request failed from rate limiting or a transient server error"""
+        if not isinstance(exception, HttpError):
+            return False
+        return exception.resp.status in GMAIL_RETRYABLE_STATUSES
+
+    def _fetch_pdf_attachments(self, messages: Dict[str, Dict]) -> Dict[str, bytes]:
+        """Download the PDF that _process_pdf_attachments will read for each message, batched, keyed by message id"""
+        if not self._pdf_enabled:
+            return {}
+
+        requests = {}
+        for message_id, message in messages.items():
+            pdf_attachment = self._select_pdf_attachment(self._get_attachment_info(message.get("payload", {})))
+            if pdf_attachment and self._pdf_within_size_limit(pdf_attachment["filename"], pdf_attachment.get("size", 0)):
+                requests[message_id] = (
+                    self.service.users()
+                    .messages()
+                    .attachments()
+                    .get(userId="me", messageId=message_id, id=pdf_attachment["attachmentId"])
+                )
+        if not requests:
+            return {}
+
+        pdf_bytes_by_message = {}
+        for message_id, attachment in self._execute_batched(requests, ATTACHMENT_BATCH_SIZE, "attachment").items():
+            try:
+                pdf_bytes_by_message[message_id] = base64.urlsafe_b64decode(attachment["data"])
+            except Exception as e:
+                # Left out, so _process_pdf_attachments retries the download on its own
+                logger.error(f"Error decoding PDF attachment of message {message_id}: {e}")
+        return pdf_bytes_by_message
+
+    def _message_request(self, message_id: str, message_format: str):
+        """messages.get request for one message; metadata requests carry only METADATA_HEADERS"""
+        if message_format == "metadata":
+            return self.service.users().messages().get(
+                userId="me", id=message_id, format="metadata", metadataHeaders=METADATA_HEADERS
+            )
+        return self.service.users().messages().get(userId="me", id=message_id, format=message_format)
+
+    def _fetch_message(self, message_id: str) -> Dict:
+        """Fetch one full message"""
+        return self._message_request(message_id, "full").execute(num_retries=GMAIL_NUM_RETRIES)
+
+    def _build_email_data(
+        self, message_id: str, message: Dict, pdf_bytes: Optional[bytes] = None, pdf_text: Optional[str] = None
+    ) -> Optional[Dict]:
+        """Turn a fetched message into email data with PDF text when enabled.
+
+        pdf_bytes is the PDF if already downloaded, and pdf_text its text if already extracted.
+        """
+        try:
             headers = message["payload"].get("headers", [])
 
             # Extract header information
-            subject = self._get_header_value(headers, "Subject") or "No Subject"
-            sender = self._get_header_value(headers, "From") or "Unknown Sender"
-            date_header = self._get_header_value(headers, "Date")
+            header_values = self._header_map(headers)
+            subject = header_values.get("subject") or "No Subject"
+            sender = header_values.get("from") or "Unknown Sender"
+            date_header = header_values.get("date")
 
             # Parse date
             email_date = self._parse_email_date(date_header)
@@ -236,7 +646,7 @@ class GmailServer:
             }
 
             # Process PDF attachments if enabled
-            pdf_data = self._process_pdf_attachments(message, email_data)
+            pdf_data = self._process_pdf_attachments(message, email_data, pdf_bytes, pdf_text)
             email_data.update(pdf_data)
 
             return email_data
@@ -245,12 +655,10 @@ class GmailServer:
             logger.error(f"Error getting email details for {message_id}: {e}")
             return None
 
-    def _get_header_value(self, headers: List[Dict], name: str) -> Optional[str]:
-        """Extract header value by name"""
-        for header in headers:
-            if header["name"].lower() == name.lower():
-                return header["value"]
-        return None
+    @staticmethod
+    def _header_map(headers: List[Dict]) -> Dict[str, str]:
+        """Header values keyed by lowercase name; the first of repeated headers wins"""
+        return {header["name"].lower(): header["value"] for header in reversed(headers)}
 
     def _parse_email_date(self, date_string: str) -> Optional[str]:
         """Parse email date string to ISO format"""
@@ -268,34 +676,34 @@ class GmailServer:
 
     def _extract_email_body(self, payload: Dict) -> str:
         """Extract email body text from payload"""
-        body = ""
-
         if "parts" in payload:
-            # Multipart message
-            for part in payload["parts"]:
-                if part["mimeType"] == "text/plain":
-                    if "data" in part["body"]:
-                        body += self._decode_base64(part["body"]["data"])
-                elif part["mimeType"] == "text/html" and not body:
-                    # Use HTML if no plain text found
-                    if "data" in part["body"]:
-                        body += self._decode_base64(part["body"]["data"])
-        else:
+            # Multipart message: plain text parts, or the HTML parts when there is no plain text
+            text_parts = [
+                part for part in payload["parts"]
+                if part["mimeType"] == "text/plain" and part["body"].get("data")
+            ]
+            if not text_parts:
+                text_parts = [
+                    part for part in payload["parts"]
+                    if part["mimeType"] == "text/html" and part["body"].get("data")
+                ]
+        elif payload["mimeType"] in ["text/plain", "text/html"] and payload["body"].get("data"):
             # Single part message
-            if payload["mimeType"] in ["text/plain", "text/html"]:
-                if "data" in payload["body"]:
-                    body += self._decode_base64(payload["body"]["data"])
+            text_parts = [payload]
+        else:
+            return ""
 
-        return body.strip()
+        # Parts are joined as bytes so the text is decoded in one pass
+        body_bytes = b"".join(self._decode_base64_bytes(part["body"]["data"]) for part in text_parts)
+        return body_bytes.decode("utf-8", errors="replace").strip()
 
-    def _decode_base64(self, data: str) -> str:
-        """Decode base64 email content"""
+    def _decode_base64_bytes(self, data: str) -> bytes:
+        """Decode base64 email content to bytes, empty when the data is malformed"""
         try:
-            decoded_bytes = base64.urlsafe_b64decode(data)
-            return decoded_bytes.decode("utf-8", errors="replace")
+            return base64.urlsafe_b64decode(data)
         except Exception as e:
             logger.warning(f"Error decoding base64 data: {e}")
-            return ""
+            return b""
 
     def _get_attachment_info(self, payload: Dict) -> List[Dict]:
         """Get information about email attachments, recursively searching nested messages"""
@@ -334,27 +742,17 @@ class GmailServer:
         """Download PDF attachment from Gmail and return bytes"""
         try:
             # Check size limit
-            max_size_mb = (
-                self.config.get("processing", {})
-                .get("pdf_processing", {})
-                .get("max_pdf_size_mb", 10)
-            )
-            size_mb = size / (1024 * 1024)
-
-            if size_mb > max_size_mb:
-                logger.warning(
-                    f"PDF {filename} too large ({size_mb:.1f}MB > {max_size_mb}MB), skipping"
-                )
+            if not self._pdf_within_size_limit(filename, size):
                 return None
 
-            logger.debug(f"Downloading PDF attachment: {filename} ({size_mb:.1f}MB)")
+            logger.debug(f"Downloading PDF attachment: {filename} ({size / (1024 * 1024):.1f}MB)")
 
             attachment = (
                 self.service.users()
                 .messages()
                 .attachments()
                 .get(userId="me", messageId=message_id, id=attachment_id)
-                .execute()
+                .execute(num_retries=GMAIL_NUM_RETRIES)
             )
 
             # Decode the attachment data
@@ -366,82 +764,83 @@ class GmailServer:
             logger.error(f"Error downloading PDF {filename}: {e}")
             return None
 
+    # PDF settings are read from the config once, on first use, instead of on every PDF
+
+    @cached_property
+    def _pdf_config(self) -> Dict:
+        """The config's 'processing.pdf_processing' section"""
+        return self.config.get("processing", {}).get("pdf_processing", {})
+
+    @cached_property
+    def _pdf_enabled(self) -> bool:
+        """Whether config 'pdf_processing.enabled' (default on) allows reading PDF attachments"""
+        return self._pdf_config.get("enabled", True)
+
+    @cached_property
+    def _pdf_timeout_seconds(self) -> float:
+        """Config 'pdf_processing.timeout_seconds': longest wait for one PDF's text (default 30)"""
+        return self._pdf_config.get("timeout_seconds", 30)
+
+    @cached_property
+    def _pdf_max_size_mb(self) -> float:
+        """Config 'pdf_processing.max_pdf_size_mb': largest PDF read (default 10)"""
+        return self._pdf_config.get("max_pdf_size_mb", 10)
+
+    @cached_property
+    def _pdf_skip_protected(self) -> bool:
+        """Whether config 'pdf_processing.skip_password_protected' (default on) skips encrypted PDFs"""
+        return self._pdf_config.get("skip_password_protected", True)
+
+    @cached_property
+    def _max_parallel_workers(self) -> Optional[int]:
+        """Config 'processing.max_parallel_workers': PDF worker processes (default: CPU count)"""
+        return self.config.get("processing", {}).get("max_parallel_workers")
+
+    def _pdf_within_size_limit(self, filename: str, size: int) -> bool:
+        """Check a PDF against config 'max_pdf_size_mb', logging the ones skipped"""
+        max_size_mb = self._pdf_max_size_mb
+        size_mb = size / (1024 * 1024)
+
+        if size_mb > max_size_mb:
+            logger.warning(
+                f"PDF {filename} too large ({size_mb:.1f}MB > {max_size_mb}MB), skipping"
+            )
+            return False
+        return True
+
     def _extract_pdf_text(self, pdf_bytes: bytes, filename: str) -> Optional[str]:
         """Extract text from PDF bytes with timeout and error handling"""
-        if (
-            not self.config.get("processing", {})
-            .get("pdf_processing", {})
-            .get("enabled", True)
-        ):
+        if not self._pdf_enabled:
             return None
 
-        timeout_seconds = (
-            self.config.get("processing", {})
-            .get("pdf_processing", {})
-            .get("timeout_seconds", 30)
-        )
-
-        def timeout_handler(signum, frame):
-            raise TimeoutError("PDF extraction timed out")
+        timeout_seconds = self._pdf_timeout_seconds
 
         try:
             logger.debug(f"Extracting text from PDF: {filename}")
 
-            # Set timeout
-            signal.signal(signal.SIGALRM, timeout_handler)
-            signal.alarm(timeout_seconds)
-
             try:
-                # Create PDF reader from bytes
-                pdf_stream = io.BytesIO(pdf_bytes)
-                pdf_reader = pypdf.PdfReader(pdf_stream)
-
-                # Check if password protected
-                if pdf_reader.is_encrypted:
-                    skip_protected = (
-                        self.config.get("processing", {})
-                        .get("pdf_processing", {})
-                        .get("skip_password_protected", True)
-                    )
-                    if skip_protected:
-                        logger.warning(
-                            f"PDF {filename} is password protected, skipping"
-                        )
-                        return None
-                    else:
-                        # Try empty password
-                        if not pdf_reader.decrypt(""):
-                            logger.warning(f"Could not decrypt PDF {filename}")
-                            return None
-
-                # Extract text from all pages
-                text_content = []
-                for page_num, page in enumerate(pdf_reader.pages):
-                    try:
-                        page_text = page.extract_text()
-                        if page_text.strip():
-                            text_content.append(page_text)
-                    except Exception as e:
-                        logger.warning(
-                            f"Error extracting text from page {page_num + 1} of {filename}: {e}"
-                        )
-                        continue
-
-                # Combine all text
-                full_text = "\n".join(text_content)
+                pool = _get_pdf_pool(self._max_parallel_workers)
+            except (OSError, NotImplementedError) as e:
+                logger.warning(f"PDF worker pool unavailable, parsing {filename} in-process: {e}")
+                pool = None
 
-                if full_text.strip():
-                    logger.debug(
-                        f"✓ PDF text extracted: {len(full_text)} characters from {filename}"
-                    )
-                    return full_text
-                else:
-                    logger.warning(f"No text found in PDF {filename}")
-                    return None
+            if pool is not None:
+                text_content = self._read_pdf_pages_in_pool(pool, pdf_bytes, filename, timeout_seconds)
+            else:
+                text_content = self._read_pdf_pages_with_alarm(pdf_bytes, filename, timeout_seconds)
+            if text_content is None:
+                return None
 
-            finally:
-                # Clear timeout
-                signal.alarm(0)
+            # Combine all text; blank pages were already left out
+            if text_content:
+                full_text = "\n".join(text_content)
+                logger.debug(
+                    f"✓ PDF text extracted: {len(full_text)} characters from {filename}"
+                )
+                return full_text
+            else:
+                logger.warning(f"No text found in PDF {filename}")
+                return None
 
         except TimeoutError:
             logger.error(f"PDF text extraction timed out for {filename}")
@@ -450,8 +849,121 @@ class GmailServer:
             logger.error(f"Error extracting text from PDF {filename}: {e}")
             return None
 
-    def _process_pdf_attachments(self, message: Dict, email_data: Dict) -> Dict:
-        """Process PDF attachments and add text to email data"""
+    def _read_pdf_pages_in_pool(
+        self, pool: ProcessPoolExecutor, pdf_bytes: bytes, filename: str, timeout_seconds: float
+    ) -> Optional[List[str]]:
+        """Page texts parsed in a pool worker; a parse past the timeout has its worker killed"""
+        deadline = time.monotonic() + timeout_seconds
+        future = pool.submit(_read_pdf_pages_or_count, pdf_bytes, filename, self._pdf_skip_protected)
+        try:
+            result = future.result(timeout=timeout_seconds)
+        except (TimeoutError, BrokenProcessPool):
+            _discard_pdf_pool()
+            raise
+
+        if isinstance(result, int):
+            return self._read_pdf_pages_parallel(
+                pdf_bytes, filename, result, max(deadline - time.monotonic(), 0)
+            )
+        return result
+
+    def _read_pdf_pages_with_alarm(
+        self, pdf_bytes: bytes, filename: str, timeout_seconds: float
+    ) -> Optional[List[str]]:
+        """Page texts parsed in-process, interrupted by SIGALRM after the timeout on the main thread"""
+        if threading.current_thread() is not threading.main_thread() or not hasattr(signal, "SIGALRM"):
+            # Signals only reach the main thread; elsewhere the parse runs without a time limit
+            return _read_pdf_pages(pdf_bytes, filename, self._pdf_skip_protected)
+
+        def timeout_handler(signum, frame):
+            raise TimeoutError("PDF extraction timed out")
+
+        previous_handler = signal.signal(signal.SIGALRM, timeout_handler)
+        signal.setitimer(signal.ITIMER_REAL, timeout_seconds)
+        try:
+            return _read_pdf_pages(pdf_bytes, filename, self._pdf_skip_protected)
+        finally:
+            # Clear timeout
+            signal.setitimer(signal.ITIMER_REAL, 0)
+            signal.signal(signal.SIGALRM, previous_handler)
+
+    def _read_pdf_pages_parallel(
+        self, pdf_bytes: bytes, filename: str, page_count: int, timeout_seconds: float
+    ) -> List[str]:
+        """Page texts extracted concurrently in the shared process pool"""
+        logger.debug(f"Extracting {page_count} pages of {filename} in parallel")
+        # Workers read the PDF from a temporary file instead of each page job pickling a copy of the bytes
+        with tempfile.NamedTemporaryFile(suffix=".pdf", delete=False) as pdf_file:
+            pdf_file.write(pdf_bytes)
+        try:
+            page_texts = _get_pdf_pool(self._max_parallel_workers).map(
+                _extract_pdf_page_text,
+                repeat(pdf_file.name, page_count),
+                range(page_count),
+                timeout=timeout_seconds,
+            )
+            return [page_text for page_text in page_texts if _has_text(page_text)]
+        except (TimeoutError, BrokenProcessPool):
+            _discard_pdf_pool()
+            raise
+        finally:
+            os.unlink(pdf_file.name)
+
+    def _extract_pdf_texts(self, messages: Dict[str, Dict], pdf_bytes_by_message: Dict[str, bytes]) -> Dict[str, str]:
+        """Extract the text of several downloaded PDFs at once in the shared process pool, keyed by message id.
+
+        Each PDF is a separate job, so short invoices parse in parallel too; empty text means none was found.
+        """
+        timeout_seconds = self._pdf_timeout_seconds
+        skip_protected = self._pdf_skip_protected
+
+        jobs = {}
+        try:
+            pool = _get_pdf_pool(self._max_parallel_workers)
+            for message_id, pdf_bytes in pdf_bytes_by_message.items():
+                filename = self._select_pdf_attachment(
+                    self._get_attachment_info(messages[message_id].get("payload", {}))
+                )["filename"]
+                jobs[message_id] = (filename, pool.submit(_extract_pdf_document_text, pdf_bytes, filename, skip_protected))
+        except (OSError, NotImplementedError) as e:
+            # Workers start on the first submit; without them each email extracts its own PDF
+            logger.warning(f"PDF worker pool unavailable, extracting PDFs one email at a time: {e}")
+            for _, future in jobs.values():
+                future.cancel()
+            return {}
+
+        pdf_texts = {}
+        for message_id, (filename, future) in jobs.items():
+            try:
+                pdf_texts[message_id] = future.result(timeout=timeout_seconds)
+            except TimeoutError:
+                # A running parse cannot be cancelled, so its worker is killed with the pool;
+                # the other PDFs without a result are extracted one by one when their email is built
+                logger.error(f"PDF text extraction timed out for {filename}")
+                pdf_texts[message_id] = ""
+                _discard_pdf_pool()
+                break
+            except BrokenProcessPool as e:
+                # PDFs without a result are extracted one by one when their email is built
+                logger.error(f"PDF worker pool failed: {e}")
+                _discard_pdf_pool()
+                break
+        return pdf_texts
+
+    def _select_pdf_attachment(self, attachments: List[Dict]) -> Optional[Dict]:
+        """The PDF attachment whose text is extracted: the first one (can be extended for multiple PDFs)"""
+        for att in attachments:
+            if att.get("filename", "").lower().endswith(".pdf"):
+                return att
+        return None
+
+    def _process_pdf_attachments(
+        self, message: Dict, email_data: Dict, pdf_bytes: Optional[bytes] = None, pdf_text: Optional[str] = None
+    ) -> Dict:
+        """Process PDF attachments and add text to email data.
+
+        pdf_bytes is the PDF if already downloaded, and pdf_text its text ("" for none) if already extracted.
+        """
         pdf_data = {
             "pdf_processed": False,
             "pdf_filename": "",
@@ -461,39 +973,29 @@ class GmailServer:
         }
 
         # Skip if PDF processing disabled
-        if (
-            not self.config.get("processing", {})
-            .get("pdf_processing", {})
-            .get("enabled", True)
-        ):
+        if not self._pdf_enabled:
             return pdf_data
 
-        # Find PDF attachments
-        pdf_attachments = [
-            att
-            for att in email_data.get("attachments", [])
-            if att.get("filename", "").lower().endswith(".pdf")
-        ]
-
-        if not pdf_attachments:
+        pdf_attachment = self._select_pdf_attachment(email_data.get("attachments", []))
+        if not pdf_attachment:
             return pdf_data
 
-        # Process first PDF attachment (can be extended for multiple PDFs)
-        pdf_attachment = pdf_attachments[0]
         filename = pdf_attachment["filename"]
 
         try:
-            # Download PDF
-            pdf_bytes = self._download_pdf_attachment(
-                pdf_attachment["attachmentId"],
-                email_data["id"],
-                filename,
-                pdf_attachment.get("size", 0),
-            )
+            # Download PDF unless a batch already did
+            if pdf_bytes is None:
+                pdf_bytes = self._download_pdf_attachment(
+                    pdf_attachment["attachmentId"],
+                    email_data["id"],
+                    filename,
+                    pdf_attachment.get("size", 0),
+                )
 
             if pdf_bytes:
-                # Extract text
-                pdf_text = self._extract_pdf_text(pdf_bytes, filename)
+                # Extract text unless a worker already did
+                if pdf_text is None:
+                    pdf_text = self._extract_pdf_text(pdf_bytes, filename)
 
                 if pdf_text:
                     pdf_data.update(
@@ -526,9 +1028,15 @@ class GmailServer:
         return pdf_data
 
     def fetch_emails_for_extractors(
-        self, keywords: List[str], additional_filters: List[str] = None, days_back: int = 30
+        self, keywords: List[str], additional_filters: List[str] = None, days_back: int = 30,
+        metadata_filter: Optional[Callable[[str, str], bool]] = None, exclusions: List[str] = None,
     ) -> List[Dict]:
-        """Fetch emails using combined keywords and filters from all extractors"""
+        """Fetch emails using combined keywords and filters from all extractors.
+
+        With metadata_filter(sender, subject), only headers are fetched first and full
+        messages are downloaded just for the emails it accepts. exclusions narrow the
+        search on Gmail's side (see _build_search_query).
+        """
         try:
             # Check if custom date range is provided in config
             if self.config.get('processing', {}).get('use_date_range', False):
@@ -539,14 +1047,14 @@ class GmailServer:
                 end_date = datetime.strptime(to_date_str, '%Y-%m-%d') + timedelta(days=1)  # Include the end date
                 
                 # Build Gmail search query with date range
-                query = self._build_search_query(start_date, keywords, additional_filters, end_date)
+                query = self._build_search_query(start_date, keywords, additional_filters, end_date, exclusions=exclusions)
             else:
                 # Calculate date range using days_back (original behavior)
                 end_date = datetime.now()
                 start_date = end_date - timedelta(days=days_back)
                 
                 # Build Gmail search query using provided keywords and filters
-                query = self._build_search_query(start_date, keywords, additional_filters)
+                query = self._build_search_query(start_date, keywords, additional_filters, exclusions=exclusions)
             logger.info(f"Fetching emails with extractor query: {query}")
             logger.info(
                 f"Searching emails from {start_date.strftime('%Y-%m-%d')} to {end_date.strftime('%Y-%m-%d')}"
@@ -558,29 +1066,17 @@ class GmailServer:
                 self.service.users()
                 .messages()
                 .list(userId="me", q=query, maxResults=max_emails)
-                .execute()
+                .execute(num_retries=GMAIL_NUM_RETRIES)
             )
 
             messages = results.get("messages", [])
             logger.info(f"Found {len(messages)} emails matching extractor criteria")
 
-            emails = []
-            for i, message in enumerate(messages):
-                try:
-                    email_data = self._get_email_details(message["id"])
-                    if email_data:
-                        emails.append(email_data)
-                        logger.debug(
-                            f"Processed email {i+1}/{len(messages)}: {email_data['subject'][:50]}..."
-                        )
+            if metadata_filter is not None and messages:
+                messages = self._filter_by_metadata(messages, metadata_filter)
+                logger.info(f"{len(messages)} emails passed the sender/subject filter")
 
-                    # Rate limiting - be nice to Gmail API
-                    if i > 0 and i % 10 == 0:
-                        time.sleep(1)
-
-                except Exception as e:
-                    logger.error(f"Error processing message {message['id']}: {e}")
-                    continue
+            emails = self._get_email_details_many(messages)
 
             logger.info(f"Successfully processed {len(emails)} emails for extractors")
             return emails
@@ -649,27 +1145,13 @@ class GmailServer:
                 self.service.users()
                 .messages()
                 .list(userId="me", q=query, maxResults=max_results)
-                .execute()
+                .execute(num_retries=GMAIL_NUM_RETRIES)
             )
             
             messages = results.get("messages", [])
             logger.info(f"Found {len(messages)} emails (inbox only, no keyword filtering)")
             
-            emails = []
-            for i, message in enumerate(messages):
-                try:
-                    email_data = self._get_email_details(message["id"])
-                    if email_data:
-                        emails.append(email_data)
-                        logger.debug(f"Processed email {i+1}/{len(messages)}: {email_data['subject'][:50]}...")
-                    
-                    # Rate limiting - be nice to Gmail API
-                    if i > 0 and i % 10 == 0:
-                        time.sleep(1)
-                
-                except Exception as e:
-                    logger.error(f"Error processing message {message['id']}: {e}")
-                    continue
+            emails = self._get_email_details_many(messages)
             
             logger.info(f"Successfully processed {len(emails)} emails (universal fetch)")
             return emails
@@ -690,17 +1172,20 @@ class GmailServer:
             email_data = self._get_email_details(email_id)
             if not email_data:
                 return ""
-
-            # Start with email body
-            content = email_data.get("body", "")
-
-            # Add PDF content if available
-            if email_data.get("pdf_processed") and email_data.get("pdf_text"):
-                pdf_text = email_data.get("pdf_text", "")
-                content += f"\n\n--- PDF CONTENT ---\n{pdf_text}\n--- END PDF ---"
-
-            return content
+            return self.format_email_content(email_data)
 
         except Exception as e:
             logger.error(f"Error getting email content for {email_id}: {e}")
             return ""
+
+    def format_email_content(self, email_data: Dict) -> str:
+        """Combined email content (body + PDF text) of an already fetched email"""
+        # Start with email body
+        content = email_data.get("body", "")
+
+        # Add PDF content if available
+        if email_data.get("pdf_processed") and email_data.get("pdf_text"):
+            pdf_text = email_data.get("pdf_text", "")
+            content += f"\n\n--- PDF CONTENT ---\n{pdf_text}\n--- END PDF ---"
+
+        return content
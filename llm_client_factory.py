@@ -6,11 +6,34 @@ Supports Gemini, OpenAI, Claude, and other providers
 
 import os
 import logging
-from typing import Dict, Any
+from typing import Dict, Any, Tuple
 import instructor
 
+# Provider SDKs are optional; a missing one only fails when its provider is requested
+try:
+    from google import genai
+except ImportError:
+    genai = None
+
+try:
+    import openai
+except ImportError:
+    openai = None
+
+try:
+    import anthropic
+except ImportError:
+    anthropic = None
+
 logger = logging.getLogger(__name__)
 
+# Environment variable holding each provider's API key
+API_KEY_ENV_VARS = {
+    'gemini': 'GEMINI_API_KEY',
+    'openai': 'OPENAI_API_KEY',
+    'claude': 'CLAUDE_API_KEY',
+}
+
 
 class LLMClientFactory:
     """Factory for creating LLM clients with instructor support"""
@@ -21,6 +44,10 @@ class LLMClientFactory:
         'claude': 'anthropic',
     }
     
+    # Clients keyed by provider and API key; the model is chosen per request, so every
+    # agent on the same provider shares one client and its connection pool
+    _client_cache: Dict[Tuple[str, str], instructor.Instructor] = {}
+    
     @classmethod
     def create_client(cls, provider: str, model: str, api_parameters: Dict[str, Any] = None) -> instructor.Instructor:
         """
@@ -45,17 +72,25 @@ class LLMClientFactory:
             supported = ', '.join(cls.SUPPORTED_PROVIDERS.keys())
             raise ValueError(f"Unsupported provider '{provider}'. Supported: {supported}")
         
+        cache_key = (provider, os.getenv(API_KEY_ENV_VARS[provider], ''))
+        cached_client = cls._client_cache.get(cache_key)
+        if cached_client is not None:
+            return cached_client
+        
         try:
             if provider == 'gemini':
-                return cls._create_gemini_client(model, api_parameters)
+                client = cls._create_gemini_client(model, api_parameters)
             elif provider == 'openai':
-                return cls._create_openai_client(model, api_parameters)
+                client = cls._create_openai_client(model, api_parameters)
             elif provider == 'claude':
-                return cls._create_claude_client(model, api_parameters)
+                client = cls._create_claude_client(model, api_parameters)
             
         except Exception as e:
             logger.error(f"Failed to create {provider} client: {e}")
             raise RuntimeError(f"Could not initialize {provider} client: {e}")
+        
+        cls._client_cache[cache_key] = client
+        return client
     
     @classmethod
     def _create_gemini_client(cls, model: str, api_parameters: Dict[str, Any]) -> instructor.Instructor:
@@ -64,9 +99,10 @@ class LLMClientFactory:
         if not api_key:
             raise RuntimeError("GEMINI_API_KEY environment variable not found")
         
+        if genai is None:
+            raise RuntimeError("google-genai package not installed")
+        
         try:
-            from google import genai
-            
             # Create Gemini client
             genai_client = genai.Client(api_key=api_key)
             
@@ -79,8 +115,6 @@ class LLMClientFactory:
             logger.info(f"✅ Gemini client created successfully (model: {model})")
             return client
             
-        except ImportError as e:
-            raise RuntimeError(f"google-genai package not installed: {e}")
         except Exception as e:
             raise RuntimeError(f"Failed to create Gemini client: {e}")
     
@@ -91,9 +125,10 @@ class LLMClientFactory:
         if not api_key:
             raise RuntimeError("OPENAI_API_KEY environment variable not found")
         
+        if openai is None:
+            raise RuntimeError("openai package not installed")
+        
         try:
-            import openai
-            
             # Create OpenAI client
             openai_client = openai.OpenAI(api_key=api_key)
             
@@ -106,8 +141,6 @@ class LLMClientFactory:
             logger.info(f"✅ OpenAI client created successfully (model: {model})")
             return client
             
-        except ImportError as e:
-            raise RuntimeError(f"openai package not installed: {e}")
         except Exception as e:
             raise RuntimeError(f"Failed to create OpenAI client: {e}")
     
@@ -118,9 +151,10 @@ class LLMClientFactory:
         if not api_key:
             raise RuntimeError("CLAUDE_API_KEY environment variable not found")
         
+        if anthropic is None:
+            raise RuntimeError("anthropic package not installed")
+        
         try:
-            import anthropic
-            
             # Create Anthropic client
             anthropic_client = anthropic.Anthropic(api_key=api_key)
             
@@ -133,8 +167,6 @@ class LLMClientFactory:
             logger.info(f"✅ Claude client created successfully (model: {model})")
             return client
             
-        except ImportError as e:
-            raise RuntimeError(f"anthropic package not installed: {e}")
         except Exception as e:
             raise RuntimeError(f"Failed to create Claude client: {e}")
     
@@ -168,31 +200,19 @@ class LLMClientFactory:
             env_var = 'GEMINI_API_KEY'
             status['api_key_found'] = bool(os.getenv(env_var))
             status['api_key_env_var'] = env_var
-            try:
-                import google.genai
-                status['package_available'] = True
-            except ImportError:
-                status['package_available'] = False
+            status['package_available'] = genai is not None
                 
         elif provider == 'openai':
             env_var = 'OPENAI_API_KEY'
             status['api_key_found'] = bool(os.getenv(env_var))
             status['api_key_env_var'] = env_var
-            try:
-                import openai
-                status['package_available'] = True
-            except ImportError:
-                status['package_available'] = False
+            status['package_available'] = openai is not None
                 
         elif provider == 'claude':
             env_var = 'CLAUDE_API_KEY'
             status['api_key_found'] = bool(os.getenv(env_var))
             status['api_key_env_var'] = env_var
-            try:
-                import anthropic
-                status['package_available'] = True
-            except ImportError:
-                status['package_available'] = False
+            status['package_available'] = anthropic is not None
         
         return status
 
@@ -5,15 +5,78 @@ SQLAlchemy models for the Zero Inbox email categorization and action system.
 Follows the specifications from the implementation prompt.
 """
 
-from sqlalchemy import create_engine, Column, Integer, String, Text, DateTime, Boolean, Float, ForeignKey, Index
-from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker, relationship
+from sqlalchemy import create_engine, event, func, insert, literal, select, union_all, Float, String, Text, ForeignKey, Index
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.engine import make_url
+from sqlalchemy.pool import StaticPool
+from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column, sessionmaker, relationship
+from contextlib import contextmanager
 from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional
 import logging
+import json
+import time
 
 logger = logging.getLogger(__name__)
 
-Base = declarative_base()
+# Rows per multi-row INSERT of a bulk insert; keeps each statement within SQLite's bound-parameter limit
+INSERT_PAGE_SIZE = 1000
+
+# Applied to every SQLite connection: WAL lets readers run beside the writer, NORMAL sync drops
+# the per-commit fsync of the WAL (still crash safe), and temp tables/cache/mmap stay in memory
+SQLITE_PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA mmap_size=268435456",
+    "PRAGMA cache_size=-65536",
+)
+
+
+def _apply_sqlite_pragmas(dbapi_connection, connection_record):
+    """Tune a new SQLite connection for the write-heavy ingest"""
+    cursor = dbapi_connection.cursor()
+    for pragma in SQLITE_PRAGMAS:
+        cursor.execute(pragma)
+    cursor.close()
+
+
+# Connection pool for file-backed databases: WAL readers (exports, reviews) each get their own
+# connection instead of queueing behind the ingest
+POOL_SIZE = 10
+POOL_MAX_OVERFLOW = 20
+POOL_RECYCLE_SECONDS = 1800
+
+# Statements running longer than this are logged as slow
+SLOW_QUERY_SECONDS = 0.1
+
+
+def _engine_options(database_url: str) -> Dict:
+    """Pool settings for the database URL"""
+    if ":memory:" in database_url or database_url in ("sqlite://", "sqlite:///"):
+        # One shared connection, or every checkout would see a fresh empty in-memory database
+        return {"poolclass": StaticPool, "connect_args": {"check_same_thread": False}}
+    options = {"pool_size": POOL_SIZE, "max_overflow": POOL_MAX_OVERFLOW}
+    if not database_url.startswith("sqlite"):
+        # Server connections can be dropped while idle; local SQLite files cannot
+        options.update(pool_pre_ping=True, pool_recycle=POOL_RECYCLE_SECONDS)
+    return options
+
+
+def _start_query_timer(conn, cursor, statement, parameters, context, executemany):
+    """Record when a statement starts"""
+    conn.info.setdefault("query_start_time", []).append(time.perf_counter())
+
+
+def _log_slow_query(conn, cursor, statement, parameters, context, executemany):
+    """Log the statement if it ran longer than SLOW_QUERY_SECONDS"""
+    elapsed = time.perf_counter() - conn.info["query_start_time"].pop()
+    if elapsed > SLOW_QUERY_SECONDS:
+        logger.warning(f"Slow query ({elapsed * 1000:.0f} ms): {statement[:200]}")
+
+class Base(DeclarativeBase):
+    """Declarative base of the Zero Inbox tables"""
 
 
 class Email(Base):
@@ -24,31 +87,37 @@ class Email(Base):
     __tablename__ = 'emails'
     
     # Primary key
-    id = Column(Integer, primary_key=True)
+    id: Mapped[int] = mapped_column(primary_key=True)
     
     # Gmail data
-    email_id = Column(String(255), unique=True, nullable=False, index=True)  # Gmail message ID
-    sender = Column(Text, nullable=False)
-    subject = Column(Text, nullable=False)
+    email_id: Mapped[str] = mapped_column(String(255), unique=True, index=True)  # Gmail message ID
+    sender: Mapped[str] = mapped_column(Text)
+    subject: Mapped[str] = mapped_column(Text)
     
-    # Email content (cleaned and original)
-    body = Column(Text, nullable=False)  # cleaned text content
-    pdf_content = Column(Text)  # extracted PDF text
-    html_content = Column(Text)  # original HTML
+    # Email content (cleaned and original); the text is loaded only when read, or up front
+    # for every email with .options(undefer_group('content')) where emails outlive the session
+    body: Mapped[str] = mapped_column(Text, deferred_group='content')  # cleaned text content
+    pdf_content: Mapped[Optional[str]] = mapped_column(Text, deferred_group='content')  # extracted PDF text
+    # original HTML; never read by the pipeline, so it is left out of every SELECT (access raises)
+    html_content: Mapped[Optional[str]] = mapped_column(Text, deferred=True, deferred_raiseload=True)
     
     # Timestamps
-    date_received = Column(DateTime, nullable=False)
-    date_processed = Column(DateTime, nullable=False, default=datetime.utcnow)
-    created_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+    date_received: Mapped[datetime]
+    date_processed: Mapped[datetime] = mapped_column(insert_default=func.current_timestamp())
+    created_at: Mapped[datetime] = mapped_column(insert_default=func.current_timestamp())
     
     # Attachment info
-    has_attachments = Column(Boolean, default=False)
-    attachment_count = Column(Integer, default=0)
-    
-    # Relationships
-    categories = relationship("EmailCategory", back_populates="email", cascade="all, delete-orphan")
-    actions = relationship("AgentAction", back_populates="email", cascade="all, delete-orphan")
-    reviews = relationship("HumanReview", back_populates="email", cascade="all, delete-orphan")
+    has_attachments: Mapped[Optional[bool]] = mapped_column(default=False)
+    attachment_count: Mapped[Optional[int]] = mapped_column(default=0)
+    
+    # Relationships; never lazy-loaded (one query per email), so loops over emails must request
+    # them with selectinload, which fetches the children of all listed emails in one query
+    categories: Mapped[List["EmailCategory"]] = relationship(
+        back_populates="email", cascade="all, delete-orphan", lazy="raise")
+    actions: Mapped[List["AgentAction"]] = relationship(
+        back_populates="email", cascade="all, delete-orphan", lazy="raise")
+    reviews: Mapped[List["HumanReview"]] = relationship(
+        back_populates="email", cascade="all, delete-orphan", lazy="raise")
     
     def __repr__(self):
         return f"<Email(id={self.id}, email_id='{self.email_id}', subject='{self.subject[:50]}...')>"
@@ -62,27 +131,27 @@ class EmailCategory(Base):
     __tablename__ = 'email_categories'
     
     # Primary key
-    id = Column(Integer, primary_key=True)
+    id: Mapped[int] = mapped_column(primary_key=True)
     
     # Foreign key to emails
-    email_id = Column(Integer, ForeignKey('emails.id'), nullable=False, index=True)
+    email_id: Mapped[int] = mapped_column(ForeignKey('emails.id'), index=True)
     
     # Category data (Other, Reading, Review, Task)
-    category = Column(String(100), nullable=False, index=True)
-    subcategory = Column(String(100), nullable=False, index=True)
-    category_description = Column(Text)
+    category: Mapped[str] = mapped_column(String(100), index=True)
+    subcategory: Mapped[str] = mapped_column(String(100), index=True)
+    category_description: Mapped[Optional[str]] = mapped_column(Text)
     
     # Action and supporting info
-    agent_action = Column(Text, nullable=False)  # specific action to perform
-    supporting_information = Column(Text)  # keywords, rules, context
+    agent_action: Mapped[str] = mapped_column(Text)  # specific action to perform
+    supporting_information: Mapped[Optional[str]] = mapped_column(Text)  # keywords, rules, context
     
     # Classification metadata
-    classification_confidence = Column(Float, default=0.0)
-    classified_at = Column(DateTime, nullable=False, default=datetime.utcnow)
-    classified_by = Column(String(100), nullable=False)  # agent name
+    classification_confidence: Mapped[Optional[float]] = mapped_column(Float, default=0.0)
+    classified_at: Mapped[datetime] = mapped_column(insert_default=func.current_timestamp())
+    classified_by: Mapped[str] = mapped_column(String(100))  # agent name
     
     # Relationship
-    email = relationship("Email", back_populates="categories")
+    email: Mapped["Email"] = relationship(back_populates="categories")
     
     def __repr__(self):
         return f"<EmailCategory(id={self.id}, category='{self.category}', subcategory='{self.subcategory}')>"
@@ -96,27 +165,27 @@ class AgentAction(Base):
     __tablename__ = 'agent_actions'
     
     # Primary key
-    id = Column(Integer, primary_key=True)
+    id: Mapped[int] = mapped_column(primary_key=True)
     
     # Foreign key to emails
-    email_id = Column(Integer, ForeignKey('emails.id'), nullable=False, index=True)
+    email_id: Mapped[int] = mapped_column(ForeignKey('emails.id'), index=True)
     
     # Category context
-    category = Column(String(100), nullable=False, index=True)
-    subcategory = Column(String(100), nullable=False, index=True)
+    category: Mapped[str] = mapped_column(String(100), index=True)
+    subcategory: Mapped[str] = mapped_column(String(100), index=True)
     
     # Action execution details
-    action_performed = Column(Text, nullable=False)  # specific action executed
-    action_result = Column(Text, nullable=False)  # output/summary from agent
+    action_performed: Mapped[str] = mapped_column(Text)  # specific action executed
+    action_result: Mapped[str] = mapped_column(Text)  # output/summary from agent
     
     # Processing metadata
-    processed_at = Column(DateTime, nullable=False, default=datetime.utcnow)
-    agent_name = Column(String(100), nullable=False)
-    success = Column(Boolean, default=True)
-    error_message = Column(Text)
+    processed_at: Mapped[datetime] = mapped_column(insert_default=func.current_timestamp())
+    agent_name: Mapped[str] = mapped_column(String(100))
+    success: Mapped[Optional[bool]] = mapped_column(default=True)
+    error_message: Mapped[Optional[str]] = mapped_column(Text)
     
     # Relationship
-    email = relationship("Email", back_populates="actions")
+    email: Mapped["Email"] = relationship(back_populates="actions")
     
     def __repr__(self):
         return f"<AgentAction(id={self.id}, agent='{self.agent_name}', success={self.success})>"
@@ -130,37 +199,40 @@ class HumanReview(Base):
     __tablename__ = 'human_reviews'
     
     # Primary key
-    id = Column(Integer, primary_key=True)
+    id: Mapped[int] = mapped_column(primary_key=True)
     
     # Foreign key to emails
-    email_id = Column(Integer, ForeignKey('emails.id'), nullable=False, index=True)
+    email_id: Mapped[int] = mapped_column(ForeignKey('emails.id'), index=True)
     
     # Original AI categorization
-    original_category = Column(String(100), nullable=False)
-    original_subcategory = Column(String(100), nullable=False)
+    original_category: Mapped[str] = mapped_column(String(100))
+    original_subcategory: Mapped[str] = mapped_column(String(100))
     
     # Human corrections
-    reviewed_category = Column(String(100))
-    reviewed_subcategory = Column(String(100))
-    approved = Column(Boolean)
-    human_reasoning = Column(Text)
+    reviewed_category: Mapped[Optional[str]] = mapped_column(String(100))
+    reviewed_subcategory: Mapped[Optional[str]] = mapped_column(String(100))
+    approved: Mapped[Optional[bool]]
+    human_reasoning: Mapped[Optional[str]] = mapped_column(Text)
     
     # Review metadata
-    reviewed_at = Column(DateTime, nullable=False, default=datetime.utcnow)
-    reviewed_by = Column(String(100))
+    reviewed_at: Mapped[datetime] = mapped_column(insert_default=func.current_timestamp())
+    reviewed_by: Mapped[Optional[str]] = mapped_column(String(100))
     
     # Relationship
-    email = relationship("Email", back_populates="reviews")
+    email: Mapped["Email"] = relationship(back_populates="reviews")
     
     def __repr__(self):
         return f"<HumanReview(id={self.id}, approved={self.approved}, reviewed_by='{self.reviewed_by}')>"
 
 
 # Create composite indexes for performance
-Index('idx_email_category_subcategory', EmailCategory.category, EmailCategory.subcategory)
-Index('idx_agent_action_category_subcategory', AgentAction.category, AgentAction.subcategory)
-Index('idx_email_date_processed', Email.date_processed)
-Index('idx_email_date_received', Email.date_received)
+# (secondary indexes: dropped during a bulk load and rebuilt afterwards; unique email_id stays for dedup)
+SECONDARY_INDEXES = [
+    Index('idx_email_category_subcategory', EmailCategory.category, EmailCategory.subcategory),
+    Index('idx_agent_action_category_subcategory', AgentAction.category, AgentAction.subcategory),
+    Index('idx_email_date_processed', Email.date_processed),
+    Index('idx_email_date_received', Email.date_received),
+]
 
 
 class DatabaseManager:
@@ -178,12 +250,17 @@ class DatabaseManager:
         """Initialize database connection and create tables"""
         try:
             # Create database directory if it doesn't exist
-            import os
-            db_path = self.database_url.replace("sqlite:///", "")
-            os.makedirs(os.path.dirname(db_path), exist_ok=True)
+            url = make_url(self.database_url)
+            if url.get_backend_name() == "sqlite" and url.database and url.database != ":memory:":
+                Path(url.database).parent.mkdir(parents=True, exist_ok=True)
             
             # Create engine and session factory
-            self.engine = create_engine(self.database_url, echo=False)
+            self.engine = create_engine(self.database_url, echo=False, insertmanyvalues_page_size=INSERT_PAGE_SIZE,
+                                        **_engine_options(self.database_url))
+            if self.database_url.startswith("sqlite"):
+                event.listen(self.engine, "connect", _apply_sqlite_pragmas)
+            event.listen(self.engine, "before_cursor_execute", _start_query_timer)
+            event.listen(self.engine, "after_cursor_execute", _log_slow_query)
             self.SessionLocal = sessionmaker(bind=self.engine)
             
             # Create all tables
@@ -205,24 +282,16 @@ class DatabaseManager:
     def verify_schema(self):
         """Verify database schema is correctly created"""
         try:
-            session = self.get_session()
-            
-            # Check if all tables exist by querying their counts
-            tables_info = []
-            
-            email_count = session.query(Email).count()
-            tables_info.append(f"emails: {email_count} records")
-            
-            category_count = session.query(EmailCategory).count()
-            tables_info.append(f"email_categories: {category_count} records")
+            if not self.engine:
+                raise RuntimeError("Database not initialized. Call initialize_database() first.")
             
-            action_count = session.query(AgentAction).count()
-            tables_info.append(f"agent_actions: {action_count} records")
-            
-            review_count = session.query(HumanReview).count()
-            tables_info.append(f"human_reviews: {review_count} records")
-            
-            session.close()
+            # Check if all tables exist by counting their rows, all in one statement
+            counts = union_all(*(
+                select(literal(model.__tablename__), func.count()).select_from(model)
+                for model in (Email, EmailCategory, AgentAction, HumanReview)
+            ))
+            with self.engine.connect() as connection:
+                tables_info = [f"{table}: {count} records" for table, count in connection.execute(counts)]
             
             logger.info("✅ Database schema verification successful:")
             for info in tables_info:
@@ -252,32 +321,112 @@ class DatabaseManager:
                 session.close()
                 return True
             
-            # Create template records for each category rule
-            template_records = []
+            session.close()
+            
+            # Template rows for each category rule
+            template_rows = []
             for category_key, rules in category_rules.items():
                 if '/' in category_key:
                     category, subcategory = category_key.split('/', 1)
                     
-                    template = EmailCategory(
-                        email_id=0,  # Special ID for templates
-                        category=category,
-                        subcategory=subcategory,
-                        category_description=rules.get('supporting_info', ''),
-                        agent_action=rules.get('action', ''),
-                        supporting_information=str(rules),
-                        classification_confidence=1.0,
-                        classified_by='system_template'
-                    )
-                    template_records.append(template)
+                    template_rows.append({
+                        'email_id': 0,  # Special ID for templates
+                        'category': category,
+                        'subcategory': subcategory,
+                        'category_description': rules.get('supporting_info', ''),
+                        'agent_action': rules.get('action', ''),
+                        'supporting_information': json.dumps(rules, ensure_ascii=False),
+                        'classification_confidence': 1.0,
+                        'classified_by': 'system_template',
+                    })
             
             # Insert template records
-            session.add_all(template_records)
-            session.commit()
-            session.close()
+            self.bulk_insert_categories(template_rows)
             
-            logger.info(f"✅ Created {len(template_records)} category rule templates")
+            logger.info(f"✅ Created {len(template_rows)} category rule templates")
             return True
             
         except Exception as e:
             logger.error(f"❌ Failed to populate category rules: {e}")
-            return False
\ No newline at end of file
+            return False
+    
+    def drop_secondary_indexes(self):
+        """Drop the secondary indexes so a bulk load does not update them row by row"""
+        for index in SECONDARY_INDEXES:
+            index.drop(self.engine, checkfirst=True)
+    
+    def create_secondary_indexes(self):
+        """Create any missing secondary index, each built in one pass over its table"""
+        for index in SECONDARY_INDEXES:
+            index.create(self.engine, checkfirst=True)
+    
+    @contextmanager
+    def bulk_load(self):
+        """Run a large first-time load or backfill without secondary indexes, rebuilding them afterwards"""
+        if not self.engine:
+            raise RuntimeError("Database not initialized. Call initialize_database() first.")
+        self.drop_secondary_indexes()
+        try:
+            yield self
+        finally:
+            self.create_secondary_indexes()
+            self.analyze()
+            logger.info("✅ Secondary indexes rebuilt after bulk load")
+    
+    def analyze(self):
+        """Refresh SQLite's table statistics so the query planner can choose between the indexes"""
+        if not self.engine:
+            raise RuntimeError("Database not initialized. Call initialize_database() first.")
+        if not self.database_url.startswith("sqlite"):
+            return
+        with self.engine.begin() as connection:
+            connection.exec_driver_sql("ANALYZE")
+            connection.exec_driver_sql("PRAGMA optimize")
+    
+    def _bulk_insert(self, model, rows: List[Dict]) -> int:
+        """Insert rows (column name -> value) in one transaction with multi-row INSERT statements"""
+        if not rows:
+            return 0
+        if not self.engine:
+            raise RuntimeError("Database not initialized. Call initialize_database() first.")
+        # Core insert skips the ORM unit of work; column defaults still apply
+        with self.engine.begin() as connection:
+            connection.execute(insert(model), rows)
+        return len(rows)
+    
+    def bulk_insert_emails(self, rows: List[Dict]) -> int:
+        """Insert email rows at once, skipping Gmail messages already stored; returns how many were new"""
+        if not rows:
+            return 0
+        if not self.engine:
+            raise RuntimeError("Database not initialized. Call initialize_database() first.")
+        
+        with self.engine.begin() as connection:
+            if self.engine.dialect.name == "sqlite":
+                # The unique email_id index rejects duplicates inside the INSERT; RETURNING lists the new rows
+                statement = (
+                    sqlite_insert(Email)
+                    .on_conflict_do_nothing(index_elements=[Email.email_id])
+                    .returning(Email.id)
+                )
+                return len(connection.execute(statement, rows).all())
+            
+            # Other databases: leave out stored and repeated messages, found with one query
+            stored_ids = set(connection.scalars(
+                select(Email.email_id).where(Email.email_id.in_([row['email_id'] for row in rows]))
+            ))
+            new_rows = {}
+            for row in rows:
+                if row['email_id'] not in stored_ids:
+                    new_rows.setdefault(row['email_id'], row)
+            if new_rows:
+                connection.execute(insert(Email), list(new_rows.values()))
+            return len(new_rows)
+    
+    def bulk_insert_categories(self, rows: List[Dict]) -> int:
+        """Insert email category rows at once, returning how many were inserted"""
+        return self._bulk_insert(EmailCategory, rows)
+    
+    def bulk_insert_actions(self, rows: List[Dict]) -> int:
+        """Insert agent action rows at once, returning how many were inserted"""
+        return self._bulk_insert(AgentAction, rows)
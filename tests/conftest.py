@@ -1,12 +1,19 @@
 """Pytest configuration and fixtures for Gmail Invoice Agent tests."""
 
+import copy
 import pytest
 import yaml
 import tempfile
 import os
+import sys
 from unittest.mock import Mock
 from datetime import datetime
 
+# Add the parent directory to the path so we can import the config loader
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config_loader import YAML_DUMPER
+
 # Test fixtures for dummy data
 @pytest.fixture
 def sample_invoice_data():
@@ -49,9 +56,9 @@ def sample_concert_data():
         'processed_date': '2025-01-15 15:45:00'
     }
 
-@pytest.fixture
-def sample_config():
-    """Sample configuration for testing."""
+@pytest.fixture(scope="session")
+def sample_config_template():
+    """Sample configuration built once per test session; use sample_config in tests."""
     return {
         'gmail': {
             'credentials_file': 'config/gmail_credentials.json',
@@ -160,6 +167,11 @@ Return empty array [] if no concerts in Sweden found.'''
         }
     }
 
+@pytest.fixture
+def sample_config(sample_config_template):
+    """Sample configuration for testing (a fresh copy, safe to mutate)."""
+    return copy.deepcopy(sample_config_template)
+
 @pytest.fixture
 def mock_claude_client():
     """Mock Claude client for testing."""
@@ -193,10 +205,9 @@ def temp_output_dir():
     with tempfile.TemporaryDirectory() as tmpdir:
         yield tmpdir
 
-@pytest.fixture 
-def config_file(sample_config, temp_output_dir):
-    """Temporary config file for testing."""
-    config_path = os.path.join(temp_output_dir, 'test_config.yaml')
-    with open(config_path, 'w') as f:
-        yaml.dump(sample_config, f)
-    yield config_path
\ No newline at end of file
+@pytest.fixture(scope="session")
+def config_file(sample_config_template, tmp_path_factory):
+    """Temporary config file for testing, written once per test session."""
+    config_path = tmp_path_factory.mktemp('config') / 'test_config.yaml'
+    config_path.write_text(yaml.dump(sample_config_template, Dumper=YAML_DUMPER, allow_unicode=True), encoding='utf-8')
+    return str(config_path)
\ No newline at end of file
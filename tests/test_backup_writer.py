@@ -0,0 +1,54 @@
+"""Tests for the background email backup writer."""
+
+import sys
+import os
+import time
+
+# Add the parent directory to the path so we can import extractors
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from extractors import backup_writer
+from extractors.backup_writer import BackupWriter
+
+
+class TestBackupWriter:
+    """Test cases for BackupWriter."""
+
+    def test_close_writes_all_queued_entries_in_order(self, tmp_path):
+        """Test that every queued entry is on disk, in order, once the writer is closed."""
+        path = tmp_path / 'backup.txt'
+        writer = BackupWriter(str(path), 1024)
+
+        for i in range(500):
+            writer.write(f"entry {i}\n".encode('utf-8'))
+        writer.close()
+
+        assert path.read_text(encoding='utf-8') == ''.join(f"entry {i}\n" for i in range(500))
+
+    def test_close_is_idempotent(self, tmp_path):
+        """Test that closing twice (e.g. explicitly and at exit) is harmless."""
+        writer = BackupWriter(str(tmp_path / 'backup.txt'), 1024)
+
+        writer.close()
+        writer.close()
+
+    def test_entries_are_flushed_after_the_interval_not_per_write(self, tmp_path, monkeypatch):
+        """Test that written entries stay buffered until the flush interval passes."""
+        path = tmp_path / 'backup.txt'
+        monkeypatch.setattr(backup_writer, 'FLUSH_INTERVAL_SECONDS', 0.5)
+        writer = BackupWriter(str(path), 1024)
+
+        started = time.monotonic()
+        writer.write(b"entry 0\n")
+        while not writer._queue.empty():
+            time.sleep(0.01)
+        time.sleep(0.1)
+        buffered = path.read_bytes()
+        while not path.read_bytes() and time.monotonic() - started < 5:
+            time.sleep(0.01)
+        flushed_after = time.monotonic() - started
+        writer.close()
+
+        assert buffered == b""
+        assert path.read_bytes() == b"entry 0\n"
+        assert 0.4 <= flushed_after < 5
@@ -187,4 +187,13 @@ class TestConcertExtractor:
         
         # Check that prompt contains expected concert-specific content
         assert 'concerts in Sweden' in formatted_prompt
-        assert 'JSON array of concerts' in formatted_prompt
\ No newline at end of file
+        assert 'JSON array of concerts' in formatted_prompt
+    
+    def test_check_keywords_without_ahocorasick(self, concert_extractor, monkeypatch):
+        """Test that keyword matching falls back to a compiled regex when pyahocorasick is missing."""
+        monkeypatch.setattr('extractors.base_extractor.ahocorasick', None)
+        concert_extractor._keyword_matchers.clear()
+        
+        assert concert_extractor._check_keywords_in_content("Live i GÖTEBORG", ["göteborg", "malmö"]) is True
+        assert concert_extractor._check_keywords_in_content("Live in London", ["göteborg", "malmö"]) is False
+        assert concert_extractor._check_keywords_in_content("Anything", []) is False
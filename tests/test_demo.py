@@ -4,7 +4,7 @@ import pytest
 import tempfile
 import os
 import sys
-from unittest.mock import Mock, patch
+from unittest.mock import Mock, AsyncMock, patch
 from io import StringIO
 
 # Add the parent directory to the path so we can import demo
@@ -32,7 +32,7 @@ class TestDemoScript:
             mock_extractor = Mock()
             mock_extractor.get_search_keywords.return_value = ['invoice', 'faktura']
             mock_extractor.get_additional_search_filters.return_value = []
-            mock_extractor.extract.return_value = [{'test': 'data'}]
+            mock_extractor.extract_batch = AsyncMock(return_value=[{'test': 'data'}])
             mock_email_processor_instance.get_extractor_by_name.return_value = mock_extractor
             
             mock_email_processor.return_value = mock_email_processor_instance
@@ -46,7 +46,7 @@ class TestDemoScript:
                 'date': '2025-01-15 12:00:00',
                 'attachments': []
             }]
-            mock_gmail_server_instance.get_email_content.return_value = 'Test email content'
+            mock_gmail_server_instance.format_email_content.return_value = 'Test email content'
             mock_gmail_server.return_value = mock_gmail_server_instance
             
             # Setup CSVExporter mock
@@ -81,11 +81,11 @@ class TestDemoScript:
     @patch.dict('os.environ', {'CLAUDE_API_KEY': 'test-key'})
     @patch('demo.load_dotenv')
     @patch('builtins.open')
-    @patch('demo.yaml.safe_load')
-    def test_main_with_dummy_data_invoices_only(self, mock_yaml_load, mock_open, mock_load_dotenv, mock_components, sample_config):
+    @patch('demo.load_yaml_config')
+    def test_main_with_dummy_data_invoices_only(self, mock_load_config, mock_open, mock_load_dotenv, mock_components, sample_config):
         """Test main function with dummy data and invoices only."""
         # Setup mocks
-        mock_yaml_load.return_value = sample_config
+        mock_load_config.return_value = sample_config
         mock_components['email_processor_instance'].get_enabled_extractors.return_value = ['invoices']
         
         # Mock sys.argv
@@ -103,11 +103,11 @@ class TestDemoScript:
     @patch.dict('os.environ', {'CLAUDE_API_KEY': 'test-key'})
     @patch('demo.load_dotenv')
     @patch('builtins.open')
-    @patch('demo.yaml.safe_load')
-    def test_main_with_dummy_data_concerts_only(self, mock_yaml_load, mock_open, mock_load_dotenv, mock_components, sample_config):
+    @patch('demo.load_yaml_config')
+    def test_main_with_dummy_data_concerts_only(self, mock_load_config, mock_open, mock_load_dotenv, mock_components, sample_config):
         """Test main function with dummy data and concerts only."""
         # Setup mocks
-        mock_yaml_load.return_value = sample_config
+        mock_load_config.return_value = sample_config
         mock_components['email_processor_instance'].get_enabled_extractors.return_value = ['concerts']
         mock_components['email_processor_instance'].get_extractor_output_files.return_value = {'concerts': 'output/concerts.csv'}
         
@@ -124,11 +124,11 @@ class TestDemoScript:
     @patch.dict('os.environ', {'CLAUDE_API_KEY': 'test-key'})
     @patch('demo.load_dotenv')
     @patch('builtins.open')
-    @patch('demo.yaml.safe_load')
-    def test_main_with_all_extractors(self, mock_yaml_load, mock_open, mock_load_dotenv, mock_components, sample_config):
+    @patch('demo.load_yaml_config')
+    def test_main_with_all_extractors(self, mock_load_config, mock_open, mock_load_dotenv, mock_components, sample_config):
         """Test main function with all extractors."""
         # Setup mocks
-        mock_yaml_load.return_value = sample_config
+        mock_load_config.return_value = sample_config
         mock_components['email_processor_instance'].get_enabled_extractors.return_value = ['invoices', 'concerts']
         mock_components['email_processor_instance'].get_extractor_output_files.return_value = {
             'invoices': 'output/invoices.csv',
@@ -146,11 +146,11 @@ class TestDemoScript:
     
     @patch('demo.load_dotenv')
     @patch('builtins.open')
-    @patch('demo.yaml.safe_load')
-    def test_main_missing_claude_api_key(self, mock_yaml_load, mock_open, mock_load_dotenv, sample_config):
+    @patch('demo.load_yaml_config')
+    def test_main_missing_claude_api_key(self, mock_load_config, mock_open, mock_load_dotenv, sample_config):
         """Test main function when CLAUDE_API_KEY is missing."""
         # Setup mocks
-        mock_yaml_load.return_value = sample_config
+        mock_load_config.return_value = sample_config
         
         # Ensure CLAUDE_API_KEY is not set
         with patch.dict('os.environ', {}, clear=True):
@@ -165,11 +165,11 @@ class TestDemoScript:
     @patch.dict('os.environ', {'CLAUDE_API_KEY': 'test-key'})
     @patch('demo.load_dotenv')
     @patch('builtins.open')
-    @patch('demo.yaml.safe_load')
-    def test_main_with_date_range(self, mock_yaml_load, mock_open, mock_load_dotenv, mock_components, sample_config):
+    @patch('demo.load_yaml_config')
+    def test_main_with_date_range(self, mock_load_config, mock_open, mock_load_dotenv, mock_components, sample_config):
         """Test main function with date range parameters."""
         # Setup mocks
-        mock_yaml_load.return_value = sample_config
+        mock_load_config.return_value = sample_config
         mock_components['email_processor_instance'].get_enabled_extractors.return_value = ['invoices']
         
         # Mock sys.argv with date range
@@ -188,11 +188,11 @@ class TestDemoScript:
     @patch.dict('os.environ', {'CLAUDE_API_KEY': 'test-key'})
     @patch('demo.load_dotenv')
     @patch('builtins.open')
-    @patch('demo.yaml.safe_load')
-    def test_main_with_invalid_date_format(self, mock_yaml_load, mock_open, mock_load_dotenv, mock_components, sample_config):
+    @patch('demo.load_yaml_config')
+    def test_main_with_invalid_date_format(self, mock_load_config, mock_open, mock_load_dotenv, mock_components, sample_config):
         """Test main function with invalid date format."""
         # Setup mocks
-        mock_yaml_load.return_value = sample_config
+        mock_load_config.return_value = sample_config
         
         # Mock sys.argv with invalid date format
         test_args = ['demo.py', '--from-date', 'invalid-date']
@@ -206,11 +206,11 @@ class TestDemoScript:
     @patch.dict('os.environ', {'CLAUDE_API_KEY': 'test-key'})
     @patch('demo.load_dotenv')
     @patch('builtins.open')
-    @patch('demo.yaml.safe_load')
-    def test_main_with_invalid_date_range(self, mock_yaml_load, mock_open, mock_load_dotenv, mock_components, sample_config):
+    @patch('demo.load_yaml_config')
+    def test_main_with_invalid_date_range(self, mock_load_config, mock_open, mock_load_dotenv, mock_components, sample_config):
         """Test main function with from-date after to-date."""
         # Setup mocks
-        mock_yaml_load.return_value = sample_config
+        mock_load_config.return_value = sample_config
         
         # Mock sys.argv with invalid date range (from > to)
         test_args = ['demo.py', '--from-date', '2025-07-01', '--to-date', '2025-06-30']
@@ -224,11 +224,11 @@ class TestDemoScript:
     @patch.dict('os.environ', {'CLAUDE_API_KEY': 'test-key'})
     @patch('demo.load_dotenv')
     @patch('builtins.open')
-    @patch('demo.yaml.safe_load')
-    def test_main_mixed_date_parameters(self, mock_yaml_load, mock_open, mock_load_dotenv, mock_components, sample_config):
+    @patch('demo.load_yaml_config')
+    def test_main_mixed_date_parameters(self, mock_load_config, mock_open, mock_load_dotenv, mock_components, sample_config):
         """Test main function with conflicting date parameters."""
         # Setup mocks
-        mock_yaml_load.return_value = sample_config
+        mock_load_config.return_value = sample_config
         
         # Mock sys.argv with conflicting parameters
         test_args = ['demo.py', '--days-back', '7', '--from-date', '2025-06-30']
@@ -242,11 +242,11 @@ class TestDemoScript:
     @patch.dict('os.environ', {'CLAUDE_API_KEY': 'test-key'})
     @patch('demo.load_dotenv')
     @patch('builtins.open')
-    @patch('demo.yaml.safe_load')
-    def test_main_with_only_from_date(self, mock_yaml_load, mock_open, mock_load_dotenv, mock_components, sample_config):
+    @patch('demo.load_yaml_config')
+    def test_main_with_only_from_date(self, mock_load_config, mock_open, mock_load_dotenv, mock_components, sample_config):
         """Test main function with only from-date (should default to current date for to-date)."""
         # Setup mocks
-        mock_yaml_load.return_value = sample_config
+        mock_load_config.return_value = sample_config
         mock_components['email_processor_instance'].get_enabled_extractors.return_value = ['invoices']
         
         # Mock sys.argv with only from-date
@@ -308,12 +308,12 @@ class TestDemoScript:
         invoice_extractor = Mock()
         invoice_extractor.get_search_keywords.return_value = ['invoice', 'faktura']
         invoice_extractor.get_additional_search_filters.return_value = []
-        invoice_extractor.extract.return_value = [{'vendor': 'Test Vendor'}]
+        invoice_extractor.extract_batch = AsyncMock(return_value=[{'vendor': 'Test Vendor'}])
         
         concert_extractor = Mock()
         concert_extractor.get_search_keywords.return_value = ['concert', 'konsert']
         concert_extractor.get_additional_search_filters.return_value = []
-        concert_extractor.extract.return_value = [{'artist': 'Test Artist'}]
+        concert_extractor.extract_batch = AsyncMock(return_value=[{'artist': 'Test Artist'}])
         
         # Mock get_extractor_by_name to return different extractors
         def mock_get_extractor_by_name(name):
@@ -332,7 +332,7 @@ class TestDemoScript:
             'sender': 'test@example.com',
             'date': '2025-01-15 12:00:00'
         }]
-        mock_gmail_server.get_email_content.return_value = 'Test email content'
+        mock_gmail_server.format_email_content.return_value = 'Test email content'
         
         with patch('sys.stdout', new_callable=StringIO):
             result = demo.run_gmail_extraction(mock_email_processor, mock_gmail_server, mock_csv_exporter, sample_config)
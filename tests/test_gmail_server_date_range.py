@@ -9,9 +9,41 @@ import os
 # Add the parent directory to the path so we can import gmail_server
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
+from googleapiclient.errors import HttpError
 from gmail_server import GmailServer
 
 
+def fake_batch_factory(batches, fail_ids=(), subjects=None, throttle_once_ids=()):
+    """Build a new_batch_http_request stand-in that answers every added request through the callback."""
+    throttled = set()
+    
+    def new_batch_http_request(callback):
+        request_ids = []
+        batch = Mock()
+        batch.add.side_effect = lambda request, request_id: request_ids.append(request_id)
+        
+        def execute():
+            for request_id in request_ids:
+                if request_id in fail_ids:
+                    callback(request_id, None, RuntimeError("fetch failed"))
+                    continue
+                if request_id in throttle_once_ids and request_id not in throttled:
+                    throttled.add(request_id)
+                    callback(request_id, None, HttpError(Mock(status=429), b'rateLimitExceeded'))
+                    continue
+                subject = (subjects or {}).get(request_id, f'Subject {request_id}')
+                callback(request_id, {'payload': {
+                    'mimeType': 'text/plain', 'body': {},
+                    'headers': [{'name': 'Subject', 'value': subject}],
+                }}, None)
+        
+        batch.execute.side_effect = execute
+        batches.append(batch)
+        return batch
+    
+    return new_batch_http_request
+
+
 class TestGmailServerDateRange:
     """Test cases for GmailServer date range functionality."""
     
@@ -76,6 +108,36 @@ class TestGmailServerDateRange:
                 assert 'before:' not in query
                 assert 'invoice' in query
     
+    def test_build_search_query_with_exclusions(self, mock_config):
+        """Test that exclusions are added as terms every result must satisfy."""
+        with patch('gmail_server.build'), \
+             patch('gmail_server.Credentials'), \
+             patch('gmail_server.InstalledAppFlow'), \
+             patch('os.path.exists', return_value=True):
+            
+            gmail_server = GmailServer('fake_creds.json', 'fake_token.json', ['scope'], mock_config)
+            
+            query = gmail_server._build_search_query(
+                datetime(2025, 6, 30), ['faktura'], ['has:attachment filename:pdf'],
+                exclusions=['-category:promotions', '-category:social'])
+            
+            assert query.endswith(') -category:promotions -category:social')
+            assert 'OR has:attachment filename:pdf)' in query
+    
+    def test_build_search_query_groups_keywords(self, mock_config):
+        """Test that all keywords share one subject group and one body group."""
+        with patch('gmail_server.build'), \
+             patch('gmail_server.Credentials'), \
+             patch('gmail_server.InstalledAppFlow'), \
+             patch('os.path.exists', return_value=True):
+            
+            gmail_server = GmailServer('fake_creds.json', 'fake_token.json', ['scope'], mock_config)
+            
+            query = gmail_server._build_search_query(datetime(2025, 6, 30), ['faktura', 'order confirmation'])
+            
+            assert query == ('after:2025/06/30 ((subject:(faktura OR "order confirmation") '
+                             'OR (faktura OR "order confirmation")))')
+    
     def test_fetch_emails_for_extractors_with_date_range(self, mock_config):
         """Test fetch_emails_for_extractors with date range configuration."""
         # Add date range configuration
@@ -147,4 +209,200 @@ class TestGmailServerDateRange:
                     assert len(call_args) == 3
                     start_date, passed_keywords, additional_filters = call_args
                     
-                    assert passed_keywords == keywords
\ No newline at end of file
+                    assert passed_keywords == keywords
+    
+    def test_get_email_details_many_keeps_order_and_skips_failures(self, mock_config):
+        """Test that batch-fetched messages come back in list order without failed fetches."""
+        with patch('gmail_server.build') as mock_build:
+            mock_service = Mock()
+            mock_build.return_value = mock_service
+            
+            with patch('gmail_server.Credentials'), \
+                 patch('gmail_server.InstalledAppFlow'), \
+                 patch('os.path.exists', return_value=True):
+                
+                gmail_server = GmailServer('fake_creds.json', 'fake_token.json', ['scope'], mock_config)
+                
+                batches = []
+                mock_service.new_batch_http_request.side_effect = fake_batch_factory(batches, fail_ids={'broken'})
+                emails = gmail_server._get_email_details_many([{'id': 'a'}, {'id': 'broken'}, {'id': 'b'}])
+                
+                assert [email_data['id'] for email_data in emails] == ['a', 'b']
+                assert emails[0]['subject'] == 'Subject a'
+                assert len(batches) == 1
+    
+    def test_batched_requests_retry_throttled_messages(self, mock_config):
+        """Test that messages Gmail rate limited inside a batch are fetched again after a backoff."""
+        with patch('gmail_server.build') as mock_build:
+            mock_service = Mock()
+            mock_build.return_value = mock_service
+            
+            with patch('gmail_server.Credentials'), \
+                 patch('gmail_server.InstalledAppFlow'), \
+                 patch('os.path.exists', return_value=True):
+                
+                gmail_server = GmailServer('fake_creds.json', 'fake_token.json', ['scope'], mock_config)
+                
+                batches = []
+                mock_service.new_batch_http_request.side_effect = fake_batch_factory(
+                    batches, throttle_once_ids={'b'})
+                with patch('gmail_server.time.sleep') as mock_sleep:
+                    emails = gmail_server._get_email_details_many([{'id': 'a'}, {'id': 'b'}])
+                
+                assert [email_data['id'] for email_data in emails] == ['a', 'b']
+                assert len(batches) == 2
+                assert batches[1].add.call_count == 1
+                mock_sleep.assert_called_once()
+    
+    def test_metadata_filter_skips_full_fetch_of_rejected_emails(self, mock_config):
+        """Test that only emails accepted on sender/subject are fetched in full."""
+        with patch('gmail_server.build') as mock_build:
+            mock_service = Mock()
+            mock_service.users().messages().list().execute.return_value = {'messages': [{'id': 'a'}, {'id': 'b'}]}
+            mock_build.return_value = mock_service
+            
+            with patch('gmail_server.Credentials'), \
+                 patch('gmail_server.InstalledAppFlow'), \
+                 patch('os.path.exists', return_value=True):
+                
+                gmail_server = GmailServer('fake_creds.json', 'fake_token.json', ['scope'], mock_config)
+                
+                batches = []
+                mock_service.new_batch_http_request.side_effect = fake_batch_factory(
+                    batches, subjects={'a': 'Faktura mars', 'b': 'Newsletter'})
+                emails = gmail_server.fetch_emails_for_extractors(
+                    ['faktura'], metadata_filter=lambda sender, subject: 'faktura' in subject.lower())
+                
+                assert [email_data['id'] for email_data in emails] == ['a']
+                assert len(batches) == 2
+                assert batches[1].add.call_count == 1
+    
+    def test_extract_email_body_prefers_plain_text_parts(self, mock_config):
+        """Test that HTML parts are only used when a multipart message has no plain text."""
+        import base64
+        encode = lambda text: base64.urlsafe_b64encode(text.encode('utf-8')).decode('ascii')
+        
+        with patch('gmail_server.build'), \
+             patch('gmail_server.Credentials'), \
+             patch('gmail_server.InstalledAppFlow'), \
+             patch('os.path.exists', return_value=True):
+            
+            gmail_server = GmailServer('fake_creds.json', 'fake_token.json', ['scope'], mock_config)
+            
+            html_part = {'mimeType': 'text/html', 'body': {'data': encode('<p>Faktura</p>')}}
+            plain_parts = [{'mimeType': 'text/plain', 'body': {'data': encode('Faktura ')}},
+                           {'mimeType': 'text/plain', 'body': {'data': encode('förfaller')}}]
+            
+            assert gmail_server._extract_email_body({'parts': [html_part] + plain_parts}) == 'Faktura förfaller'
+            assert gmail_server._extract_email_body({'parts': [html_part]}) == '<p>Faktura</p>'
+    
+    def test_authenticated_service_is_reused_across_instances(self, mock_config, tmp_path, monkeypatch):
+        """Test that a second GmailServer with the same unchanged token reuses the built service."""
+        import gmail_server as gmail_server_module
+        monkeypatch.setattr(gmail_server_module, '_services', {})
+        token_file = tmp_path / 'token.json'
+        token_file.write_text('{}')
+        
+        with patch('gmail_server.build') as mock_build, \
+             patch('gmail_server.Credentials') as mock_credentials:
+            mock_credentials.from_authorized_user_file.return_value = Mock(valid=True)
+            
+            first = GmailServer('fake_creds.json', str(token_file), ['scope'], mock_config)
+            second = GmailServer('fake_creds.json', str(token_file), ['scope'], mock_config)
+            
+            assert second.service is first.service
+            assert mock_build.call_count == 1
+    
+    def test_pdf_attachments_are_downloaded_in_a_batch(self, mock_config):
+        """Test that PDFs of batch-fetched messages are prefetched together and not downloaded one by one."""
+        import base64
+        
+        with patch('gmail_server.build'), \
+             patch('gmail_server.Credentials'), \
+             patch('gmail_server.InstalledAppFlow'), \
+             patch('os.path.exists', return_value=True):
+            
+            gmail_server = GmailServer('fake_creds.json', 'fake_token.json', ['scope'], mock_config)
+            
+            def message_with_pdf(message_id):
+                return {'payload': {'mimeType': 'multipart/mixed', 'headers': [], 'parts': [
+                    {'mimeType': 'application/pdf', 'filename': f'{message_id}.pdf',
+                     'body': {'attachmentId': f'att-{message_id}', 'size': 100}},
+                ]}}
+            
+            messages = {'a': message_with_pdf('a'), 'b': message_with_pdf('b')}
+            attachments = {message_id: {'data': base64.urlsafe_b64encode(b'%PDF').decode('ascii')}
+                           for message_id in messages}
+            
+            with patch.object(gmail_server, '_fetch_messages', return_value=messages), \
+                 patch.object(gmail_server, '_execute_batched', return_value=attachments) as mock_batched, \
+                 patch.object(gmail_server, '_download_pdf_attachment') as mock_download, \
+                 patch.object(gmail_server, '_extract_pdf_texts', return_value={}), \
+                 patch.object(gmail_server, '_extract_pdf_text', return_value='Faktura 100 kr'):
+                emails = gmail_server._get_email_details_many([{'id': 'a'}, {'id': 'b'}])
+            
+            assert [email_data['pdf_text'] for email_data in emails] == ['Faktura 100 kr', 'Faktura 100 kr']
+            assert set(mock_batched.call_args[0][0]) == {'a', 'b'}
+            mock_download.assert_not_called()
+    
+    def test_pdfs_of_several_emails_are_parsed_in_the_worker_pool(self, mock_config):
+        """Test that each downloaded PDF becomes its own worker job and no PDF is parsed again in-process."""
+        from concurrent.futures import ThreadPoolExecutor
+        
+        with patch('gmail_server.build'), \
+             patch('gmail_server.Credentials'), \
+             patch('gmail_server.InstalledAppFlow'), \
+             patch('os.path.exists', return_value=True):
+            
+            gmail_server = GmailServer('fake_creds.json', 'fake_token.json', ['scope'], mock_config)
+            
+            def message_with_pdf(message_id):
+                return {'payload': {'mimeType': 'multipart/mixed', 'headers': [], 'parts': [
+                    {'mimeType': 'application/pdf', 'filename': f'{message_id}.pdf',
+                     'body': {'attachmentId': f'att-{message_id}', 'size': 100}},
+                ]}}
+            
+            messages = {'a': message_with_pdf('a'), 'b': message_with_pdf('b')}
+            
+            with ThreadPoolExecutor(max_workers=2) as pool, \
+                 patch('gmail_server._get_pdf_pool', return_value=pool), \
+                 patch('gmail_server._extract_pdf_document_text',
+                       side_effect=lambda pdf_bytes, filename, skip_protected: '' if filename == 'b.pdf' else 'Faktura'), \
+                 patch.object(gmail_server, '_fetch_messages', return_value=messages), \
+                 patch.object(gmail_server, '_fetch_pdf_attachments', return_value={'a': b'%PDF-a', 'b': b'%PDF-b'}), \
+                 patch.object(gmail_server, '_extract_pdf_text') as mock_extract:
+                emails = gmail_server._get_email_details_many([{'id': 'a'}, {'id': 'b'}])
+            
+            assert emails[0]['pdf_text'] == 'Faktura'
+            assert emails[1]['pdf_processing_error'] == 'No text extracted from PDF'
+            mock_extract.assert_not_called()
+    
+    def test_gmail_json_model_decodes_responses(self):
+        """Test that the Gmail response model decodes JSON bodies and passes other content through."""
+        from gmail_server import GmailJsonModel
+        
+        model = GmailJsonModel()
+        
+        assert model.deserialize(b'{"id": "a", "labelIds": ["INBOX"]}') == {'id': 'a', 'labelIds': ['INBOX']}
+        assert model.deserialize(b'') == ''
+    
+    def test_get_email_content_reuses_fetched_emails(self, mock_config):
+        """Test that emails returned by a batch fetch are not fetched again for their content."""
+        with patch('gmail_server.build') as mock_build:
+            mock_service = Mock()
+            mock_build.return_value = mock_service
+            
+            with patch('gmail_server.Credentials'), \
+                 patch('gmail_server.InstalledAppFlow'), \
+                 patch('os.path.exists', return_value=True):
+                
+                gmail_server = GmailServer('fake_creds.json', 'fake_token.json', ['scope'], mock_config)
+                
+                batches = []
+                mock_service.new_batch_http_request.side_effect = fake_batch_factory(batches)
+                gmail_server._get_email_details_many([{'id': 'a'}])
+                
+                with patch.object(gmail_server, '_fetch_message') as mock_fetch:
+                    gmail_server.get_email_content('a')
+                
+                mock_fetch.assert_not_called()
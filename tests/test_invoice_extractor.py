@@ -1,9 +1,10 @@
 """Tests for the InvoiceExtractor class."""
 
 import pytest
+import asyncio
 import sys
 import os
-from unittest.mock import Mock
+from unittest.mock import Mock, AsyncMock, MagicMock
 
 # Add the parent directory to the path so we can import extractors
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -61,6 +62,23 @@ class TestInvoiceExtractor:
         result = invoice_extractor.should_process(email_content, sender, subject)
         assert result is False
     
+    def test_get_search_exclusions(self, invoice_extractor):
+        """Test that invoice searches skip the promotions and social tabs by default."""
+        assert invoice_extractor.get_search_exclusions() == ['-category:promotions', '-category:social']
+    
+    def test_should_process_metadata(self, invoice_extractor):
+        """Test that sender and subject alone decide whether the body is worth fetching."""
+        assert invoice_extractor.should_process_metadata("billing@company.com", "Your invoice #123")
+        assert not invoice_extractor.should_process_metadata("marketing@company.com", "Weekly Updates")
+    
+    def test_metadata_filter_is_opt_in(self, sample_config, mock_claude_client):
+        """Test that search hits are only prefiltered on sender and subject when configured."""
+        config = sample_config['extractors']['invoices']
+        
+        assert InvoiceExtractor(config, mock_claude_client).get_metadata_filter() is None
+        extractor = InvoiceExtractor({**config, 'metadata_prefilter': True}, mock_claude_client)
+        assert extractor.get_metadata_filter() == extractor.should_process_metadata
+    
     def test_clean_amount(self, invoice_extractor):
         """Test amount cleaning functionality."""
         assert invoice_extractor._clean_amount("25.50 kr") == "25.5"
@@ -75,6 +93,13 @@ class TestInvoiceExtractor:
         # European format: day.month.year -> year-month-day
         assert invoice_extractor._clean_date("15.01.2025") == "2025-01-15"
     
+    def test_clean_date_compact_and_embedded_formats(self, invoice_extractor):
+        """Test that compact dates must be exactly eight digits and other formats are found inside text."""
+        assert invoice_extractor._clean_date("20250115") == "2025-01-15"
+        assert invoice_extractor._clean_date("OCR 1234567890") == "OCR 1234567890"
+        assert invoice_extractor._clean_date("Förfaller 5.3.2025") == "2025-03-05"
+        assert invoice_extractor._clean_date("Due 2025-3-4") == "2025-03-04"
+    
     def test_extract_with_valid_invoice(self, invoice_extractor, sample_email_metadata, mock_claude_client):
         """Test extraction of valid invoice data."""
         # Mock Claude response for valid invoice
@@ -148,4 +173,335 @@ class TestInvoiceExtractor:
         
         # Check that email content was included
         assert 'Test invoice content' in formatted_prompt
-        assert sample_email_metadata['subject'] in formatted_prompt
\ No newline at end of file
+        assert sample_email_metadata['subject'] in formatted_prompt
+    
+    def test_extract_batch_uses_async_client(self, invoice_extractor, sample_email_metadata):
+        """Test that extract_batch calls the async client once per email and keeps input order."""
+        mock_content = Mock()
+        mock_content.text = '{"is_invoice": true, "vendor": "Async Vendor", "amount": "10"}'
+        mock_response = Mock()
+        mock_response.content = [mock_content]
+        invoice_extractor.async_claude = Mock()
+        invoice_extractor.async_claude.messages.create = AsyncMock(return_value=mock_response)
+        
+        emails = [
+            ("Invoice one", {**sample_email_metadata, 'id': 'email_1'}),
+            ("Invoice two", {**sample_email_metadata, 'id': 'email_2'}),
+        ]
+        results = asyncio.run(invoice_extractor.extract_batch(emails))
+        
+        assert [result['email_id'] for result in results] == ['email_1', 'email_2']
+        assert all(result['vendor'] == 'Async Vendor' for result in results)
+        assert invoice_extractor.async_claude.messages.create.await_count == 2
+    
+    def test_extract_batch_uses_message_batches_when_configured(self, sample_config, mock_claude_client,
+                                                                sample_email_metadata):
+        """Test that extract_batch hands all emails to extract_offline when use_batch_api is set."""
+        config = {**sample_config['extractors']['invoices'], 'use_batch_api': True}
+        extractor = InvoiceExtractor(config, mock_claude_client)
+        extractor.extract_offline = Mock(return_value=[{'email_id': 'email_1'}])
+        
+        emails = [("Invoice one", {**sample_email_metadata, 'id': 'email_1'})]
+        results = asyncio.run(extractor.extract_batch(emails))
+        
+        assert results == [{'email_id': 'email_1'}]
+        extractor.extract_offline.assert_called_once_with(emails)
+    
+    def test_clean_text(self, invoice_extractor):
+        """Test that typographic characters are normalized and control characters removed."""
+        assert invoice_extractor._clean_text("Vattenfall’s “faktura” – 100 kr") == "Vattenfall's \"faktura\" - 100 kr"
+        assert invoice_extractor._clean_text("Rad 1\x00\x07\nRad 2\tslut") == "Rad 1\nRad 2\tslut"
+        assert invoice_extractor._clean_text("") == ""
+    
+    def test_response_cache_skips_repeat_calls(self, sample_config, mock_claude_client, tmp_path):
+        """Test that an identical prompt is answered from the response cache."""
+        mock_content = Mock()
+        mock_content.text = '{"is_invoice": false}'
+        mock_response = Mock()
+        mock_response.content = [mock_content]
+        mock_claude_client.messages.create.return_value = mock_response
+        
+        config = {**sample_config['extractors']['invoices'],
+                  'response_cache': {'enabled': True, 'path': str(tmp_path / 'cache.db')}}
+        extractor = InvoiceExtractor(config, mock_claude_client)
+        
+        assert extractor._call_claude("Same prompt") == '{"is_invoice": false}'
+        assert extractor._call_claude("Same prompt") == '{"is_invoice": false}'
+        assert mock_claude_client.messages.create.call_count == 1
+    
+    def test_extract_offline_uses_message_batches(self, sample_config, mock_claude_client, sample_email_metadata):
+        """Test that extract_offline submits one batch and maps results back by custom_id."""
+        config = {**sample_config['extractors']['invoices'], 'use_batch_api': True}
+        extractor = InvoiceExtractor(config, mock_claude_client)
+        
+        batch = Mock(id='batch_1', processing_status='ended')
+        mock_claude_client.messages.batches.create.return_value = batch
+        
+        def make_entry(custom_id, vendor):
+            entry = Mock(custom_id=custom_id)
+            entry.result.type = 'succeeded'
+            entry.result.message.content = [Mock(text=f'{{"is_invoice": true, "vendor": "{vendor}", "amount": "5"}}')]
+            return entry
+        mock_claude_client.messages.batches.results.return_value = [
+            make_entry('email-1', 'Second'), make_entry('email-0', 'First')
+        ]
+        
+        emails = [
+            ("Invoice one", {**sample_email_metadata, 'id': 'email_1'}),
+            ("Invoice two", {**sample_email_metadata, 'id': 'email_2'}),
+        ]
+        results = extractor.extract_offline(emails)
+        
+        submitted = mock_claude_client.messages.batches.create.call_args.kwargs['requests']
+        assert [request['custom_id'] for request in submitted] == ['email-0', 'email-1']
+        assert [result['vendor'] for result in results] == ['First', 'Second']
+        mock_claude_client.messages.create.assert_not_called()
+    
+    @staticmethod
+    def answer_message_batches(mock_claude_client, response_text):
+        """Make every submitted message batch end at once with the same response for each request."""
+        mock_claude_client.messages.batches.create.return_value = Mock(id='batch_1', processing_status='ended')
+        
+        def results(batch_id):
+            entries = []
+            for request in mock_claude_client.messages.batches.create.call_args.kwargs['requests']:
+                entry = Mock(custom_id=request['custom_id'])
+                entry.result.type = 'succeeded'
+                entry.result.message.content = [Mock(text=response_text)]
+                entries.append(entry)
+            return entries
+        mock_claude_client.messages.batches.results.side_effect = results
+    
+    def test_extract_offline_remembers_rejections(self, sample_config, mock_claude_client,
+                                                  sample_email_metadata, tmp_path):
+        """Test that offline extraction stores rejections and answers them from the cache on the next batch."""
+        config = {**sample_config['extractors']['invoices'], 'use_batch_api': True,
+                  'response_cache': {'enabled': True, 'path': str(tmp_path / 'cache.db')}}
+        extractor = InvoiceExtractor(config, mock_claude_client)
+        self.answer_message_batches(mock_claude_client, '{"is_invoice": false}')
+        emails = [("Newsletter about invoices", sample_email_metadata)]
+        
+        first = extractor.extract_offline(emails)
+        extractor._build_extraction_request = Mock(side_effect=AssertionError("prompt built for a known rejection"))
+        second = extractor.extract_offline(emails)
+        
+        assert first[0]['extracted'] is False
+        assert second[0]['extracted'] is False
+        assert not second[0]['claude_reasoning_before'].startswith('Processing failed')
+        assert mock_claude_client.messages.batches.create.call_count == 1
+    
+    def test_extract_offline_uses_near_duplicate_cache(self, sample_config, mock_claude_client,
+                                                       sample_email_metadata, tmp_path):
+        """Test that offline extraction fills and reads the near-duplicate cache."""
+        config = {**sample_config['extractors']['invoices'], 'use_batch_api': True,
+                  'response_cache': {'enabled': True, 'path': str(tmp_path / 'cache.db')},
+                  'near_duplicate_cache': {'enabled': True, 'ttl_minutes': 5}}
+        extractor = InvoiceExtractor(config, mock_claude_client)
+        self.answer_message_batches(mock_claude_client, '{"is_invoice": true, "vendor": "Vendor AB", "amount": "100"}')
+        
+        extractor.extract_offline([("Faktura 100 kr https://track.example.com/a1", {**sample_email_metadata, 'id': 'a'})])
+        results = extractor.extract_offline([
+            ("Faktura 100 kr https://track.example.com/b2", {**sample_email_metadata, 'id': 'b'}),
+        ])
+        
+        assert results[0]['vendor'] == 'Vendor AB'
+        assert mock_claude_client.messages.batches.create.call_count == 1
+    
+    def test_clean_text_removes_lone_surrogates(self, invoice_extractor):
+        """Test that cleaned text is always UTF-8 encodable."""
+        cleaned = invoice_extractor._clean_text("Faktura\ud800 100 kr\udfff")
+        
+        assert cleaned == "Faktura 100 kr"
+        cleaned.encode('utf-8')
+    
+    def test_large_max_tokens_uses_streaming(self, invoice_extractor, mock_claude_client):
+        """Test that requests with a large output budget are streamed."""
+        mock_response = Mock()
+        mock_response.content = [Mock(text='[{"vendor": "Streamed"}]')]
+        mock_claude_client.messages.stream = MagicMock()
+        stream = mock_claude_client.messages.stream.return_value.__enter__.return_value
+        stream.get_final_message.return_value = mock_response
+        
+        assert invoice_extractor._call_claude("Prompt", max_tokens=8000) == '[{"vendor": "Streamed"}]'
+        mock_claude_client.messages.create.assert_not_called()
+    
+    def test_response_cache_key_includes_request_settings(self):
+        """Test that max_tokens and template_version changes miss the response cache."""
+        from extractors.response_cache import ResponseCache
+        
+        base_key = ResponseCache.make_key('model', 1000, '1', 'prompt')
+        
+        assert base_key == ResponseCache.make_key('model', 1000, '1', 'prompt')
+        assert base_key != ResponseCache.make_key('model', 1500, '1', 'prompt')
+        assert base_key != ResponseCache.make_key('model', 1000, '2', 'prompt')
+    
+    def test_near_duplicate_cache_ignores_tracking_urls(self, sample_config, mock_claude_client,
+                                                        sample_email_metadata, tmp_path):
+        """Test that emails differing only in tracking URLs reuse one Claude response."""
+        config = {**sample_config['extractors']['invoices'],
+                  'response_cache': {'enabled': True, 'path': str(tmp_path / 'cache.db')},
+                  'near_duplicate_cache': {'enabled': True, 'ttl_minutes': 5}}
+        extractor = InvoiceExtractor(config, mock_claude_client)
+        
+        extractor.extract("Faktura 100 kr https://track.example.com/a1", {**sample_email_metadata, 'id': 'a'})
+        extractor.extract("Faktura 100 kr https://track.example.com/b2", {**sample_email_metadata, 'id': 'b'})
+        extractor.extract("Faktura 250 kr https://track.example.com/c3", {**sample_email_metadata, 'id': 'c'})
+        
+        assert mock_claude_client.messages.create.call_count == 2
+    
+    def test_near_duplicate_key_covers_pdf_text_and_sender(self):
+        """Test that emails differing only in the PDF amount, or in the sender, get different keys."""
+        from extractors.response_cache import ResponseCache
+        
+        body = "Hej! Här kommer din månadsfaktura. " * 100
+        
+        def key(sender, pdf_amount):
+            email_content = f"{body}\n\n--- PDF CONTENT ---\nAtt betala: {pdf_amount} kr\nFörfallodatum: 2025-07-31"
+            return ResponseCache.make_near_duplicate_key('invoices', 'model', 1000, '1', sender,
+                                                         'Din faktura', email_content)
+        
+        assert len(body) > 3000
+        assert key('billing@vattenfall.se', 512) == key('Billing@Vattenfall.se', 512)
+        assert key('billing@vattenfall.se', 512) != key('billing@vattenfall.se', 498)
+        assert key('billing@vattenfall.se', 512) != key('billing@eon.se', 512)
+    
+    def test_prompt_caching_splits_static_instructions(self, sample_config, mock_claude_client, sample_email_metadata):
+        """Test that prompt caching sends the instructions as a cached system block and the email as the user message."""
+        config = {**sample_config['extractors']['invoices'], 'prompt_caching': True}
+        extractor = InvoiceExtractor(config, mock_claude_client)
+        
+        first = extractor._build_extraction_request("Faktura ett", sample_email_metadata)
+        second = extractor._build_extraction_request("Faktura två", sample_email_metadata)
+        
+        assert first['system'] == second['system']
+        assert first['system'][0]['cache_control'] == {"type": "ephemeral"}
+        assert 'faktura, räkning' in first['system'][0]['text']
+        assert 'Faktura ett' in first['messages'][0]['content']
+        assert first['messages'][0]['content'].startswith("<email>")
+        assert 'Faktura ett' not in first['system'][0]['text']
+    
+    def test_batch_requests_cache_prompt_for_an_hour(self, sample_config, mock_claude_client, sample_email_metadata):
+        """Test that Message Batches requests use the 1 hour prompt cache lifetime."""
+        config = {**sample_config['extractors']['invoices'], 'prompt_caching': True, 'use_batch_api': True}
+        extractor = InvoiceExtractor(config, mock_claude_client)
+        
+        request = extractor._build_extraction_request("Faktura ett", sample_email_metadata)
+        
+        assert request['system'][0]['cache_control'] == {"type": "ephemeral", "ttl": "1h"}
+    
+    def test_should_process_cached_reuses_decision(self, invoice_extractor, monkeypatch):
+        """Test that a repeated email is classified once and then answered from the decision cache."""
+        calls = []
+        original = invoice_extractor.should_process
+        monkeypatch.setattr(invoice_extractor, 'should_process',
+                            lambda *args, **kwargs: calls.append(args) or original(*args, **kwargs))
+        
+        args = ("Faktura att betala 100 kr", "billing@vattenfall.se", "Faktura från Vattenfall")
+        
+        assert invoice_extractor.should_process_cached(*args) is True
+        assert invoice_extractor.should_process_cached(*args) is True
+        assert len(calls) == 1
+    
+    def test_prompt_body_fills_limit_after_cleaning(self, invoice_extractor, sample_email_metadata):
+        """Test that characters removed by cleaning do not shorten the body sent to Claude."""
+        from extractors.base_extractor import PROMPT_BODY_GAP, PROMPT_BODY_HEAD_LENGTH, PROMPT_BODY_TAIL_LENGTH
+        
+        email_content = "\x00" * 100 + "a" * (2 * PROMPT_BODY_HEAD_LENGTH) + "b" * (2 * PROMPT_BODY_TAIL_LENGTH)
+        email_block = invoice_extractor._format_email_block(email_content, sample_email_metadata)
+        
+        expected_body = "a" * PROMPT_BODY_HEAD_LENGTH + PROMPT_BODY_GAP + "b" * PROMPT_BODY_TAIL_LENGTH
+        assert "Body: " + expected_body + "\n" in email_block
+    
+    def test_prompt_body_collapses_whitespace(self, invoice_extractor, sample_email_metadata):
+        """Test that short bodies are sent whole with whitespace runs and repeated attachments collapsed."""
+        metadata = {**sample_email_metadata, 'attachments': [{'filename': 'faktura.pdf'}, {'filename': 'faktura.pdf'}]}
+        email_content = "Faktura   nr\t\t123\n\n\n\n  Att betala: 450 kr"
+        
+        email_block = invoice_extractor._format_email_block(email_content, metadata)
+        
+        assert "Body: Faktura nr 123\n\nAtt betala: 450 kr\n" in email_block
+        assert "Attachments: ['faktura.pdf']" in email_block
+    
+    def test_clean_batch_matches_per_record_cleaning(self, invoice_extractor):
+        """Test that vectorized batch cleaning gives the same values as the per-record helpers."""
+        amounts = ["25.50 kr", "1,250.00", "€100", "", "abc"]
+        dates = ["2025-01-15", "01/15/2025", "15.01.2025", "20250115", "2025-1-5", "", "bad"]
+        records = [
+            {'extracted': True, 'amount': amounts[i % len(amounts)],
+             'due_date': dates[i % len(dates)], 'invoice_date': dates[(i + 3) % len(dates)]}
+            for i in range(40)
+        ]
+        
+        expected = [
+            {**record,
+             'amount': invoice_extractor._clean_amount(record['amount']),
+             'due_date': invoice_extractor._clean_date(record['due_date']),
+             'invoice_date': invoice_extractor._clean_date(record['invoice_date'])}
+            for record in records
+        ]
+        
+        assert invoice_extractor.clean_batch(records) == expected
+    
+    def test_clean_amount_series_matches_clean_amount_on_edge_inputs(self, invoice_extractor):
+        """Test that the batch amount cleaner parses exactly like the per-record one, odd inputs included."""
+        import pandas as pd
+        
+        amounts = ['1_000', 'NaN', 'inf', '١٢٣', '１２', ' 12 ', '1e3', '0x10', '1 234,50 kr', 'abc',
+                   '', None, 0, 25, 12.5, float('nan')]
+        
+        expected = [invoice_extractor._clean_amount(amount) for amount in amounts]
+        cleaned = invoice_extractor._clean_amount_series(pd.Series(amounts, dtype=object))
+        
+        assert list(cleaned) == expected
+        assert expected[:5] == ['1000.0', 'nan', 'inf', '123.0', '12.0']
+    
+    def test_parse_json_response_with_brackets_after_json(self, invoice_extractor):
+        """Test that reasoning after the JSON may contain braces without breaking parsing."""
+        response_text = 'Looks like an invoice.\n{"invoice_number": "INV-1", "amount": 10}\nNote: {unsure} about due date'
+        
+        parsed, reasoning = invoice_extractor._parse_json_response(response_text)
+        
+        assert parsed == {"invoice_number": "INV-1", "amount": 10}
+        assert reasoning["before"] == "Looks like an invoice."
+        assert "{unsure}" in reasoning["after"]
+    
+    def test_rejected_email_skips_claude_on_repeat(self, sample_config, mock_claude_client,
+                                                    sample_email_metadata, tmp_path):
+        """Test that an email Claude rejected is answered without building a prompt the next time."""
+        mock_content = Mock()
+        mock_content.text = '{"is_invoice": false}'
+        mock_response = Mock()
+        mock_response.content = [mock_content]
+        mock_claude_client.messages.create.return_value = mock_response
+        
+        config = {**sample_config['extractors']['invoices'],
+                  'response_cache': {'enabled': True, 'path': str(tmp_path / 'cache.db')}}
+        extractor = InvoiceExtractor(config, mock_claude_client)
+        first = extractor.extract("Newsletter about invoices", sample_email_metadata)
+        
+        extractor._build_extraction_request = Mock(side_effect=AssertionError("prompt built for a known rejection"))
+        second = extractor.extract("Newsletter about invoices", sample_email_metadata)
+        
+        assert first[0]['extracted'] is False
+        assert second[0]['extracted'] is False
+        assert mock_claude_client.messages.create.call_count == 1
+    
+    def test_local_classifier_rejects_without_claude(self, invoice_extractor, sample_email_metadata, mock_claude_client):
+        """Test that a low local classifier score rejects the email and a high one still asks Claude."""
+        mock_content = Mock()
+        mock_content.text = '{"is_invoice": true, "vendor": "Vendor AB", "amount": "100"}'
+        mock_response = Mock()
+        mock_response.content = [mock_content]
+        mock_claude_client.messages.create.return_value = mock_response
+        
+        invoice_extractor._local_classifier = Mock()
+        invoice_extractor._local_classifier.predict_proba.return_value = [[0.95, 0.05]]
+        rejected = invoice_extractor.extract("Nyhetsbrev", sample_email_metadata)
+        
+        invoice_extractor._local_classifier.predict_proba.return_value = [[0.4, 0.6]]
+        accepted = invoice_extractor.extract("Faktura 100 kr", sample_email_metadata)
+        
+        assert rejected[0]['extracted'] is False
+        assert 'Local classifier' in rejected[0]['claude_reasoning_before']
+        assert accepted[0]['extracted'] is True
+        assert mock_claude_client.messages.create.call_count == 1
@@ -3,20 +3,65 @@
 import pytest
 import sys
 import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from unittest.mock import Mock, patch
 
 # Add the parent directory to the path so we can import modules
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
+import gmail_server as gmail_server_module
 from gmail_server import GmailServer
 
 
+# The real worker pool, before the fixtures swap in an in-process one
+start_pdf_pool = gmail_server_module._get_pdf_pool
+
+
+def slow_pdf_parse(*args):
+    """Stand-in for a PDF parse that runs far past the timeout (module-level so a pool worker can run it)."""
+    time.sleep(30)
+
+
+def make_text_pdf(text):
+    """A one-page PDF showing the text in Helvetica."""
+    stream = f"BT /F1 12 Tf 72 720 Td ({text}) Tj ET".encode('latin-1')
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        b"<< /Type /Pages /Kids [3 0 R] /Count 1 >>",
+        b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] /Contents 4 0 R "
+        b"/Resources << /Font << /F1 5 0 R >> >> >>",
+        b"<< /Length %d >>\nstream\n" % len(stream) + stream + b"\nendstream",
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+    ]
+    pdf = b"%PDF-1.4\n"
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(pdf))
+        pdf += b"%d 0 obj\n" % number + body + b"\nendobj\n"
+    xref_offset = len(pdf)
+    pdf += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    pdf += b"".join(b"%010d 00000 n \n" % offset for offset in offsets)
+    pdf += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref_offset)
+    return pdf
+
+
 class TestPDFSimple:
     """Simplified test cases for PDF processing functionality."""
     
     @pytest.fixture
-    def gmail_server(self, sample_config):
+    def in_process_pool(self, monkeypatch):
+        """Run PDF pool jobs on a thread in the test process, so the patched readers apply."""
+        with ThreadPoolExecutor(max_workers=1) as pool:
+            monkeypatch.setattr('gmail_server._get_pdf_pool', lambda max_workers=None: pool)
+            yield pool
+    
+    @pytest.fixture
+    def gmail_server(self, sample_config, monkeypatch, in_process_pool):
         """Create a GmailServer instance for testing."""
+        # These tests exercise the pypdf reader, used when pypdfium2 is not installed
+        monkeypatch.setattr('gmail_server.pdfium', None)
         with patch('gmail_server.build'), \
              patch('gmail_server.Credentials'), \
              patch('gmail_server.InstalledAppFlow'), \
@@ -44,10 +89,7 @@ class TestPDFSimple:
             mock_pdf_instance.pages = [mock_page]
             mock_reader.return_value = mock_pdf_instance
             
-            with patch('gmail_server.signal.signal'), \
-                 patch('gmail_server.signal.alarm'):
-                
-                result = gmail_server._extract_pdf_text(pdf_bytes, filename)
+            result = gmail_server._extract_pdf_text(pdf_bytes, filename)
         
         assert result == "Invoice text from PDF"
         mock_reader.assert_called_once()
@@ -66,10 +108,7 @@ class TestPDFSimple:
             mock_pdf_instance.pages = [mock_page]
             mock_reader.return_value = mock_pdf_instance
             
-            with patch('gmail_server.signal.signal'), \
-                 patch('gmail_server.signal.alarm'):
-                
-                result = gmail_server._extract_pdf_text(pdf_bytes, filename)
+            result = gmail_server._extract_pdf_text(pdf_bytes, filename)
         
         # The key test is that pypdf was used instead of PyPDF2
         assert result == "PDF content"
@@ -85,10 +124,7 @@ class TestPDFSimple:
             mock_pdf_instance.is_encrypted = True
             mock_reader.return_value = mock_pdf_instance
             
-            with patch('gmail_server.signal.signal'), \
-                 patch('gmail_server.signal.alarm'):
-                
-                result = gmail_server._extract_pdf_text(pdf_bytes, filename)
+            result = gmail_server._extract_pdf_text(pdf_bytes, filename)
         
         # Should return None for encrypted PDFs (with default skip setting)
         assert result is None
@@ -102,10 +138,7 @@ class TestPDFSimple:
             # Simulate pypdf error
             mock_reader.side_effect = Exception("Invalid PDF")
             
-            with patch('gmail_server.signal.signal'), \
-                 patch('gmail_server.signal.alarm'):
-                
-                result = gmail_server._extract_pdf_text(pdf_bytes, filename)
+            result = gmail_server._extract_pdf_text(pdf_bytes, filename)
         
         # Should return None on error
         assert result is None
@@ -133,4 +166,162 @@ class TestPDFSimple:
         assert 'pdf_processing' in config['processing']
         assert 'enabled' in config['processing']['pdf_processing']
         assert 'timeout_seconds' in config['processing']['pdf_processing']
-        assert 'skip_password_protected' in config['processing']['pdf_processing']
\ No newline at end of file
+        assert 'skip_password_protected' in config['processing']['pdf_processing']
+    
+    def test_extract_pdf_text_with_pdfium(self, gmail_server, monkeypatch):
+        """Test that PDFium is preferred when pypdfium2 is installed."""
+        text_page = Mock()
+        text_page.get_text_range.return_value = "Invoice total\r\n100 SEK"
+        page = Mock()
+        page.get_textpage.return_value = text_page
+        pdf = Mock()
+        pdf.__len__ = Mock(return_value=1)
+        pdf.__getitem__ = Mock(return_value=page)
+        fake_pdfium = Mock()
+        fake_pdfium.PdfDocument.return_value = pdf
+        fake_pdfium.raw.FPDF_GetSecurityHandlerRevision.return_value = -1
+        monkeypatch.setattr('gmail_server.pdfium', fake_pdfium)
+        
+        with patch('gmail_server.pypdf.PdfReader') as mock_reader:
+            result = gmail_server._extract_pdf_text(b"mock_pdf_content", "invoice.pdf")
+        
+        assert result == "Invoice total\n100 SEK"
+        mock_reader.assert_not_called()
+        pdf.close.assert_called_once()
+    
+    def test_extract_pdf_text_reads_real_pdf_with_pdfium(self, gmail_server, monkeypatch):
+        """Test that the installed pypdfium2 reads the text of an actual PDF."""
+        pypdfium2 = pytest.importorskip('pypdfium2')
+        monkeypatch.setattr('gmail_server.pdfium', pypdfium2)
+        
+        with patch('gmail_server.pypdf.PdfReader') as mock_reader:
+            result = gmail_server._extract_pdf_text(make_text_pdf("Att betala 512 kr"), "invoice.pdf")
+        
+        assert result.strip() == "Att betala 512 kr"
+        mock_reader.assert_not_called()
+    
+    def test_extract_pdf_text_reads_real_pdf_with_pypdf(self, gmail_server):
+        """Test that pypdf reads the text of an actual PDF when pypdfium2 is not used."""
+        result = gmail_server._extract_pdf_text(make_text_pdf("Att betala 512 kr"), "invoice.pdf")
+        
+        assert result.strip() == "Att betala 512 kr"
+    
+    def test_extract_pdf_text_parallel_pages(self, gmail_server, in_process_pool):
+        """Test that long PDFs have their pages extracted through the process pool."""
+        with patch('gmail_server.pypdf.PdfReader') as mock_reader, \
+             patch.object(in_process_pool, 'map', return_value=iter(["Page one", "  ", "Page three"])) as pool_map:
+            mock_reader.return_value.is_encrypted = False
+            mock_reader.return_value.pages = [Mock(), Mock(), Mock()]
+            result = gmail_server._extract_pdf_text(b"mock_pdf_content", "long_invoice.pdf")
+        
+        assert result == "Page one\nPage three"
+        pool_map.assert_called_once()
+        assert 0 < pool_map.call_args.kwargs['timeout'] <= 30
+    
+    def test_extract_pdf_text_timeout_kills_worker(self, gmail_server, monkeypatch):
+        """Test that a parse past the timeout has its pool worker killed, also when called off the main thread."""
+        gmail_server_module._discard_pdf_pool()
+        monkeypatch.setattr('gmail_server._get_pdf_pool', start_pdf_pool)
+        monkeypatch.setattr('gmail_server._read_pdf_pages_or_count', slow_pdf_parse)
+        gmail_server.config['processing']['pdf_processing']['timeout_seconds'] = 0.5
+        pool = start_pdf_pool(1)
+        # Start the worker up front so it can be checked after the pool is discarded
+        pool.submit(int).result()
+        workers = list(pool._processes.values())
+        manager_thread = pool._executor_manager_thread
+        threads_before = set(threading.enumerate())
+        results = []
+        
+        try:
+            started = time.monotonic()
+            worker = threading.Thread(
+                target=lambda: results.append(gmail_server._extract_pdf_text(b"slow_pdf", "slow.pdf")))
+            worker.start()
+            worker.join(10)
+            elapsed = time.monotonic() - started
+            
+            for process in workers:
+                process.join(5)
+            manager_thread.join(5)
+        finally:
+            gmail_server_module._discard_pdf_pool()
+        
+        assert results == [None]
+        assert elapsed < 5
+        assert workers and not any(process.is_alive() for process in workers)
+        assert not manager_thread.is_alive()
+        assert not [thread for thread in threading.enumerate() if thread not in threads_before and thread.is_alive()]
+    
+    def test_pdf_pool_exposes_its_worker_processes(self):
+        """Test the CPython internal _discard_pdf_pool relies on: a started pool's _processes maps pids to workers."""
+        import multiprocessing
+        
+        pool = start_pdf_pool(1)
+        try:
+            pool.submit(int).result()
+            assert isinstance(pool._processes, dict) and pool._processes
+            assert all(isinstance(process, multiprocessing.process.BaseProcess)
+                       for process in pool._processes.values())
+        finally:
+            gmail_server_module._discard_pdf_pool()
+    
+    def test_discard_pdf_pool_warns_when_workers_are_unreachable(self, monkeypatch, caplog):
+        """Test that a pool without the _processes internal is still shut down, with a warning instead of silence."""
+        pool = Mock(spec=['shutdown'])
+        monkeypatch.setattr('gmail_server._pdf_pool', pool)
+        
+        gmail_server_module._discard_pdf_pool()
+        
+        assert 'Cannot terminate PDF worker processes' in caplog.text
+        pool.shutdown.assert_called_once_with(wait=False, cancel_futures=True)
+        assert gmail_server_module._pdf_pool is None
+    
+    def test_extract_pdf_texts_timeout_kills_worker(self, gmail_server, monkeypatch):
+        """Test that a batch parse past the timeout has its pool workers killed instead of holding them."""
+        gmail_server_module._discard_pdf_pool()
+        monkeypatch.setattr('gmail_server._get_pdf_pool', start_pdf_pool)
+        monkeypatch.setattr('gmail_server._extract_pdf_document_text', slow_pdf_parse)
+        gmail_server.config['processing']['pdf_processing']['timeout_seconds'] = 0.5
+        messages = {
+            message_id: {"payload": {"parts": [{"filename": f"{message_id}.pdf", "body": {"attachmentId": "att"}}]}}
+            for message_id in ("a", "b")
+        }
+        pool = start_pdf_pool(2)
+        pool.submit(int).result()
+        # Kept before the pool is discarded; workers started by the batch are added to it
+        processes = pool._processes
+        
+        try:
+            started = time.monotonic()
+            pdf_texts = gmail_server._extract_pdf_texts(messages, {"a": b"slow_pdf", "b": b"slow_pdf"})
+            elapsed = time.monotonic() - started
+            workers = list(processes.values())
+            for process in workers:
+                process.join(5)
+        finally:
+            gmail_server_module._discard_pdf_pool()
+        
+        # The timed-out PDF is given up on; the other is left to the per-email path
+        assert pdf_texts == {"a": ""}
+        assert elapsed < 5
+        assert gmail_server_module._pdf_pool is None
+        assert workers and not any(process.is_alive() for process in workers)
+    
+    def test_extract_pdf_texts_without_pool_leaves_pdfs_to_each_email(self, gmail_server, monkeypatch):
+        """Test that a worker pool that cannot start leaves every PDF to the per-email path."""
+        monkeypatch.setattr('gmail_server._get_pdf_pool', Mock(side_effect=OSError("no semaphores")))
+        messages = {"a": {"payload": {"parts": [{"filename": "a.pdf", "body": {"attachmentId": "att"}}]}}}
+        
+        assert gmail_server._extract_pdf_texts(messages, {"a": b"pdf"}) == {}
+    
+    def test_extract_pdf_text_without_pool_times_out_with_alarm(self, gmail_server, monkeypatch):
+        """Test that without a worker pool the main-thread parse is interrupted by SIGALRM."""
+        monkeypatch.setattr('gmail_server._get_pdf_pool', Mock(side_effect=OSError("no semaphores")))
+        gmail_server.config['processing']['pdf_processing']['timeout_seconds'] = 0.2
+        
+        started = time.monotonic()
+        with patch('gmail_server._read_pdf_pages', side_effect=slow_pdf_parse):
+            result = gmail_server._extract_pdf_text(b"slow_pdf", "slow.pdf")
+        
+        assert result is None
+        assert time.monotonic() - started < 5
@@ -0,0 +1,52 @@
+"""Tests for the Claude token-bucket rate limiter."""
+
+import pytest
+import sys
+import os
+from unittest.mock import Mock
+
+# Add the parent directory to the path so we can import extractors
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from extractors.rate_limiter import TokenBucketRateLimiter, get_rate_limiter, get_retry_after_seconds
+
+
+class TestTokenBucketRateLimiter:
+    """Test cases for TokenBucketRateLimiter."""
+
+    def test_no_wait_within_budget(self):
+        """Test that requests within the per-minute budget are sent immediately."""
+        limiter = TokenBucketRateLimiter(requests_per_minute=60, input_tokens_per_minute=10000)
+
+        assert limiter._reserve(100) == 0.0
+        assert limiter._reserve(100) == 0.0
+
+    def test_wait_when_request_budget_exhausted(self):
+        """Test that exceeding requests per minute yields a wait of one request interval."""
+        limiter = TokenBucketRateLimiter(requests_per_minute=60, input_tokens_per_minute=10000)
+        limiter._available_requests = 0
+
+        assert limiter._reserve(1) == pytest.approx(1.0, abs=0.05)
+
+    def test_wait_when_token_budget_exhausted(self):
+        """Test that exceeding input tokens per minute yields a proportional wait."""
+        limiter = TokenBucketRateLimiter(requests_per_minute=1000, input_tokens_per_minute=6000)
+        limiter._available_tokens = 0
+
+        assert limiter._reserve(600) == pytest.approx(6.0, abs=0.05)
+
+    def test_get_rate_limiter_is_shared(self):
+        """Test that extractors with the same limits share one limiter."""
+        rate_limits = {'requests_per_minute': 50, 'input_tokens_per_minute': 40000}
+
+        assert get_rate_limiter(rate_limits) is get_rate_limiter(dict(rate_limits))
+        assert get_rate_limiter(None) is None
+
+    def test_get_retry_after_seconds(self):
+        """Test that retry-after header is honoured with a fallback default."""
+        error = Mock()
+        error.response.headers = {'retry-after': '7'}
+        assert get_retry_after_seconds(error) == 7.0
+
+        error.response.headers = {}
+        assert get_retry_after_seconds(error) == 1.0
@@ -0,0 +1,39 @@
+"""Tests for the Zero Inbox email fetcher."""
+
+import sys
+import os
+from datetime import datetime
+
+# Add the parent directory to the path so we can import the fetcher
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from models.zero_inbox_models import DatabaseManager
+from zero_inbox_fetcher import ZeroInboxEmailFetcher
+
+
+def email_row(email_id, sender='s'):
+    """Cleaned email row as produced by _clean_and_process_email."""
+    return {'email_id': email_id, 'sender': sender, 'subject': 'Subject', 'body': 'Body',
+            'date_received': datetime(2025, 7, 1)}
+
+
+class TestZeroInboxEmailFetcher:
+    """Test cases for ZeroInboxEmailFetcher."""
+
+    def test_fetch_and_store_emails_skips_only_the_bad_email(self, tmp_path, monkeypatch, caplog):
+        """Test that one email the database rejects does not drop the rest of the batch."""
+        db_manager = DatabaseManager(f"sqlite:///{tmp_path / 'zero_inbox.db'}")
+        assert db_manager.initialize_database()
+        db_manager.bulk_insert_emails([email_row('a')])
+
+        # Skip the Gmail connection; the fetched messages are already cleaned rows
+        fetcher = ZeroInboxEmailFetcher.__new__(ZeroInboxEmailFetcher)
+        fetcher.config = {}
+        fetcher.db_manager = db_manager
+        rows = [email_row('a'), email_row('b'), email_row('bad', sender=None), email_row('c')]
+        monkeypatch.setattr(fetcher, '_fetch_raw_emails', lambda days_back, max_emails: rows)
+        monkeypatch.setattr(fetcher, '_clean_and_process_email', lambda email_data: email_data)
+
+        assert fetcher.fetch_and_store_emails(days_back=7) == (4, 2)
+        assert db_manager.verify_schema()[1][0] == 'emails: 3 records'
+        assert 'Failed to store email bad' in caplog.text
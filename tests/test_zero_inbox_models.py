@@ -0,0 +1,178 @@
+"""Tests for the Zero Inbox database manager."""
+
+import json
+import logging
+import sys
+import os
+from datetime import datetime
+
+import pytest
+from sqlalchemy import inspect
+from sqlalchemy.exc import InvalidRequestError
+from sqlalchemy.orm import selectinload, undefer_group
+from sqlalchemy.pool import StaticPool
+
+# Add the parent directory to the path so we can import models
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from models import zero_inbox_models
+from models.zero_inbox_models import DatabaseManager, Email, EmailCategory
+
+
+def email_row(email_id, **columns):
+    """Email row for bulk_insert_emails, with placeholder values for the required columns."""
+    row = {'email_id': email_id, 'sender': 'a@example.com', 'subject': 'Subject', 'body': 'Body',
+           'date_received': datetime(2025, 7, 1)}
+    row.update(columns)
+    return row
+
+
+class TestDatabaseManager:
+    """Test cases for DatabaseManager."""
+
+    @pytest.fixture
+    def db_manager(self, tmp_path):
+        """Initialized database manager on a fresh SQLite file."""
+        db_manager = DatabaseManager(f"sqlite:///{tmp_path / 'zero_inbox.db'}")
+        assert db_manager.initialize_database()
+        return db_manager
+
+    def test_populate_initial_category_rules_inserts_templates_once(self, db_manager):
+        """Test that category templates are bulk inserted, with column defaults, and not duplicated."""
+        category_rules = {
+            'Task/Pay': {'action': 'Pay invoice', 'supporting_info': 'Invoices'},
+            'Reading/News': {'action': 'Summarize'},
+            'not-a-rule': {},
+        }
+
+        assert db_manager.populate_initial_category_rules(category_rules)
+        assert db_manager.populate_initial_category_rules(category_rules)
+
+        session = db_manager.get_session()
+        templates = session.query(EmailCategory).order_by(EmailCategory.category).all()
+        session.close()
+        assert [(t.category, t.subcategory, t.agent_action) for t in templates] == [
+            ('Reading', 'News', 'Summarize'),
+            ('Task', 'Pay', 'Pay invoice'),
+        ]
+        assert all(t.classified_at is not None for t in templates)
+        assert json.loads(templates[1].supporting_information) == category_rules['Task/Pay']
+
+    def test_sqlite_connections_use_wal(self, db_manager):
+        """Test that SQLite connections are switched to WAL with relaxed syncing."""
+        with db_manager.engine.connect() as connection:
+            assert connection.exec_driver_sql("PRAGMA journal_mode").scalar() == 'wal'
+            assert connection.exec_driver_sql("PRAGMA synchronous").scalar() == 1
+
+    def test_bulk_load_rebuilds_secondary_indexes(self, db_manager):
+        """Test that secondary indexes are absent during a bulk load and present again afterwards."""
+
+        def email_index_names():
+            return {index['name'] for index in inspect(db_manager.engine).get_indexes('emails')}
+
+        with db_manager.bulk_load():
+            assert 'idx_email_date_received' not in email_index_names()
+
+        assert {'idx_email_date_received', 'idx_email_date_processed'} <= email_index_names()
+
+    def test_bulk_load_refreshes_planner_statistics(self, db_manager):
+        """Test that a bulk load ends with ANALYZE, recording statistics for the loaded table's indexes."""
+        with db_manager.bulk_load():
+            db_manager.bulk_insert_emails([email_row(str(i)) for i in range(5)])
+
+        with db_manager.engine.connect() as connection:
+            indexed = {row[0] for row in connection.exec_driver_sql(
+                "SELECT idx FROM sqlite_stat1 WHERE tbl = 'emails'")}
+        assert 'idx_email_date_received' in indexed
+
+    def test_email_children_load_only_when_requested(self, db_manager):
+        """Test that email relationships refuse lazy loading and load in bulk with selectinload."""
+        db_manager.bulk_insert_emails([email_row(f'gmail-{i}') for i in range(2)])
+        session = db_manager.get_session()
+        first_id = session.query(Email).filter(Email.email_id == 'gmail-0').one().id
+        session.close()
+        db_manager.bulk_insert_categories([
+            {'email_id': first_id, 'category': 'Task', 'subcategory': 'Pay',
+             'agent_action': 'Pay invoice', 'classified_by': 'test'},
+        ])
+
+        session = db_manager.get_session()
+        email = session.query(Email).filter(Email.email_id == 'gmail-0').one()
+        with pytest.raises(InvalidRequestError):
+            email.categories
+        emails = session.query(Email).options(selectinload(Email.categories)).order_by(Email.email_id).all()
+        assert [len(email.categories) for email in emails] == [1, 0]
+        session.close()
+
+    def test_verify_schema_counts_every_table(self, db_manager):
+        """Test that schema verification reports the row count of each table."""
+        db_manager.populate_initial_category_rules({'Task/Pay': {'action': 'Pay invoice'}})
+
+        ok, tables_info = db_manager.verify_schema()
+
+        assert ok
+        assert tables_info == [
+            'emails: 0 records',
+            'email_categories: 1 records',
+            'agent_actions: 0 records',
+            'human_reviews: 0 records',
+        ]
+
+    def test_bulk_insert_emails_skips_stored_messages(self, db_manager):
+        """Test that emails already stored, or repeated in the batch, are left out and not counted."""
+        assert db_manager.bulk_insert_emails([email_row('a'), email_row('b'), email_row('a')]) == 2
+        assert db_manager.bulk_insert_emails([email_row('b'), email_row('c')]) == 1
+        assert db_manager.verify_schema()[1][0] == 'emails: 3 records'
+
+    def test_email_html_content_is_not_loaded(self, db_manager):
+        """Test that queried emails leave the unused HTML column out and refuse to lazy-load it."""
+        db_manager.bulk_insert_emails([email_row('a', html_content='<p>Body</p>')])
+
+        session = db_manager.get_session()
+        email = session.query(Email).one()
+        assert email.body == 'Body'
+        with pytest.raises(InvalidRequestError):
+            email.html_content
+        session.close()
+
+    def test_in_memory_database_shares_one_connection(self):
+        """Test that an in-memory database keeps its tables across sessions and connections."""
+        db_manager = DatabaseManager("sqlite:///:memory:")
+        assert db_manager.initialize_database()
+        assert isinstance(db_manager.engine.pool, StaticPool)
+
+        assert db_manager.populate_initial_category_rules({'Task/Pay': {'action': 'Pay invoice'}})
+        assert db_manager.verify_schema()[1][1] == 'email_categories: 1 records'
+
+    def test_slow_queries_are_logged(self, db_manager, monkeypatch, caplog):
+        """Test that statements over the slow-query threshold are logged with their SQL."""
+        assert db_manager.engine.pool.size() == zero_inbox_models.POOL_SIZE
+
+        monkeypatch.setattr(zero_inbox_models, 'SLOW_QUERY_SECONDS', -1)
+        with caplog.at_level(logging.WARNING, logger='models.zero_inbox_models'):
+            db_manager.verify_schema()
+
+        assert any('Slow query' in message and 'count' in message for message in caplog.messages)
+
+    def test_email_content_is_loaded_on_demand(self, db_manager):
+        """Test that email text is left out of plain queries and loaded in the same query when undeferred."""
+        db_manager.bulk_insert_emails([email_row('a', pdf_content='PDF')])
+
+        session = db_manager.get_session()
+        email = session.query(Email).one()
+        assert 'body' not in email.__dict__ and 'pdf_content' not in email.__dict__
+        session.close()
+
+        session = db_manager.get_session()
+        email = session.query(Email).options(undefer_group('content')).one()
+        session.expunge(email)
+        session.close()
+        assert (email.body, email.pdf_content) == ('Body', 'PDF')
+
+    def test_initialize_database_creates_missing_directories(self, tmp_path):
+        """Test that the SQLite file's parent directories are created, nested or absolute."""
+        db_path = tmp_path / 'nested' / 'data' / 'zero_inbox.db'
+        db_manager = DatabaseManager(f"sqlite:///{db_path}")
+
+        assert db_manager.initialize_database()
+        assert db_path.exists()
@@ -6,13 +6,15 @@ Integrates with database storage and enhanced cleaning pipeline
 
 import logging
 import re
+from contextlib import nullcontext
 from datetime import datetime
 from typing import List, Dict, Tuple
 from html import unescape
 import html2text
+from sqlalchemy.orm import undefer_group
 
 from gmail_server import GmailServer
-from models.zero_inbox_models import DatabaseManager, Email
+from models.zero_inbox_models import DatabaseManager, Email, INSERT_PAGE_SIZE
 
 logger = logging.getLogger(__name__)
 
@@ -76,16 +78,11 @@ class ZeroInboxEmailFetcher:
         
         logger.info(f"📧 Fetched {len(raw_emails)} emails from Gmail")
         
-        # Process and store emails
-        stored_count = 0
+        # Clean and process emails
+        cleaned_emails = []
         for i, email_data in enumerate(raw_emails):
             try:
-                # Clean and process email
-                cleaned_email = self._clean_and_process_email(email_data)
-                
-                # Store in database (with duplicate prevention)
-                if self._store_email_in_database(cleaned_email):
-                    stored_count += 1
+                cleaned_emails.append(self._clean_and_process_email(email_data))
                 
                 # Log progress
                 if (i + 1) % 10 == 0:
@@ -95,9 +92,49 @@ class ZeroInboxEmailFetcher:
                 logger.error(f"❌ Error processing email {email_data.get('id', 'unknown')}: {e}")
                 continue
         
+        # Store in database in one batch; emails already stored are skipped by the database.
+        # First population of an empty database loads without secondary indexes, built once at the end
+        loading = self.db_manager.bulk_load() if self.get_stored_email_count() == 0 else nullcontext()
+        try:
+            with loading:
+                stored_count, failed_count = self._store_emails(cleaned_emails)
+        except Exception as e:
+            logger.error(f"❌ Failed to store emails: {e}")
+            stored_count = 0
+        else:
+            logger.debug(f"⏭️  Skipped {len(cleaned_emails) - stored_count - failed_count} duplicate emails")
+        
         logger.info(f"✅ Email fetch complete: {len(raw_emails)} fetched, {stored_count} stored")
         return len(raw_emails), stored_count
     
+    def _store_emails(self, emails: List[Dict]) -> Tuple[int, int]:
+        """
+        Insert emails in one batch; if the batch fails, retry page by page and then email by email
+        so one bad message only loses itself. Returns (stored, failed) counts.
+        """
+        try:
+            return self.db_manager.bulk_insert_emails(emails), 0
+        except Exception as e:
+            logger.warning(f"⚠️ Batch insert of {len(emails)} emails failed, retrying in smaller batches: {e}")
+        
+        stored_count = failed_count = 0
+        for start in range(0, len(emails), INSERT_PAGE_SIZE):
+            page = emails[start:start + INSERT_PAGE_SIZE]
+            if len(page) < len(emails):
+                try:
+                    stored_count += self.db_manager.bulk_insert_emails(page)
+                    continue
+                except Exception:
+                    pass
+            
+            for email in page:
+                try:
+                    stored_count += self.db_manager.bulk_insert_emails([email])
+                except Exception as e:
+                    logger.error(f"❌ Failed to store email {email.get('email_id', 'unknown')}: {e}")
+                    failed_count += 1
+        return stored_count, failed_count
+    
     def _fetch_raw_emails(self, days_back: int, max_emails: int) -> List[Dict]:
         """
         Fetch raw emails using existing Gmail server functionality
@@ -269,40 +306,6 @@ class ZeroInboxEmailFetcher:
             logger.warning(f"⚠️ Could not parse date: {date_string}")
             return datetime.now()
     
-    def _store_email_in_database(self, cleaned_email: Dict) -> bool:
-        """
-        Store cleaned email in database with duplicate prevention
-        Returns True if email was stored, False if duplicate
-        """
-        try:
-            session = self.db_manager.get_session()
-            
-            # Check for duplicates using email_id
-            existing_email = session.query(Email).filter(
-                Email.email_id == cleaned_email['email_id']
-            ).first()
-            
-            if existing_email:
-                logger.debug(f"⏭️  Skipping duplicate email: {cleaned_email['email_id']}")
-                session.close()
-                return False
-            
-            # Create new email record
-            email_record = Email(**cleaned_email)
-            session.add(email_record)
-            session.commit()
-            
-            logger.debug(f"💾 Stored email: {email_record.subject[:50]}...")
-            session.close()
-            return True
-            
-        except Exception as e:
-            logger.error(f"❌ Failed to store email {cleaned_email.get('email_id', 'unknown')}: {e}")
-            if session:
-                session.rollback()
-                session.close()
-            return False
-    
     def get_stored_email_count(self) -> int:
         """Get count of stored emails in database"""
         try:
@@ -321,7 +324,7 @@ class ZeroInboxEmailFetcher:
             emails = session.query(Email).filter(
                 Email.date_received >= from_date,
                 Email.date_received <= to_date
-            ).order_by(Email.date_received.desc()).all()
+            ).options(undefer_group('content')).order_by(Email.date_received.desc()).all()
             
             # Detach from session
             result = []
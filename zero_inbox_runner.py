@@ -4,18 +4,19 @@ Clean Python implementation converting the notebook functionality into a class-b
 Provides minimal code execution with flexible method ordering.
 """
 
-import yaml
 import logging
 import json
 import os
 from datetime import datetime
 from typing import Dict, List, Optional, Any
 
+from sqlalchemy.orm import load_only, selectinload, undefer_group
 from models.zero_inbox_models import DatabaseManager, Email, EmailCategory
 from zero_inbox_fetcher import ZeroInboxEmailFetcher
 from email_categorization_agent import EmailCategorizationAgent
 from email_action_agents import EmailActionOrchestrator
 from llm_client_factory import validate_all_providers
+from config_loader import load_yaml_config
 
 logger = logging.getLogger(__name__)
 
@@ -166,38 +167,29 @@ class SimpleActionExecutor:
             },
         }
 
-    def store_action_result(self, action_result: Dict[str, Any]) -> bool:
-        """Store action result in database"""
+    def store_action_results(self, action_results: List[Dict[str, Any]]) -> int:
+        """Store a batch of action results in one multi-row insert; returns how many were stored"""
         try:
-            from models.zero_inbox_models import AgentAction
-
-            session = self.db_manager.get_session()
-
-            action_record = AgentAction(
-                email_id=action_result["email_id"],
-                category=action_result["action_type"].split("/")[0],
-                subcategory=action_result["action_type"].split("/")[1],
-                action_performed=f"Simple action executed for {action_result['action_type']}",
-                action_result=str(action_result["action_result"]),
-                agent_name="SimpleActionExecutor",
-                success=True,
-            )
-
-            session.add(action_record)
-            session.commit()
-            session.close()
+            action_rows = [
+                {
+                    "email_id": action_result["email_id"],
+                    "category": action_result["action_type"].split("/")[0],
+                    "subcategory": action_result["action_type"].split("/")[1],
+                    "action_performed": f"Simple action executed for {action_result['action_type']}",
+                    "action_result": str(action_result["action_result"]),
+                    "agent_name": "SimpleActionExecutor",
+                    "success": True,
+                }
+                for action_result in action_results
+            ]
+            stored_count = self.db_manager.bulk_insert_actions(action_rows)
 
-            logger.debug(
-                f"✅ Stored action result for email {action_result['email_id']}"
-            )
-            return True
+            logger.debug(f"✅ Stored {stored_count} action results")
+            return stored_count
 
         except Exception as e:
-            logger.error(f"Failed to store action result: {e}")
-            if "session" in locals():
-                session.rollback()
-                session.close()
-            return False
+            logger.error(f"Failed to store action results: {e}")
+            return 0
 
 
 class ZeroInboxAgent:
@@ -227,8 +219,7 @@ class ZeroInboxAgent:
     def setup(self) -> Dict[str, Any]:
         """Initialize database, Gmail connection, and categorization agent."""
         # Load configuration
-        with open(self.config_path, "r") as f:
-            self.config = yaml.safe_load(f)
+        self.config = load_yaml_config(self.config_path)
 
         # Initialize database
         self.db_manager = DatabaseManager(self.db_path)
@@ -341,6 +332,7 @@ class ZeroInboxAgent:
                 f"Processing action batch {i//batch_size + 1}/{(len(categorized_emails) + batch_size - 1)//batch_size}"
             )
 
+            batch_results = []
             for email_data in batch:
                 try:
                     email, category, subcategory = email_data
@@ -351,11 +343,7 @@ class ZeroInboxAgent:
                     )
 
                     if action_result:
-                        action_results.append(action_result)
-
-                        # Store result in database
-                        if self.action_orchestrator.store_action_result(action_result):
-                            stored_count += 1
+                        batch_results.append(action_result)
                     else:
                         logger.warning(f"No action executed for email {email.id}")
 
@@ -365,6 +353,10 @@ class ZeroInboxAgent:
                     )
                     continue
 
+            # Store the batch's results in database with one insert
+            action_results.extend(batch_results)
+            stored_count += self.action_orchestrator.store_action_results(batch_results)
+
         return {
             "processed": len(action_results),
             "stored": stored_count,
@@ -392,6 +384,7 @@ class ZeroInboxAgent:
                 categorized_emails = (
                     session.query(Email, EmailCategory)
                     .join(EmailCategory)
+                    .options(undefer_group("content"))
                     .filter(
                         EmailCategory.category == category,
                         EmailCategory.subcategory == subcategory,
@@ -466,7 +459,16 @@ class ZeroInboxAgent:
         if stats.get("categorized_emails", 0) > 0:
             # Get categorized emails from database
             session = self.db_manager.get_session()
-            categorized_emails = session.query(Email).join(EmailCategory).all()
+            categorized_emails = (
+                session.query(Email)
+                .join(EmailCategory)
+                # Only the listed columns; email bodies are not needed for the review file
+                .options(
+                    load_only(Email.id, Email.sender, Email.subject, Email.date_received),
+                    selectinload(Email.categories),
+                )
+                .all()
+            )
 
             for email in categorized_emails:
                 for category in email.categories:
@@ -528,6 +530,13 @@ class ZeroInboxAgent:
             except Exception as e:
                 results[method_name] = {"error": str(e)}
 
+        # Keep the planner statistics current with what this run wrote
+        if self.db_manager and self.db_manager.engine:
+            try:
+                self.db_manager.analyze()
+            except Exception as e:
+                logger.warning(f"Failed to analyze database: {e}")
+
         return results
 
 